@@ -0,0 +1,213 @@
+"""
+Semantic answer cache for query_chain.
+
+Users ask heavily overlapping questions about the same video. Answers are
+cached per (collection, normalized query); near-duplicate questions are
+matched by their content words, or by query-embedding cosine similarity
+above a threshold when an embedding function is given. Entries are evicted
+LRU and by TTL, and are ignored once the collection has changed.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_NORMALIZE_RE = re.compile(r"[^a-z0-9\s]")
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_NORMALIZE_RE.sub(" ", query.lower()).split())
+
+
+def content_words(query):
+    """The query's words without stopwords and punctuation, in order."""
+    from lexical import tokenize
+    return tuple(tokenize(query))
+
+
+def _terms(entry):
+    # entries saved before "terms" existed
+    if "terms" not in entry:
+        entry["terms"] = list(content_words(entry["query"]))
+    return tuple(entry["terms"])
+
+
+class SemanticCache:
+    """
+    LRU/TTL cache of {context, answer} keyed by (collection, normalized query).
+
+    Args:
+        embedding_function: Chroma-style callable(list[str]) -> vectors used for
+            near-duplicate matching; pass the collection's embedder for true
+            paraphrase matching. Without one, questions match when they have
+            the same content words in the same order, which costs nothing and
+            matches rephrasings like "so who won the match?". (A bag-of-words
+            cosine would also match long questions that differ in one word,
+            "... in the first game?" and "... in the second game?".)
+        threshold (float): Minimum cosine similarity for a semantic hit.
+        max_entries (int): LRU capacity.
+        ttl (float): Seconds an entry stays valid; None for no expiry.
+        path (str): Optional JSON file to persist entries across restarts.
+        max_semantic_words (int): Questions with more content words than this
+            only match by content words: one changed word barely moves the
+            embedding of a long question.
+        save_interval (float): Seconds a change waits before `path` is
+            rewritten, so a burst of puts costs one write (see flush()).
+
+    Usage:
+        cache = SemanticCache()
+        entry = cache.get("abc_collection", "Who won?", version=store.data_version())
+        if entry is None:
+            ...
+            cache.put("abc_collection", "Who won?", context, answer, version=...)
+    """
+
+    def __init__(self, embedding_function=None, threshold=0.9, max_entries=256, ttl=3600, path=None,
+                 max_semantic_words=4, save_interval=2.0):
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_semantic_words = max_semantic_words
+        self.save_interval = save_interval
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._save_timer = None
+        if path:
+            if os.path.exists(path):
+                self._load()
+            # write what the last puts left pending
+            atexit.register(self.flush)
+
+    def _embed(self, text):
+        import numpy as np
+        vector = np.asarray(self.embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def _valid(self, entry, version, now):
+        return entry["version"] == version and not self._expired(entry, now)
+
+    def get(self, collection, query, version=None):
+        """Return the cached {"query", "context", "answer", ...} entry or None."""
+        import numpy as np
+
+        key = (collection, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._valid(entry, version, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                # stale: collection changed or TTL passed
+                del self._entries[key]
+
+            terms = content_words(query)
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if k[0] == collection and self._valid(e, version, now)]
+            match = next((k for k, e in candidates if _terms(e) == terms), None) if terms else None
+            if match is None and candidates and self.embedding_function is not None \
+                    and len(terms) <= self.max_semantic_words:
+                candidates = [(k, e) for k, e in candidates if "embedding" in e]
+                if candidates:
+                    matrix = np.asarray([e["embedding"] for _, e in candidates], dtype=np.float32)
+                    similarities = matrix @ self._embed(key[1])
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        match = candidates[best][0]
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.hits += 1
+                self.semantic_hits += 1
+                return self._entries[match]
+
+            self.misses += 1
+            return None
+
+    def put(self, collection, query, context, answer, version=None, citations=None):
+        normalized = normalize_query(query)
+        entry = {
+            "query": query,
+            "context": context,
+            "answer": answer,
+            "citations": citations or [],
+            "version": version,
+            "created": time.time(),
+            "terms": list(content_words(query)),
+        }
+        if self.embedding_function is not None:
+            entry["embedding"] = self._embed(normalized).tolist()
+        with self._lock:
+            self._entries[(collection, normalized)] = entry
+            self._entries.move_to_end((collection, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._changed()
+
+    def invalidate(self, collection=None):
+        """Drop every entry, or only those for `collection`."""
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == collection]:
+                    del self._entries[key]
+            self._changed()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _changed(self):
+        # called with the lock held: write `path` once the burst of changes is over
+        if not self.path:
+            return
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_interval, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write the entries to `path` now, if they changed since the last write."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self.path and self._dirty:
+                self._save()
+                self._dirty = False
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[list(k), e] for k, e in self._entries.items()], f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for key, entry in json.load(f):
+                self._entries[tuple(key)] = entry
@@ -0,0 +1,106 @@
+"""
+Load test for chain.aquery_chain against a local mock LLM endpoint.
+
+Runs the real ChatOpenAI client (process-wide, pooled connections) against
+mock_openai.MockOpenAIServer and reports p50/p95 latency and requests/sec
+at each concurrency level. Retrieval uses a local collection built from a
+bundled transcript with the offline hashing embedder.
+
+Usage:
+    python src/bench_async.py
+    python src/bench_async.py --requests 500 --concurrency 1 10 50 --latency 0.05 --json async.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+
+import config
+from chain import aquery_chain
+from cleaner import iter_cues
+from mock_openai import MockOpenAIServer
+from splitter import TokenTextSplitter
+from vectorstore import init_vectorstore
+
+TRANSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+QUERIES = [
+    "Who played the best rally?",
+    "What happened in the first round match?",
+    "Which shot was his favorite?",
+    "How did the match end?",
+    "Who weathered the storm?",
+]
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (p in 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run_level(vector_store, concurrency, total):
+    counter = itertools.count()
+    latencies = []
+
+    async def worker():
+        while (i := next(counter)) < total:
+            query = QUERIES[i % len(QUERIES)]
+            start = time.perf_counter()
+            await aquery_chain(query, vector_store, use_cache=False)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+    }
+
+
+async def run_all(vector_store, levels, total):
+    # warm up: first call builds the client and opens connections
+    await aquery_chain(QUERIES[0], vector_store, use_cache=False)
+    return [await run_level(vector_store, level, total) for level in levels]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the async query path against a mock LLM.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock LLM latency in seconds")
+    parser.add_argument("--transcript", default=os.path.join(TRANSCRIPTS_DIR, "_4Uob271bOM.en.vtt"))
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    _, vector_store = init_vectorstore(collection_name="bench_async", embedding_function="local")
+    splitter = TokenTextSplitter()
+    vector_store.add_documents(list(splitter.split_cues(iter_cues(args.transcript), video_id="bench")))
+
+    with MockOpenAIServer(latency=args.latency) as server:
+        config.LLM_BACKEND = "openai"
+        config.OPENAI_BASE_URL = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        # measure the query path, not the client-side rate limits (see bench_ratelimit.py)
+        config.OPENAI_CHAT_RPM = config.OPENAI_CHAT_TPM = 0
+        results = asyncio.run(run_all(vector_store, args.concurrency, args.requests))
+
+    print(f"{'concurrency':>11} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>9}")
+    for r in results:
+        print(f"{r['concurrency']:>11} {r['requests']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['requests_per_s']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mock_latency_s": args.latency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
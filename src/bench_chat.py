@@ -0,0 +1,117 @@
+"""
+Per-turn cost of a long conversation: ChatSession memory vs. appending history.
+
+Plays the same conversation (questions and follow-ups, cycled) for --turns
+turns over a bundled transcript, twice:
+
+    session   conversation.ChatSession: standalone rewrite of follow-ups,
+              rolling summary + recent turns within CHAT_MEMORY_TOKENS
+    naive     the whole history pasted in front of every question
+
+and reports, per turn, the prompt tokens sent to the chat model and the
+latency. The local stub model (with --token-delay per prompt token, to make
+prompt size show in latency) stands in for OpenAI and the hashing embedder
+for the embedding model, so it runs offline.
+
+Usage:
+    python src/bench_chat.py
+    python src/bench_chat.py --turns 40 --memory-tokens 600 --json chat.json
+"""
+import argparse
+import json
+import os
+import time
+
+import config
+from chain import query_chain
+from cleaner import iter_cues
+from conversation import ChatSession
+from llm import StubChatModel
+from metrics import metrics
+from splitter import TokenTextSplitter, count_tokens
+from vectorstore import init_vectorstore
+
+TRANSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+CONVERSATION = [
+    "Who played the best rally?",
+    "And what happened after that?",
+    "Why did he lose that point?",
+    "What happened in the first round match?",
+    "How did it end?",
+    "Which shot was his favorite?",
+    "Tell me more about it.",
+]
+
+
+class SlowStub(StubChatModel):
+    """StubChatModel that also takes `prompt_delay` seconds per prompt token, like a real model's prefill."""
+
+    def __init__(self, prompt_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.prompt_delay = prompt_delay
+
+    def invoke(self, prompt_text):
+        time.sleep(self.prompt_delay * count_tokens(prompt_text))
+        return super().invoke(prompt_text)
+
+
+def _prompt_tokens():
+    return sum(c["value"] for c in metrics.snapshot()["counters"]
+               if c["name"] == "prompt_tokens" and c["labels"].get("stage") == "llm")
+
+
+def play(ask, turns):
+    """Ask the conversation's questions for `turns` turns; returns [{"turn", "prompt_tokens", "latency_ms"}]."""
+    rows = []
+    for turn in range(turns):
+        metrics.reset()
+        start = time.perf_counter()
+        ask(CONVERSATION[turn % len(CONVERSATION)])
+        rows.append({"turn": turn + 1, "prompt_tokens": _prompt_tokens(),
+                     "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-turn cost of ChatSession and a growing history.")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--memory-tokens", type=int, default=config.CHAT_MEMORY_TOKENS)
+    parser.add_argument("--token-delay", type=float, default=0.00005, help="Stub model seconds per prompt token")
+    parser.add_argument("--transcript", default=os.path.join(TRANSCRIPTS_DIR, "CglNRNrMFGM.en.vtt"))
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    _, vector_store = init_vectorstore(collection_name="bench_chat", embedding_function="local")
+    video_id = os.path.basename(args.transcript).split(".")[0]
+    if not vector_store.collection.count():
+        vector_store.add_documents(list(TokenTextSplitter().split_cues(iter_cues(args.transcript), video_id=video_id)))
+    llm = SlowStub(prompt_delay=args.token_delay)
+
+    session = ChatSession(vector_store, llm=llm, memory_tokens=args.memory_tokens, use_cache=False)
+
+    def ask_session(question):
+        session.ask(question)
+        # count the background summary update in the turn that caused it
+        session.memory()
+
+    history = []
+
+    def ask_naive(question):
+        query = "\n".join(history + [question])
+        answer = query_chain(query, vector_store, use_cache=False, llm=llm)
+        history.extend([f"User: {question}", f"Assistant: {answer}"])
+
+    results = {"session": play(ask_session, args.turns), "naive": play(ask_naive, args.turns)}
+
+    print(f"{'turn':>5} {'session tokens':>15} {'session ms':>11} {'naive tokens':>13} {'naive ms':>9}")
+    for s, n in zip(results["session"], results["naive"]):
+        print(f"{s['turn']:>5} {s['prompt_tokens']:>15} {s['latency_ms']:>11} {n['prompt_tokens']:>13} "
+              f"{n['latency_ms']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"memory_tokens": args.memory_tokens, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark the single corpus collection as the number of videos grows.
+
+Synthetic videos v0000, v0001, ... reuse the chunks of the bundled
+transcripts in turn (each under its own video id, title and language
+metadata), and the corpus is grown step by step (default 10, 100, 1000
+videos). At each size the same random questions are timed as:
+
+    cross     hybrid_query over every video (one cross-video top-k)
+    scoped    hybrid_query with where={"video_id": <one video>}
+    vector    plain vector query over every video
+    legacy    the old layout: one vector query per per-video collection,
+              merged by distance (only up to --legacy-max videos: creating
+              thousands of collections is slow in itself)
+
+Embeddings come from the local hashing embedder and are computed once per
+distinct chunk, so the numbers are about the index, not the embedding model.
+Chroma runs as a PersistentClient in a temporary directory.
+
+Usage:
+    python src/bench_corpus.py
+    python src/bench_corpus.py --sizes 10,100,1000 --backend flat --json corpus.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench_async import percentile
+from cleaner import iter_cues
+from embeddings import HashingEmbeddingFunction
+from splitter import TokenTextSplitter
+from vectorstore import VectorStore, create_vector_store, legacy_collection_name
+
+TRANSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+
+def load_transcripts(embedder):
+    """[(chunks, vectors)] per bundled transcript: chunk texts/metadata and their embeddings."""
+    splitter = TokenTextSplitter()
+    transcripts = []
+    for path in sorted(glob.glob(os.path.join(TRANSCRIPTS_DIR, "*.vtt"))):
+        chunks = list(splitter.split_cues(iter_cues(path)))
+        vectors = np.asarray(embedder([chunk.page_content for chunk in chunks]), dtype=np.float32)
+        transcripts.append((chunks, vectors))
+    return transcripts
+
+
+def video_rows(transcripts, n):
+    """ids, documents, metadatas and embeddings of synthetic video number `n`."""
+    chunks, vectors = transcripts[n % len(transcripts)]
+    video_id = f"v{n:04d}"
+    metadatas = [dict(chunk.metadata, video_id=video_id, title=f"Video {n}", language="en") for chunk in chunks]
+    ids = [VectorStore.chunk_id(video_id, chunk.page_content) for chunk in chunks]
+    return video_id, ids, [chunk.page_content for chunk in chunks], metadatas, vectors
+
+
+def add_video(store, rows):
+    video_id, ids, documents, metadatas, vectors = rows
+    store.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+    for doc_id, text in zip(ids, documents):
+        store.lexical_index.add(doc_id, text)
+
+
+def _time(search, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2)}
+
+
+def legacy_search(collections, embedder, query, k):
+    """Cross-video top-k the old way: query every per-video collection, keep the k closest."""
+    vector = embedder([query])
+    hits = []
+    for collection in collections:
+        found = collection.query(query_embeddings=vector, n_results=k, include=["distances"])
+        hits.extend(zip(found["distances"][0], found["ids"][0]))
+    return [doc_id for _, doc_id in sorted(hits)[:k]]
+
+
+def run(sizes, backend="chroma", queries=50, k=4, legacy_max=100, seed=0):
+    embedder = HashingEmbeddingFunction()
+    transcripts = load_transcripts(embedder)
+    rng = random.Random(seed)
+    texts = [chunk.page_content for chunks, _ in transcripts for chunk in chunks]
+    questions = [" ".join(rng.choice(texts).split()[:12]) for _ in range(queries)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = create_vector_store(tmp, backend)
+        store.create_collection("bench_corpus", embedding_function=embedder)
+        legacy = []
+        videos = 0
+        for size in sizes:
+            start = time.perf_counter()
+            for n in range(videos, size):
+                rows = video_rows(transcripts, n)
+                add_video(store, rows)
+                if n < legacy_max:
+                    old = create_vector_store(tmp, backend)
+                    old.create_collection(legacy_collection_name(rows[0]), embedding_function=embedder)
+                    old.collection.upsert(ids=rows[1], documents=rows[2], metadatas=rows[3], embeddings=rows[4])
+                    legacy.append(old.collection)
+            store.lexical_index.save()
+            build_s = time.perf_counter() - start
+            videos = size
+
+            scopes = [{"video_id": f"v{rng.randrange(size):04d}"} for _ in questions]
+            scoped = iter(scopes)
+            row = {
+                "videos": size,
+                "chunks": store.collection.count(),
+                "build_s": round(build_s, 2),
+                "cross": _time(lambda q: store.hybrid_query(q, n_results=k), questions),
+                "scoped": _time(lambda q: store.hybrid_query(q, n_results=k, where=next(scoped)), questions),
+                "vector": _time(lambda q: store.query([q], n_results=k), questions),
+            }
+            if size <= legacy_max:
+                row["legacy"] = _time(lambda q: legacy_search(legacy, embedder, q, k), questions)
+            results.append(row)
+            print(_format_row(row), flush=True)
+    return results
+
+
+def _format_row(row):
+    columns = [f"{row['videos']:>6} videos {row['chunks']:>7} chunks"]
+    for name in ("cross", "scoped", "vector", "legacy"):
+        if name in row:
+            columns.append(f"{name} p50 {row[name]['p50_ms']:>7} ms p95 {row[name]['p95_ms']:>7} ms")
+    return " | ".join(columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cross-video and per-video retrieval as the corpus grows.")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated corpus sizes in videos")
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--legacy-max", type=int, default=100,
+                        help="Also time the per-video collection loop up to this many videos")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    results = run(sizes, backend=args.backend, queries=args.queries, k=args.k, legacy_max=args.legacy_max)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "queries": args.queries, "k": args.k, "results": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
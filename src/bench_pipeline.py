@@ -0,0 +1,198 @@
+"""
+Reproducible per-stage benchmark of the ingestion and query pipeline.
+
+Runs every stage over the bundled transcripts in src/transcripts with local,
+deterministic components only (hashing embedder, stub chat model), so runs
+are comparable across machines and need no API key:
+
+    clean        cleaner.extract_clean_subtitles            (items: VTT lines)
+    split        splitter.TokenTextSplitter.split_cues      (items: chunks)
+    split_chars  splitter.RecursiveCharacterTextSplitter    (items: chunks)
+    embed        embeddings.HashingEmbeddingFunction        (items: chunks)
+    add          VectorStore.add_documents, fresh collection (items: chunks)
+    retrieve     chain.query_chain with StubChatModel       (items: queries)
+
+For each stage it reports throughput (items/s), p50/p95/p99 latency per
+iteration and peak traced memory, writes the results as JSON, and compares
+them with a saved baseline.
+
+Usage:
+    python src/bench_pipeline.py --output bench.json
+    python src/bench_pipeline.py --save-baseline baseline.json
+    python src/bench_pipeline.py --baseline baseline.json --fail-on-regression
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from bench_async import percentile
+from cleaner import extract_clean_subtitles, iter_cues
+from splitter import RecursiveCharacterTextSplitter, TokenTextSplitter
+
+TRANSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+QUERIES = [
+    "What is the video about?",
+    "How was the wood made stronger?",
+    "Who won the match?",
+    "What happened at the end?",
+]
+
+
+def _measure(fn, repeats, items_per_run):
+    """Time `fn` `repeats` times, then once more under tracemalloc for peak memory."""
+    fn()  # warm-up (imports, tokenizer load, caches)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "iterations": repeats,
+        "items_per_iteration": items_per_run,
+        "throughput_per_s": round(items_per_run * repeats / total, 2) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(transcripts_dir=TRANSCRIPTS_DIR, repeats=10, stages=None):
+    from embeddings import HashingEmbeddingFunction
+    from llm import StubChatModel
+    from vectorstore import VectorStore
+    import chain
+
+    files = sorted(glob.glob(os.path.join(transcripts_dir, "*.vtt")))
+    if not files:
+        raise RuntimeError(f"No .vtt files found in {transcripts_dir}")
+    n_lines = 0
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            n_lines += sum(1 for _ in f)
+
+    splitter = TokenTextSplitter()
+    chunks = [doc for path in files
+              for doc in splitter.split_cues(iter_cues(path), video_id=os.path.basename(path).split(".")[0])]
+    texts = [doc.page_content for doc in chunks]
+    cleaned = [extract_clean_subtitles(path) for path in files]
+    char_splitter = RecursiveCharacterTextSplitter()
+    n_char_chunks = len(char_splitter.create_documents(cleaned))
+    embedder = HashingEmbeddingFunction()
+
+    add_store = VectorStore()
+
+    def add_fresh():
+        name = f"bench-{uuid.uuid4().hex[:12]}"
+        add_store.create_collection(name, embedding_function=embedder)
+        add_store.add_documents(chunks)
+        add_store.delete_collection(name)
+
+    store = VectorStore()
+    store.create_collection("bench-retrieve", embedding_function=embedder)
+    store.add_documents(chunks)
+    stub = StubChatModel()
+
+    def retrieve():
+        for q in QUERIES:
+            chain.query_chain(q, store, llm=stub, use_cache=False)
+
+    plan = {
+        "clean": (lambda: [extract_clean_subtitles(p) for p in files], n_lines),
+        "split": (lambda: [list(splitter.split_cues(iter_cues(p))) for p in files], len(chunks)),
+        "split_chars": (lambda: char_splitter.create_documents(cleaned), n_char_chunks),
+        "embed": (lambda: embedder.embed(texts), len(texts)),
+        "add": (add_fresh, len(chunks)),
+        "retrieve": (retrieve, len(QUERIES)),
+    }
+
+    results = {}
+    for name, (fn, items) in plan.items():
+        if stages and name not in stages:
+            continue
+        # index/query stages touch Chroma and are much slower; keep their runs short
+        results[name] = _measure(fn, repeats if name not in ("add", "retrieve") else max(3, repeats // 2), items)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "transcripts": len(files),
+            "vtt_lines": n_lines,
+            "chunks": len(chunks),
+        },
+        "stages": results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    """
+    Compare stage p50 latency and throughput with a baseline result.
+    Returns a list of (stage, metric, baseline, current, change) for metrics
+    that got worse by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for stage, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        if before["p50_ms"] and now["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append((stage, "p50_ms", before["p50_ms"], now["p50_ms"], now["p50_ms"] / before["p50_ms"] - 1))
+        if before["throughput_per_s"] and now["throughput_per_s"] < before["throughput_per_s"] * (1 - tolerance):
+            regressions.append((stage, "throughput_per_s", before["throughput_per_s"], now["throughput_per_s"],
+                                now["throughput_per_s"] / before["throughput_per_s"] - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage over the bundled transcripts.")
+    parser.add_argument("--transcripts", default=TRANSCRIPTS_DIR)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Compare against this saved result file")
+    parser.add_argument("--save-baseline", help="Also save the results as a baseline at this path")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.transcripts, args.repeats, args.stages)
+
+    print(f"{'stage':<12} {'items/s':>12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KB':>10}")
+    for name, r in results["stages"].items():
+        print(f"{name:<12} {r['throughput_per_s']:>12} {r['p50_ms']:>10} {r['p95_ms']:>10} "
+              f"{r['p99_ms']:>10} {r['peak_mem_kb']:>10}")
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if not regressions:
+            print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+        for stage, metric, before, now, change in regressions:
+            print(f"REGRESSION {stage}.{metric}: {before} -> {now} ({change:+.0%})")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
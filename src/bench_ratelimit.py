@@ -0,0 +1,148 @@
+"""
+Load test for the OpenAI rate limiter against a mock endpoint that answers 429.
+
+Many threads send chat and embedding requests at the same time through the
+app's own clients (llm.get_chat_model and the batched OpenAI embedder) to
+mock_openai.MockOpenAIServer, which rejects requests above --server-rpm per
+minute and a fraction --error-rate of them at random, with a Retry-After
+header. Reported per kind: requests that succeeded or failed, requests the
+server saw and rejected, the limiter's retries and merged requests, the
+client latency and the time spent waiting for the buckets.
+
+With --compare the same load is also sent through a plain OpenAI client
+without limiter or retries, to show how many requests fail without it.
+
+Usage:
+    python src/bench_ratelimit.py
+    python src/bench_ratelimit.py --requests 300 --threads 32 --server-rpm 600 --error-rate 0.1 --compare
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from bench_async import QUERIES, percentile
+from metrics import metrics
+from mock_openai import MockOpenAIServer
+
+
+def _run(fn, items, threads):
+    """Call fn(item) for every item from `threads` threads; returns (latencies, failures, elapsed_s)."""
+    latencies, failures = [], []
+
+    def one(item):
+        start = time.perf_counter()
+        try:
+            fn(item)
+        except Exception as e:
+            failures.append(type(e).__name__)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, items))
+    return latencies, failures, time.perf_counter() - start
+
+
+def _counter(snapshot, name, kind):
+    return sum(c["value"] for c in snapshot["counters"] if c["name"] == name and c["labels"].get("limiter") == kind)
+
+
+def _report(kind, server, before, latencies, failures, elapsed, snapshot=None):
+    row = {
+        "kind": kind,
+        "ok": len(latencies),
+        "failed": len(failures),
+        "server_requests": server.requests - before[0],
+        "server_429s": server.rate_limited - before[1],
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "elapsed_s": round(elapsed, 2),
+    }
+    if snapshot is not None:
+        # metrics are reset before each kind, so these waits are all this kind's
+        wait = snapshot["stages"].get("ratelimit_wait", {})
+        row.update({
+            "retries": _counter(snapshot, "ratelimit_retries", kind),
+            "coalesced": _counter(snapshot, "ratelimit_coalesced", kind),
+            "waits": wait.get("count", 0),
+            "wait_total_s": round(wait.get("sum_s", 0.0), 2),
+        })
+    return row
+
+
+def run_limited(server, requests, threads, distinct):
+    from embeddings import _openai_embed_fn
+    from llm import get_chat_model
+
+    llm = get_chat_model()
+    embed = _openai_embed_fn(config.EMBEDDING_MODEL)
+    # `distinct` different prompts, so concurrent duplicates can be merged
+    prompts = [f"{QUERIES[i % len(QUERIES)]} #{i % distinct}" for i in range(requests)]
+
+    rows = []
+    for kind, fn in (("chat", llm.invoke), ("embeddings", lambda text: embed([text]))):
+        metrics.reset()
+        before = (server.requests, server.rate_limited)
+        latencies, failures, elapsed = _run(fn, prompts, threads)
+        rows.append(_report(kind, server, before, latencies, failures, elapsed, metrics.snapshot()))
+    return rows
+
+
+def run_unlimited(server, requests, threads, distinct):
+    from openai import OpenAI
+
+    client = OpenAI(base_url=server.base_url, max_retries=0)
+    prompts = [f"{QUERIES[i % len(QUERIES)]} #{i % distinct}" for i in range(requests)]
+    calls = {
+        "chat": lambda text: client.chat.completions.create(model=config.LLM_MODEL,
+                                                            messages=[{"role": "user", "content": text}]),
+        "embeddings": lambda text: client.embeddings.create(model=config.EMBEDDING_MODEL, input=[text]),
+    }
+    rows = []
+    for kind, fn in calls.items():
+        before = (server.requests, server.rate_limited)
+        latencies, failures, elapsed = _run(fn, prompts, threads)
+        rows.append(_report(f"{kind} (no limiter)", server, before, latencies, failures, elapsed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the OpenAI rate limiter against a mock that answers 429.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per kind")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--distinct", type=int, default=50, help="Number of different prompts")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock latency in seconds")
+    parser.add_argument("--server-rpm", type=int, default=600, help="Mock answers 429 above this many requests/min")
+    parser.add_argument("--error-rate", type=float, default=0.05,
+                        help="Fraction of requests the mock rejects at random")
+    parser.add_argument("--rpm", type=int, default=500, help="Client-side requests/min of each limiter")
+    parser.add_argument("--compare", action="store_true", help="Also send the load without limiter or retries")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    with MockOpenAIServer(latency=args.latency, rpm=args.server_rpm, error_rate=args.error_rate) as server:
+        config.LLM_BACKEND = "openai"
+        config.OPENAI_BASE_URL = server.base_url
+        config.OPENAI_CHAT_RPM = config.OPENAI_EMBEDDING_RPM = args.rpm
+        os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+        rows = run_limited(server, args.requests, args.threads, args.distinct)
+        if args.compare:
+            rows += run_unlimited(server, args.requests, args.threads, args.distinct)
+
+    print(f"{'kind':>24} {'ok':>5} {'failed':>6} {'sent':>5} {'429s':>5} {'retries':>7} {'merged':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'waits':>5}")
+    for r in rows:
+        print(f"{r['kind']:>24} {r['ok']:>5} {r['failed']:>6} {r['server_requests']:>5} {r['server_429s']:>5} "
+              f"{r.get('retries', '-'):>7} {r.get('coalesced', '-'):>6} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r.get('waits', '-'):>5}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
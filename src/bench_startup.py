@@ -0,0 +1,138 @@
+"""
+Startup-time benchmark: import cost and time to the first answer.
+
+Every measurement runs in a fresh interpreter (that is what a CLI call or a
+cold Streamlit worker pays), repeated and reported as the median:
+
+    import_chain    `import chain`
+    import_app      the modules streamlit_app.py imports (without streamlit itself)
+    process         interpreter start to exit for `import chain`
+    init_store      init_vectorstore() on a local collection, after the imports
+    first_query     answering one question with the stub chat model, after
+                    indexing one bundled transcript
+    ready           import_app + init_store + first_query: time to a usable app
+
+Pass --baseline-rev to run the same probes against another git revision of
+src/ (exported with `git archive`) and print the speedup, e.g. a commit from
+before lazy startup.
+
+Usage:
+    python src/bench_startup.py
+    python src/bench_startup.py --baseline-rev <commit> --repeats 7 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+TRANSCRIPT = os.path.join(SRC_DIR, "transcripts", "_4Uob271bOM.en.vtt")
+
+APP_MODULES = ["extractor", "cleaner", "splitter", "embeddings", "vectorstore", "chain"]
+
+_PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+{imports}
+t1 = time.perf_counter()
+result = {{"import_s": t1 - t0}}
+if {first_query}:
+    import config
+    config.LLM_BACKEND = "stub"
+    from cleaner import iter_cues
+    from splitter import TokenTextSplitter
+    from vectorstore import init_vectorstore
+    from chain import query_chain
+    _, store = init_vectorstore(collection_name="bench_startup", embedding_function="local")
+    t2 = time.perf_counter()
+    store.add_documents(list(TokenTextSplitter().split_cues(iter_cues({transcript!r}), video_id="bench")))
+    t3 = time.perf_counter()
+    query_chain("What is the video about?", store, use_cache=False)
+    result["init_s"] = t2 - t1
+    result["first_query_s"] = time.perf_counter() - t3
+print(json.dumps(result))
+'''
+
+
+def _probe(src_dir, modules, first_query=False):
+    """Run one probe in a fresh interpreter; returns (probe result, process wall time)."""
+    code = _PROBE.format(imports="\n".join(f"import {m}" for m in modules), first_query=first_query,
+                         transcript=TRANSCRIPT)
+    env = dict(os.environ, PYTHONPATH=src_dir, LLM_BACKEND="stub", EMBEDDING_BACKEND="local")
+    # a key is set in real deployments, and it is what used to trigger eager initialisation
+    env.setdefault("OPENAI_API_KEY", "sk-bench-startup")
+    with tempfile.TemporaryDirectory() as cwd:  # keep chroma_db/ and caches out of the repo
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"probe failed in {src_dir}:\n{completed.stderr[-2000:]}")
+    # older trees print to stdout while importing; the result is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1]), wall
+
+
+def measure(src_dir, repeats=5):
+    samples = {"import_chain": [], "import_app": [], "process": [], "init_store": [], "first_query": [], "ready": []}
+    for _ in range(repeats):
+        result, wall = _probe(src_dir, ["chain"])
+        samples["import_chain"].append(result["import_s"])
+        samples["process"].append(wall)
+        result, _ = _probe(src_dir, APP_MODULES)
+        samples["import_app"].append(result["import_s"])
+        result, _ = _probe(src_dir, APP_MODULES, first_query=True)
+        samples["init_store"].append(result["init_s"])
+        samples["first_query"].append(result["first_query_s"])
+        # time to a usable app: imports, opening the store and one answer (indexing excluded)
+        samples["ready"].append(result["import_s"] + result["init_s"] + result["first_query_s"])
+    return {name: round(statistics.median(values) * 1000, 1) for name, values in samples.items()}
+
+
+def export_revision(rev, dest):
+    """Extract src/ of git revision `rev` into `dest`; returns the path of its src directory."""
+    repo = os.path.dirname(SRC_DIR)
+    archive = subprocess.run(["git", "archive", "--format=tar", rev, "src"], cwd=repo,
+                             capture_output=True, check=True).stdout
+    tar_path = os.path.join(dest, "src.tar")
+    with open(tar_path, "wb") as f:
+        f.write(archive)
+    with tarfile.open(tar_path) as tar:
+        tar.extractall(dest)
+    return os.path.join(dest, "src")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and first-query startup time.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--baseline-rev", help="Also measure this git revision and print the speedup")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"current": measure(SRC_DIR, args.repeats)}
+    if args.baseline_rev:
+        with tempfile.TemporaryDirectory() as tmp:
+            results["baseline"] = measure(export_revision(args.baseline_rev, tmp), args.repeats)
+        results["baseline_rev"] = args.baseline_rev
+
+    current, baseline = results["current"], results.get("baseline")
+    header = f"{'median ms':<14} {'current':>10}"
+    if baseline:
+        header += f" {'baseline':>10} {'speedup':>8}"
+    print(header)
+    for name, value in current.items():
+        line = f"{name:<14} {value:>10}"
+        if baseline:
+            line += f" {baseline[name]:>10} {baseline[name] / value if value else 0:>7.1f}x"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
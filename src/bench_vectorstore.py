@@ -0,0 +1,174 @@
+"""
+Benchmark the flat NumPy index (flatstore.py) against Chroma.
+
+Vectors are the hashing-embedder embeddings of the bundled transcript chunks,
+padded with noisy copies up to --target vectors so larger collections can be
+tried too. Queries are the opening words of random chunks. Each backend gets
+the same vectors and queries and is measured on:
+
+    build_s        time to insert all vectors
+    p50/p95_ms     latency of one query (top --k), one query at a time
+    recall         recall@k against exact float32 brute force
+    vector_bytes   bytes per vector of the vector data itself
+    disk_bytes     bytes per vector on disk, everything included
+
+Chroma runs as a PersistentClient in a temporary directory (cosine HNSW), so
+its disk use is measured the same way as the flat collections'.
+
+Usage:
+    python src/bench_vectorstore.py
+    python src/bench_vectorstore.py --target 20000 --queries 200 --json vectorstore.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench_async import percentile
+from cleaner import iter_cues
+from embeddings import HashingEmbeddingFunction
+from flatstore import DTYPES, FlatCollection
+from splitter import TokenTextSplitter
+
+TRANSCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+
+
+def load_corpus(target, seed=0):
+    """Return (texts, unit-norm float32 vectors, embedder), padded with noisy variants up to `target`."""
+    splitter = TokenTextSplitter()
+    texts = []
+    for path in sorted(glob.glob(os.path.join(TRANSCRIPTS_DIR, "*.vtt"))):
+        video_id = os.path.basename(path).split(".")[0]
+        texts.extend(doc.page_content for doc in splitter.split_cues(iter_cues(path), video_id=video_id))
+    embedder = HashingEmbeddingFunction()
+    vectors = np.asarray(embedder(texts), dtype=np.float32)
+
+    base = len(texts)
+    if target > base:
+        rng = np.random.default_rng(seed)
+        extra = np.arange(base, target) % base
+        padded = vectors[extra] + rng.normal(0, 0.02, (len(extra), vectors.shape[1])).astype(np.float32)
+        vectors = np.vstack([vectors, padded / np.linalg.norm(padded, axis=1, keepdims=True)])
+        texts.extend(f"{texts[i]} [variant {n}]" for n, i in enumerate(extra, start=base))
+    return texts, vectors, embedder
+
+
+def make_queries(texts, embedder, count, seed=0):
+    rng = random.Random(seed)
+    picked = [" ".join(rng.choice(texts).split()[:12]) for _ in range(count)]
+    return np.asarray(embedder(picked), dtype=np.float32)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def _time_queries(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def _summary(build_s, latencies, results, truth, k, vector_bytes, disk_bytes, count):
+    recall = np.mean([len(set(found) & expected) / k for found, expected in zip(results, truth)])
+    return {
+        "build_s": round(build_s, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "recall": round(float(recall), 4),
+        "vector_bytes": round(vector_bytes, 1),
+        "disk_bytes": round(disk_bytes / count, 1),
+    }
+
+
+def bench_flat(dtype, texts, vectors, queries, truth, k, batch_size=1000):
+    ids = [str(i) for i in range(len(texts))]
+    with tempfile.TemporaryDirectory() as tmp:
+        collection = FlatCollection(os.path.join(tmp, "bench"), "bench", embedding_function=None, dtype=dtype)
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.upsert(documents=texts[i:i + batch_size], ids=ids[i:i + batch_size],
+                              embeddings=vectors[i:i + batch_size])
+        build_s = time.perf_counter() - start
+
+        def search(query):
+            return [int(doc_id) for doc_id in
+                    collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]]
+
+        latencies, results = _time_queries(search, queries)
+        return _summary(build_s, latencies, results, truth, k, collection.bytes_per_vector(),
+                        directory_bytes(tmp), len(ids))
+
+
+def bench_chroma(texts, vectors, queries, truth, k, batch_size=1000):
+    import chromadb
+
+    ids = [str(i) for i in range(len(texts))]
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=tmp)
+        collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"}, embedding_function=None)
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            collection.upsert(documents=texts[i:i + batch_size], ids=ids[i:i + batch_size],
+                              embeddings=vectors[i:i + batch_size])
+        build_s = time.perf_counter() - start
+
+        def search(query):
+            return [int(doc_id) for doc_id in
+                    collection.query(query_embeddings=[query], n_results=k, include=[])["ids"][0]]
+
+        latencies, results = _time_queries(search, queries)
+        # chroma keeps float32 vectors (HNSW links and the SQLite copy come on top: see disk_bytes)
+        summary = _summary(build_s, latencies, results, truth, k, vectors.shape[1] * 4,
+                           directory_bytes(tmp), len(ids))
+        del collection, client
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the flat NumPy vector index with Chroma.")
+    parser.add_argument("--target", type=int, default=0,
+                        help="Pad the corpus with noisy variants up to this many vectors")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--no-chroma", action="store_true", help="Only benchmark the flat index")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    texts, vectors, embedder = load_corpus(args.target)
+    queries = make_queries(texts, embedder, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(texts)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    results = {}
+    if not args.no_chroma:
+        results["chroma"] = bench_chroma(texts, vectors, queries, truth, args.k)
+    for dtype in DTYPES:
+        results[f"flat-{dtype}"] = bench_flat(dtype, texts, vectors, queries, truth, args.k)
+
+    columns = ("build_s", "p50_ms", "p95_ms", "recall", "vector_bytes", "disk_bytes")
+    print(f"{'backend':<14}" + "".join(f"{name:>14}" for name in columns))
+    for name, row in results.items():
+        print(f"{name:<14}" + "".join(f"{row[column]:>14}" for column in columns))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(texts), "dimension": int(vectors.shape[1]), "queries": len(queries),
+                       "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
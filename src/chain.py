@@ -1,35 +1,55 @@
-from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
-from langchain_openai import ChatOpenAI
-import os, openai
+import asyncio, json, os, time, weakref
 import config  # ensure load_dotenv() runs and OPENAI_API_KEY is available
+from metrics import metrics
 
 # ensure env var is populated (use config value if present)
 if getattr(config, "OPENAI_API_KEY", None) and not os.environ.get("OPENAI_API_KEY"):
     os.environ["OPENAI_API_KEY"] = config.OPENAI_API_KEY
-    print(config.OPENAI_API_KEY)
 
-from langchain_core.output_parsers import StrOutputParser
-from vectorstore import collection  # Assuming collection is defined in vectorstore.py
 import sys
 
+# langchain, chromadb and the vector store are imported on first use, not at
+# import time, so importing this module (e.g. on every Streamlit rerun) is cheap.
+
 
 def join_docs(retrieved_docs):
-    context_text = "\n\n".join(retrieved_docs["documents"][0])
+    from context import pack_context
+    metadatas = (retrieved_docs.get("metadatas") or [None])[0]
+    context_text, _ = pack_context("", retrieved_docs["documents"][0], metadatas,
+                                   token_budget=config.CONTEXT_TOKEN_BUDGET)
     return context_text
 
 def query_collection(question):
-    return collection.query(
+    from vectorstore import get_vector_store
+    return get_vector_store().collection.query(
         query_texts=question,
         n_results=4
     )
 
-parallel_chain = RunnableParallel({
-    'context': RunnableLambda(query_collection) | RunnableLambda(join_docs),
-    'query': RunnablePassthrough()
-})
+_parallel_chain = None
+
+
+def get_parallel_chain():
+    """The langchain retrieval chain, built (and langchain imported) on first use."""
+    global _parallel_chain
+    if _parallel_chain is None:
+        from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+        _parallel_chain = RunnableParallel({
+            'context': RunnableLambda(query_collection) | RunnableLambda(join_docs),
+            'query': RunnablePassthrough()
+        })
+    return _parallel_chain
+
+
+def __getattr__(name):
+    # keep `from chain import parallel_chain` working without building it at import time
+    if name == "parallel_chain":
+        return get_parallel_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def main_chain_function(query):
-    return parallel_chain.invoke(query)
+    return get_parallel_chain().invoke(query)
 
 def main():
     if len(sys.argv) > 1:
@@ -42,50 +62,579 @@ def main():
 if __name__ == "__main__":
     main()
 
-# --- add this wrapper so streamlit_app.imports work ---
-def query_chain(query, vector_store=None, n_results=4):
-    """
-    Retrieve context for `query` from the provided vector_store or the module-level collection,
-    then try to generate an answer using OpenAI (if OPENAI_API_KEY is set). Falls back to
-    returning the formatted prompt/context if no LLM is available.
-    """
+_answer_cache = None
+_SUMMARY_MAX_VIDEOS = 8  # broad questions over more videos than this use retrieval
+_MENTION_MAX_HITS = 10  # mentions per video put in the context of a "where is X mentioned" question
+_MENTION_WINDOW_S = 20  # seconds of transcript from each mention on
+
+
+def get_answer_cache():
+    """Process-wide SemanticCache configured from config.ANSWER_CACHE_*."""
+    global _answer_cache
+    if _answer_cache is None:
+        from answer_cache import SemanticCache
+        _answer_cache = SemanticCache(threshold=config.ANSWER_CACHE_THRESHOLD,
+                                      max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+                                      ttl=config.ANSWER_CACHE_TTL,
+                                      path=config.ANSWER_CACHE_PATH)
+    return _answer_cache
+
+
+def _resolve_collection(vector_store):
     # resolve chroma collection: either a chromadb.Collection object or a wrapper with .collection
     col = None
     if vector_store is not None:
         col = getattr(vector_store, "collection", None) or vector_store
     if col is None:
         try:
-            from vectorstore import collection as module_collection
-            col = module_collection
+            from vectorstore import get_vector_store
+            col = get_vector_store().collection
         except Exception:
             col = None
 
     if col is None:
-        raise RuntimeError("No vector store collection available. Call init_vectorstore() or pass vector_store to query_chain.")
+        raise RuntimeError("No vector store collection available. "
+                           "Call init_vectorstore() or pass vector_store to query_chain.")
+    return col
+
 
-    # query the collection
-    retrieved = col.query(query_texts=[query], n_results=n_results)
-    docs = retrieved.get("documents", [[]])[0]
-    context = "\n\n".join(docs)
+def _cache_key(col, where=None):
+    # answers scoped to different videos must not be served for each other
+    name = getattr(col, "name", "default")
+    return f"{name}?{json.dumps(where, sort_keys=True)}" if where else name
+
+
+def _cache_version(vector_store, col):
+    """Answer-cache version of the collection: VectorStore.data_version, or the chunk count of a bare collection."""
+    if hasattr(vector_store, "data_version"):
+        return vector_store.data_version()
+    return col.count()
+
+
+def _scoped_videos(vector_store, where=None):
+    """Indexed videos of `vector_store` that `where` can match (all of them if it does not restrict videos)."""
+    from vectorstore import video_ids_in
+
+    videos = video_ids_in(where)
+    return [video_id for video_id in vector_store.indexed_videos() if videos is None or video_id in videos]
+
+
+def _time_range_context(query, vector_store, where=None):
+    """
+    For questions about a time range ("between 12:00 and 13:30") return the
+    transcript spoken in that range, read from the cue stores of the indexed
+    videos (those `where` selects), as (documents, metadatas). Returns None
+    for other questions.
+    """
+    from cuestore import get_cue_store, parse_time_range
+
+    time_range = parse_time_range(query)
+    persist_directory = getattr(vector_store, "persist_directory", None)
+    if time_range is None or persist_directory is None or not hasattr(vector_store, "indexed_videos"):
+        return None
+    documents, metadatas = [], []
+    for video_id in _scoped_videos(vector_store, where):
+        cues = get_cue_store(persist_directory, video_id)
+        spoken = cues.between(*time_range) if cues is not None else []
+        if spoken:
+            documents.append(" ".join(cue.text for cue in spoken))
+            metadatas.append({"video_id": video_id, "start": spoken[0].start, "end": spoken[-1].end})
+    return (documents, metadatas) if documents else None
+
+
+def _mention_context(query, vector_store, where=None):
+    """
+    For "where is X mentioned" / "jump to where X is mentioned" questions
+    return the cues around each mention of X in the cue stores of the videos
+    `where` selects, as (documents, metadatas) with their start and end, so
+    the citations link to those moments. Returns None for other questions
+    or when X is not mentioned (retrieval answers those).
+    """
+    from cuestore import get_cue_store, parse_mention
 
+    phrase = parse_mention(query)
+    persist_directory = getattr(vector_store, "persist_directory", None)
+    if phrase is None or persist_directory is None or not hasattr(vector_store, "indexed_videos"):
+        return None
+    documents, metadatas = [], []
+    for video_id in _scoped_videos(vector_store, where):
+        cues = get_cue_store(persist_directory, video_id)
+        for start in (cues.find(phrase, limit=_MENTION_MAX_HITS) if cues is not None else []):
+            spoken = cues.between(start, start + _MENTION_WINDOW_S)
+            if spoken:
+                documents.append(" ".join(cue.text for cue in spoken))
+                metadatas.append({"video_id": video_id, "start": spoken[0].start, "end": spoken[-1].end})
+    return (documents, metadatas) if documents else None
+
+
+def _cue_store_context(query, vector_store, where=None):
+    """Time-range or mention context from the cue stores (see above), or None to retrieve."""
+    return _time_range_context(query, vector_store, where) or _mention_context(query, vector_store, where)
+
+
+def _summary_context(query, vector_store, where=None):
+    """
+    For whole-video questions ("summarize this video") return (context, report)
+    built from the summary trees (see summary.py) of the videos `where`
+    selects, or None to use retrieval. A missing tree is built on first use
+    when the question is about a single video; over the whole corpus only
+    the trees already built are used.
+    """
+    from summary import get_summary_tree, is_broad_question, summary_context
+
+    if not is_broad_question(query) or not hasattr(vector_store, "indexed_videos"):
+        return None
+    videos = _scoped_videos(vector_store, where)
+    if not videos or len(videos) > _SUMMARY_MAX_VIDEOS:
+        # too many videos for an overview of each: answer from retrieval instead
+        return None
+    trees = [tree for tree in (get_summary_tree(vector_store, video_id, build=len(videos) == 1)
+                               for video_id in videos) if tree is not None]
+    if not trees:
+        return None
+    from splitter import count_tokens
+    context, sources = summary_context(trees, token_budget=config.CONTEXT_TOKEN_BUDGET)
+    tokens = count_tokens(context)
+    return context, {"candidates": len(sources), "pieces": len(sources), "baseline_tokens": tokens,
+                     "context_tokens": tokens, "tokens_saved": 0, "sources": sources, "summary": True}
+
+
+def _retrieve_context(query, vector_store, col, n_results, report=None, where=None):
+    """
+    Retrieve candidates for `query` and pack them into the prompt context
+    (MMR, adjacent-chunk merging, token budget; see context.pack_context).
+    Questions about a time range ("what was said between 12:00 and 13:30")
+    use the transcript of that range from the cue store instead, "where is X
+    mentioned" questions the cues where X is said, and whole-video questions
+    the summary tree. `where` is a metadata filter
+    (e.g. {"video_id": "abc"}) for the retrieval.
+    If `report` is a dict it receives the packing report (tokens saved,
+    sources for citations etc.).
+    """
+    from context import pack_context
+
+    with metrics.span("retrieve") as span:
+        by_time = _cue_store_context(query, vector_store, where)
+        by_summary = _summary_context(query, vector_store, where) if by_time is None else None
+        if by_summary is not None:
+            context, packed = by_summary
+            span.set(summary=True)
+        else:
+            if by_time is not None:
+                docs, metadatas = by_time
+                span.set(time_range=True)
+            else:
+                # over-fetch so MMR has alternatives to near-duplicate hits
+                fetch_k = max(n_results * 3, 10)
+                # query the collection (BM25 + vector fusion when a VectorStore is given)
+                if hasattr(vector_store, "hybrid_query"):
+                    retrieved = vector_store.hybrid_query(query, n_results=fetch_k, where=where)
+                else:
+                    with metrics.span("query", collection=getattr(col, "name", None)):
+                        kwargs = {"where": where} if where else {}
+                        retrieved = col.query(query_texts=[query], n_results=fetch_k, **kwargs)
+                docs = retrieved.get("documents", [[]])[0]
+                metadatas = (retrieved.get("metadatas") or [None])[0]
+            context, packed = pack_context(query, docs, metadatas, n_results=n_results,
+                                           token_budget=config.CONTEXT_TOKEN_BUDGET, lambda_mult=config.MMR_LAMBDA)
+        span.count("candidates", packed["candidates"])
+        span.count("context_tokens", packed["context_tokens"])
+    if report is not None:
+        report.update(packed)
+    return context
+
+
+def _cacheable(query):
+    # "12:00 to 13:30" and "12:00 to 13:45" look alike to the semantic cache but need different answers,
+    # as do "where is Antonsen mentioned" and "where is Axelsen mentioned"
+    from cuestore import parse_mention, parse_time_range
+    return parse_time_range(query) is None and parse_mention(query) is None
+
+
+def _citations(report, vector_store):
+    from cuestore import cite
+    return cite(report.get("sources", []), getattr(vector_store, "persist_directory", None))
+
+
+def _load_prompt():
     # build prompt using prompt.default_prompt if available
     try:
         from prompt import default_prompt
-        prompt_text = default_prompt().format(context=context, query=query)
+        return default_prompt()
     except Exception:
-        prompt_text = f"Context: {context}\n\nQuery: {query}"
+        return None
+
+
+def _format_prompt(template, context, query):
+    if template is None:
+        return f"Context: {context}\n\nQuery: {query}"
+    return template.format(context=context, query=query)
+
+
+def _count_llm_tokens(span, prompt_text, answer):
+    from splitter import count_tokens
+    span.count("prompt_tokens", count_tokens(prompt_text))
+    span.count("completion_tokens", count_tokens(answer))
+
+
+def _invoke_llm(llm, prompt_text):
+    with metrics.span("llm") as span:
+        response = llm.invoke(prompt_text)
+        _count_llm_tokens(span, prompt_text, response.content)
+    return response
+
+
+async def _ainvoke_llm(llm, prompt_text):
+    with metrics.span("llm") as span:
+        response = await llm.ainvoke(prompt_text)
+        _count_llm_tokens(span, prompt_text, response.content)
+    return response
+
+
+def _retrieve_prompt(query, vector_store, col, n_results, report=None, where=None):
+    """Retrieve context for `query` and format the prompt. Returns (context, prompt_text)."""
+    context = _retrieve_context(query, vector_store, col, n_results, report, where)
+    return context, _format_prompt(_load_prompt(), context, query)
 
-    # try to call ChatOpenAI (basic fallback). Requires OPENAI_API_KEY in env.
+
+# --- add this wrapper so streamlit_app.imports work ---
+def query_chain(query, vector_store=None, n_results=4, cache=None, use_cache=True, llm=None, context_report=None,
+                citations=None, where=None):
+    """
+    Retrieve context for `query` from the provided vector_store or the module-level collection,
+    then try to generate an answer using the chat model (`llm`, default llm.get_chat_model()).
+    Falls back to returning the formatted prompt/context if no LLM is available.
+
+    Answers are served from the semantic answer cache (`cache`, default
+    get_answer_cache()) when the same or a near-identical question was asked
+    against the unchanged collection; pass use_cache=False to bypass it.
+
+    If `context_report` is a dict it receives the context packing report
+    (baseline_tokens, context_tokens, tokens_saved, ...). If `citations` is a
+    list it receives the timestamped sources of the answer (see cuestore.cite):
+    {"video_id", "title", "start", "end", "label", "url", "quote"} dicts.
+
+    `where` restricts retrieval to the chunks whose metadata match it, e.g.
+    {"video_id": "abc"} for one video of the corpus or
+    {"language": "en"}; None searches every video in the collection.
+    """
+    with metrics.span("query_chain") as span:
+        return _query_chain(query, vector_store, n_results, cache, use_cache, llm, context_report, citations, span,
+                            where)
+
+
+def _query_chain(query, vector_store, n_results, cache, use_cache, llm, context_report, citations, span, where):
+    col = _resolve_collection(vector_store)
+    report = context_report if context_report is not None else {}
+
+    use_cache = use_cache and _cacheable(query)
+    if use_cache:
+        cache = cache or get_answer_cache()
+        cache_key = _cache_key(col, where)
+        # bumped by every write, including a live transcript's last chunk replaced in place
+        version = _cache_version(vector_store, col)
+        cached = cache.get(cache_key, query, version=version)
+        if cached is not None:
+            span.count("answer_cache_hits")
+            if citations is not None:
+                citations.extend(cached.get("citations", []))
+            return cached["answer"]
+
+    context, prompt_text = _retrieve_prompt(query, vector_store, col, n_results, report, where)
+    sources = _citations(report, vector_store)
+    if citations is not None:
+        citations.extend(sources)
+
+    # Requires OPENAI_API_KEY in env (or LLM_BACKEND=stub).
     try:
-        openai.api_key = os.environ.get("OPENAI_API_KEY")
-        if openai.api_key:
-            llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
-            # print(f"Prompt: {prompt_text}")
-            response = llm.invoke(prompt_text)
-            print(response)
+        from llm import get_chat_model
+        llm = llm or get_chat_model()
+        if llm is not None:
+            response = _invoke_llm(llm, prompt_text)
+            if use_cache:
+                cache.put(cache_key, query, context, response.content, version=version, citations=sources)
             return response.content
     except Exception as e:
-        raise RuntimeError(f"Failed to get a response from ChatOpenAI. Error: {e}")
+        raise RuntimeError(f"Failed to get a response from the chat model. Error: {e}")
 
     # final fallback: return the assembled prompt/context so UI shows something useful
-    return prompt_text
\ No newline at end of file
+    return prompt_text
+
+
+def stream_query_chain(query, vector_store=None, n_results=4, cache=None, use_cache=True, llm=None, timings=None,
+                       where=None):
+    """
+    Streaming variant of query_chain: yields answer tokens as the model produces them.
+
+    If `timings` is a dict it is filled in as the request progresses with
+    retrieval_s, ttft_s (time to first token), total_s, tokens, cached,
+    context (the context packing report) and citations (timestamped
+    sources, see query_chain). The request is also recorded as
+    "stream_query_chain" and "llm" spans in metrics (a generator cannot hold
+    a span open across its yields, so they are recorded when it finishes).
+    `where` filters retrieval by chunk metadata, as in query_chain.
+
+    Usage:
+        timings = {}
+        for token in stream_query_chain("Who won?", vector_store, timings=timings):
+            print(token, end="", flush=True)
+    """
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    timings.update(cached=False, tokens=0)
+    col = _resolve_collection(vector_store)
+
+    use_cache = use_cache and _cacheable(query)
+    if use_cache:
+        cache = cache or get_answer_cache()
+        cache_key = _cache_key(col, where)
+        version = _cache_version(vector_store, col)
+        cached = cache.get(cache_key, query, version=version)
+        if cached is not None:
+            timings.update(cached=True, tokens=1, ttft_s=time.perf_counter() - start,
+                           citations=cached.get("citations", []))
+            yield cached["answer"]
+            timings["total_s"] = time.perf_counter() - start
+            metrics.record("stream_query_chain", timings["total_s"], counts={"answer_cache_hits": 1})
+            return
+
+    timings["context"] = {}
+    context, prompt_text = _retrieve_prompt(query, vector_store, col, n_results, timings["context"], where)
+    timings["citations"] = _citations(timings["context"], vector_store)
+    timings["retrieval_s"] = time.perf_counter() - start
+
+    from llm import get_chat_model
+    llm = llm or get_chat_model()
+    if llm is None:
+        # no model available: show the assembled prompt/context, like query_chain
+        timings["ttft_s"] = time.perf_counter() - start
+        yield prompt_text
+        timings["total_s"] = time.perf_counter() - start
+        metrics.record("stream_query_chain", timings["total_s"])
+        return
+
+    parts = []
+    llm_start = time.perf_counter()
+    try:
+        for chunk in llm.stream(prompt_text):
+            token = chunk.content
+            if not token:
+                continue
+            if not parts:
+                timings["ttft_s"] = time.perf_counter() - start
+            parts.append(token)
+            timings["tokens"] = len(parts)
+            yield token
+    except Exception as e:
+        metrics.incr("errors", stage="llm")
+        raise RuntimeError(f"Failed to get a response from the chat model. Error: {e}")
+    timings["total_s"] = time.perf_counter() - start
+
+    from splitter import count_tokens
+    answer = "".join(parts)
+    metrics.record("stream_query_chain", timings["total_s"])
+    metrics.record("llm", time.perf_counter() - llm_start, streamed=True, ttft_s=timings.get("ttft_s"),
+                   counts={"prompt_tokens": count_tokens(prompt_text), "completion_tokens": count_tokens(answer)})
+
+    if use_cache:
+        cache.put(cache_key, query, context, answer, version=version, citations=timings["citations"])
+
+
+_query_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_query_semaphore():
+    # asyncio primitives belong to one event loop, so keep one limiter per loop
+    loop = asyncio.get_running_loop()
+    semaphore = _query_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_QUERIES)
+        _query_semaphores[loop] = semaphore
+    return semaphore
+
+
+async def aquery_chain(query, vector_store=None, n_results=4, cache=None, use_cache=True, llm=None,
+                       context_report=None, citations=None, where=None):
+    """
+    Async variant of query_chain for serving many concurrent users.
+
+    At most config.MAX_CONCURRENT_QUERIES queries run at once per event loop.
+    Retrieval runs in a worker thread while the prompt template and the
+    process-wide chat model (pooled HTTP connections) are prepared, and the
+    LLM call is awaited with ainvoke so requests never block each other.
+    """
+    async with _get_query_semaphore():
+        with metrics.span("query_chain", asynchronous=True) as span:
+            return await _aquery_chain(query, vector_store, n_results, cache, use_cache, llm, context_report,
+                                       citations, span, where)
+
+
+async def _aquery_chain(query, vector_store, n_results, cache, use_cache, llm, context_report, citations, span,
+                        where):
+    col = _resolve_collection(vector_store)
+    report = context_report if context_report is not None else {}
+
+    use_cache = use_cache and _cacheable(query)
+    if use_cache:
+        cache = cache or get_answer_cache()
+        cache_key = _cache_key(col, where)
+        version = _cache_version(vector_store, col)
+        cached = cache.get(cache_key, query, version=version)
+        if cached is not None:
+            span.count("answer_cache_hits")
+            if citations is not None:
+                citations.extend(cached.get("citations", []))
+            return cached["answer"]
+
+    retrieval = asyncio.create_task(asyncio.to_thread(_retrieve_context, query, vector_store, col, n_results, report,
+                                                     where))
+    from llm import get_chat_model
+    template = _load_prompt()
+    llm = llm or get_chat_model()
+    context = await retrieval
+    prompt_text = _format_prompt(template, context, query)
+    sources = _citations(report, vector_store)
+    if citations is not None:
+        citations.extend(sources)
+
+    if llm is None:
+        return prompt_text
+    try:
+        response = await _ainvoke_llm(llm, prompt_text)
+    except Exception as e:
+        raise RuntimeError(f"Failed to get a response from the chat model. Error: {e}")
+    if use_cache:
+        cache.put(cache_key, query, context, response.content, version=version, citations=sources)
+    return response.content
+
+
+def _retrieve_batch(queries, vector_store, col, n_results, where=None):
+    """(documents, metadatas) candidates for each query, with one vector query for all of them."""
+    fetch_k = max(n_results * 3, 10)
+    candidates = [_cue_store_context(query, vector_store, where) for query in queries]
+    todo = [i for i, found in enumerate(candidates) if found is None]
+    if todo:
+        texts = [queries[i] for i in todo]
+        if hasattr(vector_store, "hybrid_query_batch"):
+            retrieved = vector_store.hybrid_query_batch(texts, n_results=fetch_k, where=where)
+        else:
+            with metrics.span("query", collection=getattr(col, "name", None), batch=len(texts)):
+                kwargs = {"where": where} if where else {}
+                retrieved = col.query(query_texts=texts, n_results=fetch_k, **kwargs)
+        metadatas = retrieved.get("metadatas") or [None] * len(todo)
+        for row, i in enumerate(todo):
+            candidates[i] = (retrieved["documents"][row], metadatas[row])
+    return candidates
+
+
+def batch_query_chain(queries, vector_store=None, n_results=4, cache=None, use_cache=True, llm=None,
+                      max_workers=None, where=None):
+    """
+    Answer many questions against one collection, yielding results as they complete.
+
+    Questions found in the answer cache are yielded first. The rest are
+    retrieved together: one hybrid_query_batch (a single batched embedding
+    call and vector query), with candidate chunks shared between questions
+    fetched and embedded for MMR once. Questions that end up with the same
+    normalised text and context share one LLM call. LLM calls run concurrently
+    on at most `max_workers` threads (default config.BATCH_MAX_WORKERS).
+    `where` filters retrieval for every question, as in query_chain.
+
+    Yields:
+        dict: {"index", "query", "answer", "citations", "cached"} per question
+        in completion order ("index" is its position in `queries`). A failed
+        LLM call yields answer None and the message under "error".
+
+    Usage:
+        for result in batch_query_chain(questions, vector_store):
+            answers[result["index"]] = result["answer"]
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import numpy as np
+    from answer_cache import normalize_query
+    from context import _local_embedder, pack_context
+    from llm import get_chat_model
+
+    queries = list(queries)
+    start = time.perf_counter()
+    counts = {"questions": len(queries), "answer_cache_hits": 0, "llm_calls": 0}
+    col = _resolve_collection(vector_store)
+    if use_cache:
+        cache = cache or get_answer_cache()
+        cache_key = _cache_key(col, where)
+        version = _cache_version(vector_store, col)
+
+    pending = []
+    for i, query in enumerate(queries):
+        cached = cache.get(cache_key, query, version=version) if use_cache and _cacheable(query) else None
+        if cached is None:
+            pending.append(i)
+            continue
+        counts["answer_cache_hits"] += 1
+        yield {"index": i, "query": query, "answer": cached["answer"],
+               "citations": cached.get("citations", []), "cached": True}
+
+    if pending:
+        with metrics.span("retrieve", batch=len(pending)) as span:
+            template = _load_prompt()
+            groups = {}  # (normalised question, context) -> [(index, context, citations)]
+            # whole-video questions are answered from the summary tree, the rest from retrieval
+            # (time-range and mention questions, which are not cacheable, keep priority as in _retrieve_context)
+            retrieve = []
+            for i in pending:
+                by_summary = _summary_context(queries[i], vector_store, where) if _cacheable(queries[i]) else None
+                if by_summary is None:
+                    retrieve.append(i)
+                    continue
+                context, packed = by_summary
+                groups.setdefault((normalize_query(queries[i]), context), []).append(
+                    (i, context, _citations(packed, vector_store)))
+            candidates = _retrieve_batch([queries[i] for i in retrieve], vector_store, col, n_results, where)
+            # embed every distinct question and candidate once for MMR, not once per question
+            texts = list(dict.fromkeys([queries[i] for i in retrieve] + [d for docs, _ in candidates for d in docs]))
+            vectors = dict(zip(texts, _local_embedder().embed(texts))) if texts else {}
+            for i, (docs, metadatas) in zip(retrieve, candidates):
+                context, packed = pack_context(queries[i], docs, metadatas, n_results=n_results,
+                                               token_budget=config.CONTEXT_TOKEN_BUDGET,
+                                               lambda_mult=config.MMR_LAMBDA,
+                                               embed=lambda batch: np.asarray([vectors[t] for t in batch]))
+                groups.setdefault((normalize_query(queries[i]), context), []).append(
+                    (i, context, _citations(packed, vector_store)))
+            span.count("candidates", sum(len(docs) for docs, _ in candidates))
+            span.count("unique_prompts", len(groups))
+
+        llm = llm or get_chat_model()
+        if llm is None:
+            # no model available: return the assembled prompts, like query_chain
+            for members in groups.values():
+                for i, context, citations in members:
+                    yield {"index": i, "query": queries[i], "answer": _format_prompt(template, context, queries[i]),
+                           "citations": citations, "cached": False}
+        else:
+            pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers or config.BATCH_MAX_WORKERS, len(groups))))
+            try:
+                futures = {}
+                for members in groups.values():
+                    first, context, _ = members[0]
+                    prompt_text = _format_prompt(template, context, queries[first])
+                    futures[pool.submit(_invoke_llm, llm, prompt_text)] = members
+                counts["llm_calls"] = len(futures)
+                for future in as_completed(futures):
+                    try:
+                        answer, error = future.result().content, None
+                    except Exception as e:
+                        answer, error = None, f"Failed to get a response from the chat model. Error: {e}"
+                        metrics.incr("errors", stage="llm")
+                    for i, context, citations in futures[future]:
+                        if use_cache and answer is not None:
+                            cache.put(cache_key, queries[i], context, answer, version=version, citations=citations)
+                        result = {"index": i, "query": queries[i], "answer": answer, "citations": citations,
+                                  "cached": False}
+                        if error:
+                            result["error"] = error
+                        yield result
+            finally:
+                # stop queued calls if the caller stops consuming early
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    metrics.record("batch_query_chain", time.perf_counter() - start, counts=counts)
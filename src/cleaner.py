@@ -1,31 +1,132 @@
+import html
 import re
+from collections import deque
+from typing import Iterator, NamedTuple
 
-def extract_clean_subtitles(vtt_file):
-    subtitle_lines = []
-    seen_lines = set()  # Avoid duplicate lines
+from metrics import metrics
 
-    with open(vtt_file, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
+# Compiled once at import; these run on every line of every transcript.
+# _TAG_RE strips inline markup like <00:00:16.760><c>word</c> down to "word".
+_TAG_RE = re.compile(r"<[^>]*>")
+_NOISE_RE = re.compile(r"^\[\w+\]$")  # [Music], [Applause], etc.
+_HEADER_PREFIXES = ("WEBVTT", "Kind:", "Language:")
+
+
+class Cue(NamedTuple):
+    """A single caption cue: start/end in seconds and its (new) text."""
+    start: float
+    end: float
+    text: str
+
+
+def _parse_timestamp(value: str) -> float:
+    """Convert 'HH:MM:SS.mmm' or 'MM:SS.mmm' to seconds."""
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _clean_line(line: str) -> str:
+    if "<" in line:
+        line = _TAG_RE.sub("", line)
+    if "&" in line:
+        line = html.unescape(line)
+    return line.strip()
+
+
+class CueParser:
+    """
+    Line-at-a-time VTT parser behind iter_cues. Keeps its state between
+    feed() calls, so a file that is still being written can be parsed as it
+    grows (see live.VttTail).
+
+    Usage:
+        parser = CueParser()
+        for line in lines:
+            cue = parser.feed(line)   # a Cue when `line` completed one, else None
+        last = parser.flush()         # the final, unterminated cue (or None)
+    """
+
+    __slots__ = ("recent", "timing", "new_lines")
+
+    def __init__(self, window: int = 8):
+        self.recent = deque(maxlen=window)
+        self.timing = None  # raw "start --> end" line, parsed only for cues we yield
+        self.new_lines = []
+
+    def _make_cue(self) -> Cue:
+        start, _, rest = self.timing.partition("-->")
+        fields = rest.split()
+        end = _parse_timestamp(fields[0]) if fields else None
+        cue = Cue(_parse_timestamp(start.strip()), end, " ".join(self.new_lines))
+        self.new_lines = []
+        return cue
 
-            # Skip noise
-            if (
-                not line
-                or line.startswith(("WEBVTT", "Kind:", "Language:"))
-                or "-->" in line
-                or re.match(r"^\[\w+\]$", line)  # [Music], [Applause], etc.
-            ):
-                continue
+    def feed(self, raw: str):
+        """Parse one line; returns the Cue it completed, if any."""
+        line = raw.strip()
 
-            # Remove tags like <00:00:16.760><c>word</c>
-            cleaned_line = re.sub(r"<\d{2}:\d{2}:\d{2}\.\d{3}><c>(.*?)</c>", r"\1", line)
+        if not line:
+            # blank line terminates the current cue
+            return self._make_cue() if self.new_lines else None
 
-            # Avoid duplicates
-            if cleaned_line not in seen_lines:
-                subtitle_lines.append(cleaned_line)
-                seen_lines.add(cleaned_line)
+        if "-->" in line:
+            cue = self._make_cue() if self.new_lines else None
+            self.timing = line
+            return cue
+
+        # header/noise lines before the first cue or between cues
+        if self.timing is None or line.startswith(_HEADER_PREFIXES) or _NOISE_RE.match(line):
+            return None
+
+        cleaned_line = _clean_line(line)
+        if cleaned_line and cleaned_line not in self.recent:
+            self.recent.append(cleaned_line)
+            self.new_lines.append(cleaned_line)
+        return None
+
+    def flush(self):
+        """Return the cue still being collected (at end of input), or None."""
+        return self._make_cue() if self.new_lines else None
+
+
+def iter_cues(vtt_file, window: int = 8) -> Iterator[Cue]:
+    """
+    Stream caption cues from a VTT file.
+
+    YouTube auto-captions are "rolling": every cue repeats the previous line
+    before adding a new one, and short 10ms cues repeat it yet again. Lines
+    seen within the last `window` lines are dropped, so each spoken line is
+    yielded once while sentences legitimately repeated later in the video
+    are kept. Memory use is bounded by the window, not the file size.
+
+    Args:
+        vtt_file (str): Path to the .vtt file.
+        window (int): Number of recent lines used for duplicate collapsing.
+
+    Yields:
+        Cue: (start, end, text) with only the text that was new in the cue.
+    """
+    parser = CueParser(window)
+    feed = parser.feed
+    with open(vtt_file, 'r', encoding='utf-8') as file:
+        for raw in file:
+            cue = feed(raw)
+            if cue is not None:
+                yield cue
+    cue = parser.flush()
+    if cue is not None:
+        yield cue
+
+
+def extract_clean_subtitles(vtt_file):
+    """Return the de-duplicated transcript text of a VTT file as one string."""
+    with metrics.span("clean") as span:
+        texts = [cue.text for cue in iter_cues(vtt_file)]
+        span.count("cues", len(texts))
+        return " ".join(texts)
 
-    return " ".join(subtitle_lines)
 
 def get_youtube_video_id(url):
     """
@@ -46,8 +147,6 @@ def get_youtube_video_id(url):
 
     match = re.search(youtube_regex, url) # Changed match to search as it's more appropriate for finding the pattern anywhere in the string
 
-    video_id = match.group(6)
-
     if match:
-        return video_id
+        return match.group(6)
     return url
\ No newline at end of file
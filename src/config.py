@@ -5,4 +5,63 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Transcript artifact store (extractor.TranscriptStore)
+TRANSCRIPT_SOURCE_DIR = os.getenv("TRANSCRIPT_SOURCE_DIR") or None  # copy VTTs from here instead of running yt-dlp
+TRANSCRIPT_COMPRESS = os.getenv("TRANSCRIPT_COMPRESS", "false").lower() in ("1", "true", "yes")  # gzip cleaned text
+
+# Embeddings
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")  # "openai" or "local"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./chroma_db/embedding_cache.sqlite")
+
+# Vector index
+CORPUS_COLLECTION = os.getenv("CORPUS_COLLECTION", "yt_corpus")  # one collection holding every video's chunks
+PER_VIDEO_COLLECTIONS = os.getenv("PER_VIDEO_COLLECTIONS", "false").lower() in ("1", "true", "yes")  # legacy layout
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" or "flat" (flatstore.FlatVectorStore)
+FLAT_DTYPE = os.getenv("FLAT_DTYPE", "float32")  # "float32", "float16" or "int8" storage for flat collections
+
+# Chat model
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")  # "openai" or "stub" (local stand-in)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # e.g. a local mock endpoint
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "32"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))  # concurrent LLM calls in chain.batch_query_chain
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "2"))  # background indexing jobs run at once (jobs.py)
+
+# Client-side rate limits and retries of OpenAI requests (ratelimit.py); 0 disables a limit
+OPENAI_CHAT_RPM = int(os.getenv("OPENAI_CHAT_RPM", "500"))
+OPENAI_CHAT_TPM = int(os.getenv("OPENAI_CHAT_TPM", "200000"))
+OPENAI_EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+OPENAI_EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per retry
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))  # wait to pack small requests
+
+# Context assembly (context.pack_context)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+# Map-reduce summary tree for whole-video questions (summary.py)
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "1500"))  # transcript tokens per leaf section
+SUMMARY_FANOUT = int(os.getenv("SUMMARY_FANOUT", "4"))  # summaries merged per parent node
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "120"))
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))  # concurrent LLM calls while building
+SUMMARY_AT_INDEX = os.getenv("SUMMARY_AT_INDEX", "true").lower() in ("1", "true", "yes")  # build when indexing
+
+# Multi-turn chat (conversation.py): memory given to the follow-up question rewriter
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "600"))  # rolling summary + recent turns
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "3"))  # turns kept word for word
+CHAT_SUMMARY_WORDS = int(os.getenv("CHAT_SUMMARY_WORDS", "120"))  # length of the rolling summary
+
+# Semantic answer cache in front of query_chain
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or None  # e.g. ./chroma_db/answer_cache.json
+
 # Add any other configuration settings or constants here as needed.
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Context assembly for query_chain.
+
+Retrieved chunks are reranked with maximal marginal relevance (so the prompt
+is not four near-identical hits), adjacent or overlapping chunks of the same
+video are merged (dropping the duplicated overlap text), and the result is
+packed into a fixed token budget measured with tiktoken.
+"""
+from splitter import count_tokens
+
+_MIN_OVERLAP = 20  # shortest shared text treated as a real chunk overlap, in characters
+
+
+def _overlap_length(a, b, max_overlap=2000):
+    """Length of the longest suffix of `a` that is also a prefix of `b`."""
+    if len(a) < _MIN_OVERLAP or len(b) < _MIN_OVERLAP:
+        return 0
+    probe = b[:_MIN_OVERLAP]
+    start = max(0, len(a) - max_overlap)
+    pos = a.find(probe, start)
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _adjacent(meta_a, meta_b):
+    if not meta_a or not meta_b or meta_a.get("video_id") != meta_b.get("video_id"):
+        return False
+    index_a, index_b = meta_a.get("chunk_index"), meta_b.get("chunk_index")
+    if index_a is not None and index_b is not None and index_b - index_a == 1:
+        return True
+    start_b, end_a = meta_b.get("start"), meta_a.get("end")
+    return start_b is not None and end_a is not None and meta_a.get("start", 0) <= start_b <= end_a
+
+
+def merge_adjacent(pieces):
+    """
+    Merge (text, metadata) pieces that are consecutive or overlapping chunks of the
+    same video, in transcript order, removing text duplicated by chunk overlap.
+    Pieces without position metadata are kept as they are.
+    """
+    def position(item):
+        meta = item[1][1] or {}
+        return (meta.get("video_id") or "", meta.get("start", meta.get("chunk_index", 0)) or 0, item[0])
+
+    # group by video in transcript order, remembering the first (best) rank of each group
+    ordered = sorted(enumerate(pieces), key=position)
+    merged = []  # [best_rank, text, metadata]
+    for rank, (text, meta) in ordered:
+        if merged and _adjacent(merged[-1][2], meta):
+            last = merged[-1]
+            overlap = _overlap_length(last[1], text)
+            if overlap or text not in last[1]:
+                last[1] = last[1] + (text[overlap:] if overlap else " " + text)
+            merged_meta = dict(last[2])
+            if meta.get("end") is not None:
+                merged_meta["end"] = max(merged_meta.get("end", meta["end"]), meta["end"])
+            merged_meta["chunk_index"] = meta.get("chunk_index", merged_meta.get("chunk_index"))
+            last[2] = merged_meta
+            last[0] = min(last[0], rank)
+        else:
+            merged.append([rank, text, dict(meta or {})])
+    merged.sort(key=lambda item: item[0])
+    return [(text, meta) for _, text, meta in merged]
+
+
+def mmr_order(query_vector, doc_vectors, k, lambda_mult=0.7):
+    """
+    Maximal marginal relevance: greedily pick documents that are relevant to the
+    query but dissimilar to those already picked. Vectors must be L2-normalised.
+    Relevance mixes cosine similarity with the incoming retrieval rank, so fused
+    BM25/vector ranking still counts. Returns the picked indices in order.
+    """
+    import numpy as np
+
+    n = len(doc_vectors)
+    if n == 0:
+        return []
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    rank_prior = 1.0 - np.arange(n, dtype=np.float32) / n
+    relevance = 0.5 * (docs @ np.asarray(query_vector, dtype=np.float32)) + 0.5 * rank_prior
+    pairwise = docs @ docs.T
+    picked, candidates = [], list(range(n))
+    while candidates and len(picked) < k:
+        if picked:
+            redundancy = pairwise[np.ix_(candidates, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates), dtype=np.float32)
+        scores = lambda_mult * relevance[candidates] - (1 - lambda_mult) * redundancy
+        best = candidates[int(np.argmax(scores))]
+        picked.append(best)
+        candidates.remove(best)
+    return picked
+
+
+_embedder = None
+
+
+def _local_embedder():
+    global _embedder
+    if _embedder is None:
+        from embeddings import HashingEmbeddingFunction
+        _embedder = HashingEmbeddingFunction()
+    return _embedder
+
+
+def pack_context(query, documents, metadatas=None, n_results=4, token_budget=1000, lambda_mult=0.7,
+                 separator="\n\n", embed=None):
+    """
+    Assemble the prompt context from retrieved candidates (best first).
+
+    Picks `n_results` candidates by MMR (local hashing vectors, no API calls),
+    merges adjacent/overlapping chunks of the same video, and packs them in
+    rank order while they fit in `token_budget` tokens. `embed` may replace
+    the hashing embedder (callable(texts) -> matrix), e.g. with precomputed
+    vectors shared across a batch of questions.
+
+    Returns (context_text, report) where report has the naive top-n join's
+    token count ("baseline_tokens"), the packed count ("context_tokens"),
+    "tokens_saved" and "sources" (text and metadata of each packed piece).
+    """
+    metadatas = metadatas or [{} for _ in documents]
+    baseline = separator.join(documents[:n_results])
+    baseline_tokens = count_tokens(baseline)
+
+    if len(documents) > 1:
+        vectors = (embed or _local_embedder().embed)([query] + list(documents))
+        picked = mmr_order(vectors[0], vectors[1:], n_results, lambda_mult)
+    else:
+        picked = list(range(len(documents)))
+    pieces = merge_adjacent([(documents[i], metadatas[i]) for i in picked])
+
+    parts, sources, used = [], [], 0
+    separator_tokens = count_tokens(separator)
+    for text, meta in pieces:
+        tokens = count_tokens(text) + (separator_tokens if parts else 0)
+        if used + tokens > token_budget:
+            continue
+        parts.append(text)
+        sources.append(dict(meta or {}, text=text))
+        used += tokens
+    if not parts and pieces:
+        # even the best piece is over budget: keep a proportional prefix of it
+        text, meta = pieces[0]
+        parts.append(text[:max(1, len(text) * token_budget // max(1, count_tokens(text)))])
+        sources.append(dict(meta or {}, text=parts[0]))
+
+    context = separator.join(parts)
+    context_tokens = count_tokens(context)
+    report = {
+        "candidates": len(documents),
+        "pieces": len(parts),
+        "baseline_tokens": baseline_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": baseline_tokens - context_tokens,
+        "sources": sources,
+    }
+    return context, report
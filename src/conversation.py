@@ -0,0 +1,269 @@
+"""
+Multi-turn chat on top of chain.query_chain.
+
+query_chain answers one question at a time, so a follow-up like "and what
+happened after that?" would be searched as it is. A ChatSession keeps a
+small memory of the conversation: a rolling summary of the older turns plus
+the last few turns word for word, together at most CHAT_MEMORY_TOKENS tokens.
+A follow-up is rewritten with that memory into a standalone question, which
+is what gets retrieved, cached and answered. When turns leave the recent
+window they are folded into the summary with one small LLM call (the old
+summary and those turns, never the whole conversation), in the background
+while the user reads the answer. So the prompts of a turn stay the same size
+however long the conversation gets.
+
+Questions that do not refer back to the conversation are not rewritten.
+
+Usage:
+    session = ChatSession(vector_store, where={"video_id": video_id})
+    session.ask("Who won the first set?")
+    session.ask("And what happened after that?")   # searched as a standalone question
+
+    for token in session.stream("Why?", timings=timings):
+        print(token, end="")
+
+    # Streamlit: one session per scope, kept in st.session_state across reruns
+    session = get_chat_session(st.session_state, vector_store, where)
+"""
+import json
+import re
+import threading
+import time
+
+import config
+from metrics import metrics
+from splitter import count_tokens
+
+# questions that lean on the conversation: pronouns, "after that", "what about ...", ...
+_FOLLOW_UP_RE = re.compile(
+    r"^\s*(?:and|but|so|or|then|also|what about|how about)\b"
+    r"|\b(?:it|its|he|him|his|she|her|they|them|their|this|that|these|those|there|then"
+    r"|after|before|earlier|later|else|again|same|other|another|more|previous)\b",
+    re.IGNORECASE,
+)
+# "Standalone question: ..." and similar labels some models put in front of the rewrite
+_LABEL_RE = re.compile(r"^\s*(?:standalone|rewritten)?\s*(?:question|query)\s*:\s*", re.IGNORECASE)
+# a reply that starts with one of the memory's labels is the prompt repeated, not a rewrite or summary
+_MEMORY_LABEL_RE = re.compile(
+    r"^\s*(?:User|Assistant|Summary so far|New exchanges|Summary of the earlier conversation)\s*:\s*",
+    re.IGNORECASE)
+
+
+def is_follow_up(question):
+    """True when `question` may refer back to the conversation (pronouns, "after that", "why?", ...)."""
+    return len(question.split()) <= 3 or bool(_FOLLOW_UP_RE.search(question))
+
+
+def _trim(text, max_tokens, keep="end"):
+    """`text` cut to at most `max_tokens` tokens by dropping whole words from the start (keep="end") or the end."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    lo, hi = 0, len(words)
+    # binary search for the most words that fit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        part = words[len(words) - mid:] if keep == "end" else words[:mid]
+        if count_tokens(" ".join(part)) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[len(words) - lo:] if keep == "end" else words[:lo])
+
+
+def _format_turns(turns):
+    return "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+
+
+def _invoke(llm, prompt_text, **attrs):
+    with metrics.span("llm", **attrs) as span:
+        try:
+            answer = llm.invoke(prompt_text).content
+        except Exception as e:
+            raise RuntimeError(f"Failed to get a response from the chat model. Error: {e}")
+        span.count("prompt_tokens", count_tokens(prompt_text))
+        span.count("completion_tokens", count_tokens(answer))
+    return answer.strip()
+
+
+class ChatSession:
+    """
+    One conversation about the videos `where` selects in `vector_store`.
+
+    Args:
+        vector_store: VectorStore to answer from, as for query_chain.
+        where (dict): Metadata filter of the retrieval, e.g. {"video_id": "abc"}.
+        llm: Chat model for rewriting, summarizing and answering (default llm.get_chat_model()).
+        memory_tokens (int): Budget of the summary plus the recent turns (default config.CHAT_MEMORY_TOKENS).
+        recent_turns (int): Turns kept word for word (default config.CHAT_RECENT_TURNS).
+
+    Attributes:
+        turns: Every turn, oldest first, as {"question", "query", "answer", "citations"}
+            dicts ("query" is the standalone question that was searched).
+        summary: Rolling summary of the turns that left the recent window.
+    """
+
+    def __init__(self, vector_store=None, where=None, llm=None, memory_tokens=None, recent_turns=None, n_results=4,
+                 use_cache=True):
+        self.vector_store = vector_store
+        self.where = where
+        self.llm = llm
+        self.memory_tokens = memory_tokens or config.CHAT_MEMORY_TOKENS
+        self.recent_turns = max(1, recent_turns or config.CHAT_RECENT_TURNS)
+        self.n_results = n_results
+        self.use_cache = use_cache
+        self.turns = []
+        self.summary = ""
+        self._folded = 0  # turns[:_folded] are in the summary
+        self._folding = None  # thread updating the summary
+
+    @property
+    def summary_tokens(self):
+        # the summary gets a third of the memory, the recent turns the rest
+        return max(1, self.memory_tokens // 3)
+
+    @property
+    def recent(self):
+        """Turns still kept word for word."""
+        return self.turns[self._folded:]
+
+    def _model(self):
+        if self.llm is not None:
+            return self.llm
+        from llm import get_chat_model
+        return get_chat_model()
+
+    def clear(self):
+        """Start the conversation over."""
+        self._wait()
+        self.turns, self.summary, self._folded = [], "", 0
+
+    def _wait(self):
+        if self._folding is not None:
+            self._folding.join()
+            self._folding = None
+
+    def memory(self):
+        """The conversation as the rewriter sees it: summary and recent turns, at most memory_tokens tokens."""
+        self._wait()
+        parts = [f"Summary of the earlier conversation: {self.summary}"] if self.summary else []
+        if self.recent:
+            parts.append(_format_turns(self.recent))
+        return _trim("\n\n".join(parts), self.memory_tokens)
+
+    def rewrite(self, question):
+        """
+        Standalone version of `question` for retrieval, written by the chat
+        model from the memory. Questions that do not need the conversation are
+        returned as they are; without a model, or when the model's rewrite is
+        unusable, the previous question is put in front of the follow-up.
+        """
+        if not self.turns or not is_follow_up(question):
+            return question
+        # the previous search (its opening, so a chain of follow-ups does not keep growing) and the follow-up
+        fallback = f"{_trim(self.turns[-1]['query'], 48, keep='start')} {question}"
+        llm = self._model()
+        if llm is None:
+            return fallback
+        from prompt import CONDENSE_PROMPT_TEMPLATE
+
+        prompt_text = CONDENSE_PROMPT_TEMPLATE.format(context=self.memory(), query=question)
+        lines = [line for line in _invoke(llm, prompt_text, rewrite=True).splitlines() if line.strip()]
+        rewritten = _LABEL_RE.sub("", lines[0]).strip().strip('"') if lines else ""
+        # a rewrite much longer than the question is an answer or an echo, not a question,
+        # and one that starts with a memory label is the prompt repeated
+        if (not rewritten or _MEMORY_LABEL_RE.match(rewritten)
+                or count_tokens(rewritten) > max(64, 4 * count_tokens(question))):
+            return fallback
+        return rewritten
+
+    def ask(self, question, citations=None, context_report=None):
+        """
+        Answer `question` in the context of the conversation and remember the
+        turn. `citations` and `context_report` are filled in as by query_chain.
+        """
+        from chain import query_chain
+
+        sources = []
+        with metrics.span("chat_turn") as span:
+            query = self.rewrite(question)
+            span.set(rewritten=query != question)
+            answer = query_chain(query, self.vector_store, n_results=self.n_results, use_cache=self.use_cache,
+                                 llm=self.llm, context_report=context_report, citations=sources, where=self.where)
+        if citations is not None:
+            citations.extend(sources)
+        self._remember(question, query, answer, sources)
+        return answer
+
+    def stream(self, question, timings=None):
+        """
+        Streaming ask(): yields answer tokens (see chain.stream_query_chain).
+        `timings` also receives the searched "query" and "rewrite_s". The turn
+        is remembered once the answer is complete.
+        """
+        from chain import stream_query_chain
+
+        timings = timings if timings is not None else {}
+        start = time.perf_counter()
+        query = self.rewrite(question)
+        timings.update(query=query, rewrite_s=time.perf_counter() - start)
+        parts = []
+        for token in stream_query_chain(query, self.vector_store, n_results=self.n_results, use_cache=self.use_cache,
+                                        llm=self.llm, timings=timings, where=self.where):
+            parts.append(token)
+            yield token
+        self._remember(question, query, "".join(parts), timings.get("citations", []))
+
+    def _remember(self, question, query, answer, citations):
+        self._wait()
+        self.turns.append({"question": question, "query": query, "answer": answer, "citations": citations})
+        first = self._folded
+        # move the oldest turns out of the window until it fits (the newest turn always stays)
+        while len(self.recent) > 1 and (len(self.recent) > self.recent_turns or
+                                         count_tokens(self.summary) + count_tokens(_format_turns(self.recent))
+                                         > self.memory_tokens):
+            self._folded += 1
+        if self._folded > first:
+            folded = self.turns[first:self._folded]
+            # summarize while the user reads the answer; memory() waits for it
+            self._folding = threading.Thread(target=self._fold, args=(folded,), name="chat-memory", daemon=True)
+            self._folding.start()
+
+    def _fold(self, turns):
+        """Fold `turns` into the rolling summary."""
+        new = _trim(_format_turns(turns), self.memory_tokens)
+        llm = self._model()
+        if llm is None:
+            # no model: keep the latest words of the conversation instead of a summary
+            self.summary = _trim(f"{self.summary} {new}".strip(), self.summary_tokens)
+            return
+        from prompt import CHAT_MEMORY_PROMPT_TEMPLATE, CHAT_MEMORY_QUERY
+
+        context = (f"Summary so far: {self.summary}\n\n" if self.summary else "") + f"New exchanges:\n{new}"
+        prompt_text = CHAT_MEMORY_PROMPT_TEMPLATE.format(max_words=config.CHAT_SUMMARY_WORDS, context=context,
+                                                         query=CHAT_MEMORY_QUERY)
+        try:
+            summary = _invoke(llm, prompt_text, chat_memory=True)
+        except RuntimeError:
+            # runs in the background, so nobody would see the error: keep the latest words as without a model
+            self.summary = _trim(f"{self.summary} {new}".strip(), self.summary_tokens)
+            return
+        # a label in front would be wrapped again by the next prompt ("Summary so far: Summary so far: ...")
+        self.summary = _trim(_MEMORY_LABEL_RE.sub("", summary, count=1).strip(), self.summary_tokens, keep="start")
+
+
+def get_chat_session(state, vector_store=None, where=None, **kwargs):
+    """
+    The ChatSession of `where` kept in `state` (a dict, or st.session_state so
+    the conversation survives Streamlit reruns), created on first use with
+    `kwargs`. Each scope (video, or set of videos) has its own conversation.
+    """
+    if "chat_sessions" not in state:
+        state["chat_sessions"] = {}
+    sessions = state["chat_sessions"]
+    key = json.dumps(where, sort_keys=True)
+    session = sessions.get(key)
+    if session is None:
+        session = sessions[key] = ChatSession(vector_store, where=where, **kwargs)
+    session.vector_store = vector_store
+    return session
@@ -0,0 +1,436 @@
+"""
+Compact, memory-mapped per-video cue store.
+
+A parsed VTT is stored as NumPy arrays of cue start and end times and byte
+offsets into one UTF-8 text blob (the cue texts joined by single spaces,
+i.e. the cleaned transcript), as raw files that can be appended to:
+
+    <root>/<video_id>/CURRENT                 {"version", "cues", "bytes"} of the store to read
+    <root>/<video_id>/<version>/starts.f64    float64, one per cue
+    <root>/<video_id>/<version>/ends.f64      float64, one per cue
+    <root>/<video_id>/<version>/max_ends.f64  float64, running max of ends (interval index)
+    <root>/<video_id>/<version>/offsets.i64   int64, byte offset of each cue in text.bin
+    <root>/<video_id>/<version>/text.bin      UTF-8 text
+
+A rebuild writes a new version and then swaps CURRENT, so readers in other
+processes (Streamlit while live.py rebuilds) always find a whole store, and
+the files they have mapped are never touched. Old versions are removed once
+nothing maps them any more (on Windows a mapped file cannot be deleted, so
+that may wait for a later build). append() adds cues to the end of the
+current version's files and then swaps in a CURRENT with the new counts;
+readers only map the first "cues"/"bytes" of each file, so they never see
+a half-written cue either, and a growing transcript costs O(new cues) per
+append instead of a rebuild of the whole store.
+
+Opening a store only maps the files, so it costs the same for a 5 minute
+and a 5 hour video. Time ranges are found by binary search (searchsorted),
+chunk text can be mapped back to the timestamps of the cues it came from,
+and a phrase to the times it is mentioned at.
+
+Usage:
+    CueStore.build(iter_cues(vtt_path), cue_store_path(persist_directory, video_id))
+    CueStore.append(new_cues, cue_store_path(persist_directory, video_id))   # live transcripts
+    cues = CueStore.open(cue_store_path(persist_directory, video_id))
+    cues.between(12 * 60, 13 * 60 + 30)   # [Cue, ...]
+    cues.locate(chunk_text)                # (start, end) or None
+    cues.find("Antonsen")                  # [start, ...] of the cues mentioning it
+"""
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from cleaner import Cue
+
+_ARRAYS = {"starts": np.float64, "ends": np.float64, "max_ends": np.float64, "offsets": np.int64}
+_SUFFIXES = {np.float64: ".f64", np.int64: ".i64"}
+_SEPARATOR = b" "
+_CURRENT = "CURRENT"
+
+# "12:00", "1:02:03"; ranges like "12:00-13:30", "from 12:00 to 13:30", "between 12:00 and 13:30"
+_TIME = r"(\d{1,2}(?::\d{2}){1,2})"
+_RANGE_RE = re.compile(_TIME + r"\s*(?:-|–|to|and|until)\s*" + _TIME)
+# "where is X mentioned", "when does he talk about X", "jump to where X is mentioned"
+_SPEAKER = r"(?:(?:he|she|they|someone|anyone|the speaker|it)\s+)?"
+_MENTION_VERB = r"(?:mention(?:s|ed)?|talk(?:s|ed)? about|discuss(?:es|ed)?|say(?:s)?|said|brought up)"
+_MENTION_RE = re.compile(
+    r"^\s*(?:(?:where|when)\s+(?:is|are|was|were)\s+(?P<passive>.+?)\s+" + _MENTION_VERB + r"\b"
+    r"|(?:where|when)\s+(?:does|did|do)\s+" + _SPEAKER + _MENTION_VERB + r"\s+(?P<active>.+)"
+    r"|(?:jump|skip|go)\s+to\s+(?:where|when)\s+(?:(?P<jump_passive>.+?)\s+(?:is|are|was|were)\s+"
+    + _MENTION_VERB + r"\b|" + _SPEAKER + _MENTION_VERB + r"\s+(?P<jump_active>.+))"
+    r"|(?:jump|skip|go)\s+to\s+(?:the\s+)?(?:part|bit|moment)\s+(?:about|with|on)\s+(?P<part>.+))",
+    re.IGNORECASE,
+)
+
+
+def cue_store_path(persist_directory, video_id):
+    """Where the cue store of `video_id` lives, next to its collection."""
+    return os.path.join(persist_directory, "cues", video_id)
+
+
+def format_timestamp(seconds):
+    """Seconds as M:SS, or H:MM:SS for an hour or more."""
+    seconds = int(seconds or 0)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+def parse_time_range(text):
+    """Return (start_s, end_s) for the first "12:00 to 13:30"-style range in `text`, or None."""
+    match = _RANGE_RE.search(text)
+    if not match:
+        return None
+    start, end = (sum(int(part) * 60 ** i for i, part in enumerate(reversed(value.split(":"))))
+                  for value in match.groups())
+    return (start, end) if start <= end else (end, start)
+
+
+def parse_mention(text):
+    """Return X of a "where is X mentioned" / "jump to where X is mentioned" question, or None."""
+    match = _MENTION_RE.search(text)
+    if match is None:
+        return None
+    phrase = next(group for group in match.groups() if group)
+    phrase = phrase.strip().rstrip("?.!").strip().strip("\"'“”‘’")
+    # "the net shot" is said as "that net shot" just as often
+    phrase = re.sub(r"^(?:the|a|an)\s+", "", phrase, flags=re.IGNORECASE)
+    # "when was it mentioned that ..." has no phrase to look for
+    return phrase if phrase and phrase.lower() not in ("it", "this", "that", "he", "she", "they") else None
+
+
+class CueStore:
+    """Read-only view of one video's cue store; create with build() or open()."""
+
+    def __init__(self, path, starts, ends, max_ends, offsets, blob):
+        self.path = path
+        self.starts = starts
+        self.ends = ends
+        self.max_ends = max_ends
+        self.offsets = offsets
+        self._blob = blob
+
+    @classmethod
+    def build(cls, cues, path):
+        """
+        Write the cue store for an iterable of cleaner.Cue records (or
+        (start, end, text) tuples) to directory `path`, replacing any
+        existing store, and return it opened.
+        """
+        arrays, text = _encode(cues)
+        # write a new version and point CURRENT at it, so readers never see half a store or none
+        os.makedirs(path, exist_ok=True)
+        version = f"v{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        version_path = os.path.join(path, version)
+        os.makedirs(version_path)
+        for name, array in arrays.items():
+            with open(_array_path(version_path, name), "wb") as f:
+                f.write(array.tobytes())
+        with open(os.path.join(version_path, "text.bin"), "wb") as f:
+            f.write(text)
+        _write_current(path, {"version": version, "cues": len(arrays["starts"]), "bytes": len(text)})
+        _remove_old_versions(path, version)
+        _open_stores.pop(os.path.abspath(path), None)
+        return cls.open(path)
+
+    @classmethod
+    def append(cls, cues, path):
+        """
+        Add cues to the end of the store at `path` (building it if there is
+        none) and return it opened. Writes only the new cues; stores written
+        before append() existed are rebuilt once.
+        """
+        cues = list(cues)
+        current = _read_current(path)
+        if current is None or current.get("cues") is None:
+            old = list(cls.open(path)) if current is not None else []
+            return cls.build(old + cues, path)
+        if not cues:
+            return cls.open(path)
+        directory = os.path.join(path, current["version"])
+        count, size = current["cues"], current["bytes"]
+        last_max_end = -np.inf
+        if count:
+            last_max_end = float(np.fromfile(_array_path(directory, "max_ends"), dtype=np.float64, count=1,
+                                             offset=(count - 1) * 8)[0])
+        arrays, text = _encode(cues, count=count, position=size, max_end=last_max_end)
+        for name, array in arrays.items():
+            _append_file(_array_path(directory, name), count * array.itemsize, array.tobytes())
+        _append_file(os.path.join(directory, "text.bin"), size, text)
+        # the new cues only become visible to readers here
+        _write_current(path, {"version": current["version"], "cues": count + len(cues), "bytes": size + len(text)})
+        _open_stores.pop(os.path.abspath(path), None)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map the store at `path` (O(1): no array or text is read up front)."""
+        for _ in range(3):
+            current = _read_current(path)
+            try:
+                return cls._open_version(path, current)
+            except FileNotFoundError:
+                # a rebuild swapped CURRENT and removed this version between the two reads
+                if current == _read_current(path):
+                    raise
+        return cls._open_version(path, _read_current(path))
+
+    @classmethod
+    def _open_version(cls, path, current):
+        if current is None:
+            raise FileNotFoundError(f"No cue store at {path}")
+        directory = os.path.join(path, current["version"]) if current.get("version") else path
+        count, size = current.get("cues"), current.get("bytes")
+        if count is None:
+            # written before stores could be appended to: .npy arrays, n + 1 offsets
+            arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS]
+        else:
+            # np.memmap cannot map an empty file either
+            arrays = [np.memmap(_array_path(directory, name), dtype=dtype, mode="r", shape=(count,)) if count
+                      else np.empty(0, dtype=dtype) for name, dtype in _ARRAYS.items()]
+        with open(os.path.join(directory, "text.bin"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size if size is None else size
+            # mmap cannot map an empty file
+            blob = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+        return cls(path, *arrays, blob)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return (self.cue(i) for i in range(len(self)))
+
+    def _offset(self, index):
+        # offsets has one entry per cue (n + 1 in old stores): the text ends where the blob does
+        return int(self.offsets[index]) if index < len(self) else len(self._blob)
+
+    def _text(self, first, last):
+        """Text of cues first..last-1 as stored (joined by single spaces)."""
+        if first >= last:
+            return ""
+        return self._blob[self._offset(first):self._offset(last)].decode("utf-8").strip()
+
+    def cue(self, index):
+        return Cue(float(self.starts[index]), float(self.ends[index]), self._text(index, index + 1))
+
+    @property
+    def text(self):
+        """The whole cleaned transcript."""
+        return self._text(0, len(self))
+
+    def _range(self, start, end):
+        # cues overlapping [start, end]: begin before `end` and end after `start`
+        first = int(np.searchsorted(self.max_ends, start, side="left"))
+        last = int(np.searchsorted(self.starts, end, side="right"))
+        return first, max(first, last)
+
+    def between(self, start, end):
+        """Cues overlapping the time range [start, end] (seconds), in order."""
+        first, last = self._range(start, end)
+        return [self.cue(i) for i in range(first, last) if self.ends[i] >= start]
+
+    def text_between(self, start, end):
+        """Transcript text spoken between `start` and `end` seconds."""
+        return " ".join(cue.text for cue in self.between(start, end))
+
+    def _cue_at(self, byte_offset):
+        return max(0, int(np.searchsorted(self.offsets, byte_offset, side="right")) - 1)
+
+    def locate(self, text):
+        """
+        Map chunk text back to (start, end) seconds of the cues it spans, or
+        None if it is not found. Falls back to matching the chunk's opening and
+        closing words when the full text differs (e.g. whitespace normalised
+        by the splitter).
+        """
+        if not len(self) or not text:
+            return None
+        data = text.strip().encode("utf-8")
+        position = self._blob.find(data)
+        if position >= 0:
+            end_position = position + len(data) - 1
+        else:
+            words = text.split()
+            head = " ".join(words[:8]).encode("utf-8")
+            tail = " ".join(words[-8:]).encode("utf-8")
+            position = self._blob.find(head) if head else -1
+            if position < 0:
+                return None
+            tail_position = self._blob.find(tail, position)
+            end_position = (tail_position + len(tail) if tail_position >= 0 else position + len(head)) - 1
+        first = self._cue_at(position)
+        last = self._cue_at(end_position)
+        return float(self.starts[first]), float(self.ends[first:last + 1].max())
+
+    def find(self, phrase, limit=20):
+        """Start times (seconds) of the cues where `phrase` is mentioned, case-insensitively."""
+        pattern = re.compile(re.escape(phrase.strip().encode("utf-8")), re.IGNORECASE)
+        times = []
+        for match in pattern.finditer(self._blob):
+            start = float(self.starts[self._cue_at(match.start())])
+            if not times or times[-1] != start:
+                times.append(start)
+            if len(times) >= limit:
+                break
+        return times
+
+
+def _encode(cues, count=0, position=0, max_end=-np.inf):
+    """
+    Arrays and text bytes of `cues`, to go after `count` cues whose text is
+    `position` bytes long and whose ends reach up to `max_end`.
+    """
+    starts, ends, offsets, parts = [], [], [], []
+    for start, end, text in cues:
+        data = text.encode("utf-8")
+        if count or parts:
+            parts.append(_SEPARATOR)
+            position += len(_SEPARATOR)
+        starts.append(start)
+        ends.append(start if end is None else end)
+        offsets.append(position)
+        parts.append(data)
+        position += len(data)
+    ends_array = np.asarray(ends, dtype=np.float64)
+    arrays = {
+        "starts": np.asarray(starts, dtype=np.float64),
+        "ends": ends_array,
+        # rolling captions overlap, so ends are not sorted; their running max is
+        "max_ends": np.maximum.accumulate(np.maximum(ends_array, max_end)) if len(ends_array) else ends_array,
+        "offsets": np.asarray(offsets, dtype=np.int64),
+    }
+    return arrays, b"".join(parts)
+
+
+def _array_path(directory, name):
+    return os.path.join(directory, name + _SUFFIXES[_ARRAYS[name]])
+
+
+def _append_file(file_path, size, data):
+    with open(file_path, "r+b") as f:
+        # bytes past `size` are from an append that never reached CURRENT
+        if f.seek(0, os.SEEK_END) != size:
+            f.truncate(size)
+            f.seek(size)
+        f.write(data)
+
+
+def _read_current(path):
+    """
+    CURRENT of the store at `path` as {"version", "cues", "bytes"}; for stores
+    written before versions {} (the files are in `path` itself), None if
+    there is no store.
+    """
+    try:
+        with open(os.path.join(path, _CURRENT), "r", encoding="utf-8") as f:
+            data = f.read().strip()
+    except FileNotFoundError:
+        return {} if os.path.exists(os.path.join(path, "text.bin")) else None
+    try:
+        return json.loads(data)
+    except ValueError:
+        # just the version name, written before stores could be appended to
+        return {"version": data}
+
+
+def _write_current(path, current):
+    fd, tmp_path = tempfile.mkstemp(dir=path, prefix=f"{_CURRENT}.", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(current, f)
+    os.replace(tmp_path, os.path.join(path, _CURRENT))
+
+
+def _version_time(version):
+    match = re.match(r"v(\d+)-", version)
+    return int(match.group(1)) if match else 0
+
+
+def _remove_old_versions(path, keep):
+    for entry in os.listdir(path):
+        entry_path = os.path.join(path, entry)
+        if entry == keep or entry == _CURRENT or entry.startswith(f"{_CURRENT}."):
+            continue
+        if os.path.isdir(entry_path):
+            if _version_time(entry) > _version_time(keep):
+                # a newer build still being written
+                continue
+            # fails on Windows while another process still maps the files; the next build retries
+            shutil.rmtree(entry_path, ignore_errors=True)
+        elif os.path.splitext(entry)[1] in (".npy", ".bin"):
+            # files of a store written before versions
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+
+def _store_stamp(path):
+    """Changes whenever a build swaps in a new version (None if no store was built)."""
+    for name in (_CURRENT, "text.bin"):
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except FileNotFoundError:
+            continue
+        return name, stat.st_ino, stat.st_mtime_ns
+    return None
+
+
+_open_stores = {}
+_open_stores_lock = threading.Lock()
+
+
+def get_cue_store(persist_directory, video_id):
+    """
+    Process-wide opened CueStore for `video_id`, or None if none was built.
+    Reopened when another process (e.g. live.py) has built a new version.
+    """
+    path = os.path.abspath(cue_store_path(persist_directory, video_id))
+    stamp = _store_stamp(path)
+    with _open_stores_lock:
+        if stamp is None:
+            _open_stores.pop(path, None)
+            return None
+        cached = _open_stores.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = _open_stores[path] = (stamp, CueStore.open(path))
+        return cached[1]
+
+
+def cite(sources, persist_directory=None, quote_chars=120):
+    """
+    Turn context sources (pack_context's report["sources"]: text plus chunk
+    metadata) into timestamped citations. Chunks without start/end metadata
+    are located in their video's cue store, when there is one.
+
+    Returns a list of {"video_id", "title", "start", "end", "label", "url", "quote"}
+    dicts ("title" is None when the chunk has no title metadata).
+    """
+    citations = []
+    for source in sources:
+        video_id = source.get("video_id")
+        start, end = source.get("start"), source.get("end")
+        if start is None and video_id and persist_directory:
+            cues = get_cue_store(persist_directory, video_id)
+            located = cues.locate(source.get("text", "")) if cues is not None else None
+            if located:
+                start, end = located
+        if start is None:
+            continue
+        end = start if end is None else end
+        quote = " ".join(source.get("text", "").split())
+        citations.append({
+            "video_id": video_id,
+            "title": source.get("title"),
+            "start": start,
+            "end": end,
+            "label": f"{format_timestamp(start)}-{format_timestamp(end)}",
+            "url": f"https://youtu.be/{video_id}?t={int(start)}" if video_id else None,
+            "quote": quote if len(quote) <= quote_chars else quote[:quote_chars].rsplit(" ", 1)[0] + "...",
+        })
+    return citations
@@ -1,24 +1,279 @@
+import hashlib
 import os
-from langchain_openai import OpenAIEmbeddings
-import chromadb
-from chromadb.config import Settings
-from datetime import datetime
-
-def create_embeddings(transcript_chunks):
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    return [embeddings.embed(chunk) for chunk in transcript_chunks]
-
-def store_embeddings_in_vector_store(embeddings, collection_name="yt_collection"):
-    client = chromadb.Client(Settings(persist_directory="./chroma_db"))
-    collection = client.create_collection(
-        name=collection_name,
-        embedding_function=OpenAIEmbeddings(model="text-embedding-3-small"),
-        metadata={
-            "description": "YouTube video transcript embeddings",
-            "created": str(datetime.now())
-        }
-    )
-    collection.add(
-        documents=embeddings,
-        ids=[str(i) for i in range(len(embeddings))]
-    )
\ No newline at end of file
+import re
+import sqlite3
+import threading
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import metrics
+from splitter import count_tokens
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk embedding cache.
+
+    Vectors are keyed by sha256(model, text) and stored as float32 blobs in a
+    single sqlite file, so re-indexing a video (or text shared across videos)
+    never calls the embedding API twice for the same input.
+    """
+
+    def __init__(self, path=config.EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache."""
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # stay under sqlite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items):
+        """Store {key: vector} pairs."""
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+_openai_batchers = {}
+_openai_batchers_lock = threading.Lock()
+
+
+def _openai_embed_fn(model):
+    """
+    OpenAI embeddings for `model`, sent through the process-wide "embeddings"
+    rate limiter and packed into shared batches (ratelimit.EmbeddingBatcher),
+    so concurrent embedders do not exceed the account limits together.
+    """
+    with _openai_batchers_lock:
+        batcher = _openai_batchers.get(model)
+        if batcher is None:
+            from openai import OpenAI
+            from ratelimit import EmbeddingBatcher, get_limiter
+
+            # retries are the rate limiter's job: the client's own would bypass its buckets
+            client = OpenAI(base_url=config.OPENAI_BASE_URL, max_retries=0)
+
+            def embed(texts):
+                response = client.embeddings.create(model=model, input=list(texts))
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            batcher = _openai_batchers[model] = EmbeddingBatcher(
+                embed, get_limiter("embeddings"), max_batch=config.EMBEDDING_BATCH_SIZE,
+                window=config.EMBEDDING_BATCH_WINDOW_MS / 1000, max_workers=config.EMBEDDING_MAX_WORKERS)
+    return batcher.embed
+
+
+class BatchEmbedder:
+    """
+    Single embedding layer for the pipeline.
+
+    Texts are de-duplicated, looked up in the cache, and the misses are sent in
+    batches bounded by both count and tokens, with up to `max_workers` batches
+    in flight at once. Instances also implement Chroma's embedding-function
+    interface, so they can be passed straight to create_collection.
+
+    Args:
+        embed_fn: callable(list[str]) -> list[vector]. Defaults to OpenAI
+            embeddings for `model`; pass a local function to work offline.
+        model (str): Model name; part of the cache key, so give local
+            stand-ins their own name.
+        batch_size (int): Max texts per request.
+        max_batch_tokens (int): Max tokens per request.
+        max_workers (int): Max concurrent requests.
+        cache (EmbeddingCache | str | None): Cache instance or sqlite path; None disables caching.
+    """
+
+    def __init__(self, embed_fn=None, model=config.EMBEDDING_MODEL, batch_size=config.EMBEDDING_BATCH_SIZE,
+                 max_batch_tokens=100_000, max_workers=config.EMBEDDING_MAX_WORKERS, cache=None):
+        self.embed_fn = embed_fn
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max_workers
+        self.cache = EmbeddingCache(cache) if isinstance(cache, str) else cache
+        self.api_calls = 0
+        self.cache_hits = 0
+        self._stats_lock = threading.Lock()
+
+    def _batches(self, texts):
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
+
+    def _embed_batch(self, batch):
+        if self.embed_fn is None:
+            self.embed_fn = _openai_embed_fn(self.model)
+        vectors = self.embed_fn(batch)
+        with self._stats_lock:
+            self.api_calls += 1
+        # round through float32 so fresh and cached vectors are identical
+        return [array("f", v).tolist() for v in vectors]
+
+    def embed(self, texts):
+        """Embed `texts`, returning one vector per input in the same order."""
+        texts = list(texts)
+        with metrics.span("embed", model=self.model) as span:
+            vectors = self._embed(texts, span)
+        return [vectors[text] for text in texts]
+
+    def _embed(self, texts, span):
+        unique = list(dict.fromkeys(texts))
+        keys = {text: EmbeddingCache.key(self.model, text) for text in unique}
+        span.count("texts", len(texts))
+
+        vectors = {}
+        if self.cache is not None:
+            cached = self.cache.get_many(keys.values())
+            vectors = {text: cached[key] for text, key in keys.items() if key in cached}
+            with self._stats_lock:
+                self.cache_hits += len(vectors)
+            span.count("cache_hits", len(vectors))
+
+        missing = [text for text in unique if text not in vectors]
+        if missing:
+            sized = list(self._batches(missing))
+            batches = [batch for batch, _ in sized]
+            span.count("embedding_requests", len(batches))
+            span.count("tokens", sum(tokens for _, tokens in sized))
+            if len(batches) == 1 or self.max_workers <= 1:
+                results = [self._embed_batch(b) for b in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                    results = list(pool.map(self._embed_batch, batches))
+            fresh = {}
+            for batch, batch_vectors in zip(batches, results):
+                fresh.update(zip(batch, batch_vectors))
+            vectors.update(fresh)
+            if self.cache is not None:
+                self.cache.put_many({keys[text]: vector for text, vector in fresh.items()})
+        return vectors
+
+    # --- Chroma embedding-function interface ---
+
+    def __call__(self, input):
+        return self.embed(input)
+
+    def embed_query(self, input):
+        return self.embed(input)
+
+    @staticmethod
+    def name():
+        return "batch_embedder"
+
+    def get_config(self):
+        return {"model": self.model, "batch_size": self.batch_size, "max_workers": self.max_workers}
+
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbeddingFunction:
+    """
+    Offline, dependency-light embedding function (NumPy feature hashing).
+
+    Words and word bigrams are hashed (crc32, so stable across processes) into
+    `n_features` signed buckets, term counts are dampened with log1p and rows
+    are L2-normalised. No model, no network: suitable for CI, cheap
+    pre-filtering and cost-free bulk re-indexing. Implements Chroma's
+    embedding-function interface.
+
+    Usage:
+        ef = HashingEmbeddingFunction()
+        init_vectorstore(collection_name="...", embedding_function=ef)  # or embedding_function="local"
+    """
+
+    def __init__(self, n_features=1024, bigrams=True):
+        self.n_features = n_features
+        self.bigrams = bigrams
+        self._buckets = {}  # token -> signed bucket, memoised since vocabularies are small
+
+    def _bucket(self, token):
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            h = zlib.crc32(token.encode("utf-8"))
+            # top bit chooses the sign so collisions cancel out on average
+            bucket = (h % self.n_features) + 1
+            bucket = -bucket if h & 0x80000000 else bucket
+            if len(self._buckets) < 1_000_000:
+                self._buckets[token] = bucket
+        return bucket
+
+    def embed(self, texts):
+        """Return a float32 matrix of shape (len(texts), n_features)."""
+        import numpy as np
+
+        rows, buckets = [], []
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(text.lower())
+            tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])] if self.bigrams else words
+            buckets.extend(self._bucket(t) for t in tokens)
+            rows.extend([row] * len(tokens))
+
+        n = len(texts)
+        signed = np.asarray(buckets, dtype=np.int64)
+        flat = np.asarray(rows, dtype=np.int64) * self.n_features + (np.abs(signed) - 1)
+        counts = np.bincount(flat, weights=np.sign(signed), minlength=n * self.n_features)
+        matrix = counts.reshape(n, self.n_features).astype(np.float32)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    # --- Chroma embedding-function interface ---
+
+    def __call__(self, input):
+        return list(self.embed(input))
+
+    def embed_query(self, input):
+        return self.__call__(input)
+
+    @staticmethod
+    def name():
+        return "local_hashing"
+
+    def get_config(self):
+        return {"n_features": self.n_features, "bigrams": self.bigrams}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction(**config)
+
+
+def create_embeddings(transcript_chunks, embed_fn=None, cache=config.EMBEDDING_CACHE_PATH):
+    texts = [getattr(chunk, "page_content", chunk) for chunk in transcript_chunks]
+    return BatchEmbedder(embed_fn=embed_fn, cache=cache).embed(texts)
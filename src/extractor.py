@@ -1,8 +1,16 @@
+import gzip
+import json
 import os
+import shutil
 import subprocess
 import glob
+import threading
+from datetime import datetime
 from urllib.parse import urlparse, parse_qs
 
+import config
+from metrics import metrics
+
 def _extract_video_id(video_url: str) -> str:
     """Extract YouTube video id from common URL forms."""
     if not video_url:
@@ -22,7 +30,7 @@ def _find_subtitle_file(video_id: str, output_dir: str):
                 os.path.join(output_dir, f"{video_id}_*.*")]
     candidates = []
     for p in patterns:
-        candidates.extend(glob.glob(p))
+        candidates.extend(c for c in glob.glob(p) if not c.endswith(".title"))
     # prefer vtt then srt then any
     for ext in (".vtt", ".srt"):
         for c in candidates:
@@ -30,24 +38,31 @@ def _find_subtitle_file(video_id: str, output_dir: str):
                 return c
     return candidates[0] if candidates else None
 
-def download_transcript(video_url: str, lang: str = "en", output_dir: str = "transcripts") -> str | None:
+class YtDlpFetcher:
     """
-    Use yt-dlp to download subtitles for a YouTube video.
-    Returns the path to the downloaded subtitle file (vtt/srt) or None on failure.
+    Fetch subtitles with one yt-dlp run that asks for both manual and
+    auto-generated subtitles (yt-dlp keeps the manual ones when both exist).
 
-    Notes:
-    - Requires yt-dlp installed and available on PATH.
-    - Tries auto-generated subtitles first, falls back to normal subtitles.
+    Fetchers are callables `fetcher(video_url, video_id, lang, output_dir)`
+    returning the path of the downloaded .vtt/.srt file or None.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    video_id = _extract_video_id(video_url)
-    if not video_id:
-        return None
-
-    # output template: store as <video_id>.<ext>
-    out_template = os.path.join(output_dir, f"{video_id}.%(ext)s")
 
-    def _run_yt_dlp(args):
+    def __call__(self, video_url, video_id, lang, output_dir):
+        # output template: store as <video_id>.<lang>.<ext>
+        out_template = os.path.join(output_dir, f"{video_id}.%(ext)s")
+        args = [
+            "--skip-download",
+            "--write-sub",
+            "--write-auto-sub",
+            "--sub-lang", lang,
+            "--sub-format", "vtt",
+            "-o", out_template,
+            # the title goes into chunk metadata (see transcript_metadata)
+            "--print-to-file", "%(title)s", os.path.join(output_dir, f"{video_id}.title"),
+        ]
+        span = metrics.current_span()
+        if span is not None:
+            span.count("ytdlp_runs")
         try:
             completed = subprocess.run(
                 ["yt-dlp"] + args + [video_url],
@@ -55,37 +70,211 @@ def download_transcript(video_url: str, lang: str = "en", output_dir: str = "tra
                 text=True,
                 check=False
             )
-            return completed.returncode == 0
         except FileNotFoundError:
             raise RuntimeError("yt-dlp not found. Install yt-dlp and ensure it's on PATH.")
+        if completed.returncode != 0:
+            return None
 
-    # Try auto-generated subtitles (better coverage)
-    args = [
-        "--skip-download",
-        "--write-auto-sub",
-        "--sub-lang", lang,
-        "--sub-format", "vtt",
-        "-o", out_template,
-    ]
-    ok = _run_yt_dlp(args)
-
-    # If that failed, try regular subtitles (if provided)
-    if not ok:
-        args = [
-            "--skip-download",
-            "--write-sub",
-            "--sub-lang", lang,
-            "--sub-format", "vtt",
-            "-o", out_template,
-        ]
-        ok = _run_yt_dlp(args)
+        expected = os.path.join(output_dir, f"{video_id}.{lang}.vtt")
+        if os.path.exists(expected):
+            return expected
+        # locate the downloaded file (prefer .vtt then .srt)
+        return _find_subtitle_file(video_id, output_dir)
+
+
+class LocalFetcher:
+    """
+    Stand-in for yt-dlp that copies `<video_id>.<lang>.vtt` (or any
+    `<video_id>.*.vtt`) from a local directory, e.g. src/transcripts.
+    Useful for tests and offline runs.
+    """
+
+    def __init__(self, source_dir):
+        self.source_dir = source_dir
+
+    def __call__(self, video_url, video_id, lang, output_dir):
+        source = os.path.join(self.source_dir, f"{video_id}.{lang}.vtt")
+        if not os.path.exists(source):
+            source = _find_subtitle_file(video_id, self.source_dir)
+        if not source:
+            return None
+        target = os.path.join(output_dir, f"{video_id}.{lang}.vtt")
+        if os.path.abspath(source) != os.path.abspath(target):
+            shutil.copyfile(source, target)
+        return target
+
+
+def transcript_metadata(vtt_path):
+    """
+    Chunk metadata known from a stored subtitle file: "language" from its
+    <video_id>.<lang>.vtt name and "title" from the <video_id>.title file
+    yt-dlp writes next to it. Keys that are unknown are left out.
+    """
+    metadata = {}
+    parts = os.path.basename(vtt_path).split(".")
+    if len(parts) >= 3:
+        metadata["language"] = parts[-2]
+    title_path = os.path.join(os.path.dirname(vtt_path), f"{parts[0]}.title")
+    if os.path.exists(title_path):
+        with open(title_path, "r", encoding="utf-8") as f:
+            title = f.read().strip()
+        if title:
+            metadata["title"] = title
+    return metadata
 
-    if not ok:
-        return None
 
-    # locate the downloaded file (prefer .vtt then .srt)
-    subtitle_file = _find_subtitle_file(video_id, output_dir)
-    return subtitle_file
+def default_fetcher():
+    """yt-dlp, or a LocalFetcher when config.TRANSCRIPT_SOURCE_DIR is set."""
+    if config.TRANSCRIPT_SOURCE_DIR:
+        return LocalFetcher(config.TRANSCRIPT_SOURCE_DIR)
+    return YtDlpFetcher()
+
+
+class TranscriptStore:
+    """
+    Artifact store for downloaded subtitles and their cleaned text.
+
+    A JSON manifest in `root` maps "<video_id>:<lang>" to the stored files, so
+    a transcript that is already on disk is returned without running the
+    fetcher again. VTT files already in `root` (named <video_id>.<lang>.vtt)
+    are picked up and added to the manifest on first use.
+
+    Args:
+        root (str): Directory holding the artifacts and manifest.json.
+        fetcher: callable(video_url, video_id, lang, output_dir) -> path or None.
+            Defaults to default_fetcher().
+        compress (bool): Store cleaned text gzip-compressed (.txt.gz).
+
+    Usage:
+        store = TranscriptStore("transcripts", fetcher=LocalFetcher("src/transcripts"))
+        vtt_path = store.get_vtt("https://www.youtube.com/watch?v=_4Uob271bOM")
+        text = store.get_text("_4Uob271bOM")
+    """
+
+    def __init__(self, root="transcripts", fetcher=None, compress=False):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.fetcher = fetcher or default_fetcher()
+        self.compress = compress
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self._lock = threading.RLock()
+        self._inflight = {}  # key -> lock, so concurrent requests for one video fetch once
+        self.entries = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(video_id, lang):
+        return f"{video_id}:{lang}"
+
+    def _save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _record(self, video_id, lang, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(self.key(video_id, lang), {})
+            entry.update(fields)
+            self._save()
+
+    def _artifact(self, video_id, lang, field):
+        """Path of a stored artifact, or None if it is not in the manifest or was deleted."""
+        with self._lock:
+            name = self.entries.get(self.key(video_id, lang), {}).get(field)
+        path = os.path.join(self.root, name) if name else None
+        return path if path and os.path.exists(path) else None
+
+    def _video_lock(self, key):
+        with self._lock:
+            return self._inflight.setdefault(key, threading.Lock())
+
+    def get_vtt(self, video, lang="en", fetcher=None):
+        """
+        Return the path of the subtitle file for `video` (URL or video id),
+        fetching it only if it is not stored yet. Returns None if the fetch fails.
+        """
+        video_id = _extract_video_id(video)
+        if not video_id:
+            return None
+        key = self.key(video_id, lang)
+        with metrics.span("download", video_id=video_id, lang=lang) as span:
+            with self._video_lock(key):
+                path = self._artifact(video_id, lang, "vtt")
+                if path is None:
+                    existing = os.path.join(self.root, f"{video_id}.{lang}.vtt")
+                    if os.path.exists(existing):
+                        # downloaded before the manifest existed (or copied in by hand)
+                        self._record(video_id, lang, vtt=os.path.basename(existing), source="existing")
+                        path = existing
+                if path is not None:
+                    span.count("transcript_cache_hits")
+                    span.set(cached=True)
+                    return path
+
+                url = video if "://" in video else f"https://www.youtube.com/watch?v={video_id}"
+                path = (fetcher or self.fetcher)(url, video_id, lang, self.root)
+                span.set(cached=False, ok=path is not None)
+                if path is None:
+                    return None
+                self._record(video_id, lang, vtt=os.path.relpath(path, self.root),
+                             fetched=datetime.now().isoformat(timespec="seconds"))
+                return path
+
+    def get_text(self, video, lang="en", fetcher=None):
+        """
+        Return the cleaned transcript text (cleaner.extract_clean_subtitles) of
+        `video`, computing and storing it on first use. Returns None if the
+        subtitles cannot be fetched.
+        """
+        video_id = _extract_video_id(video)
+        path = self._artifact(video_id, lang, "text")
+        if path is not None:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8") as f:
+                return f.read()
+
+        vtt_path = self.get_vtt(video, lang, fetcher)
+        if vtt_path is None:
+            return None
+        from cleaner import extract_clean_subtitles
+        text = extract_clean_subtitles(vtt_path)
+
+        name = f"{video_id}.{lang}.txt" + (".gz" if self.compress else "")
+        opener = gzip.open if self.compress else open
+        with opener(os.path.join(self.root, name), "wt", encoding="utf-8") as f:
+            f.write(text)
+        self._record(video_id, lang, text=name)
+        return text
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_transcript_store(root="transcripts"):
+    """Process-wide TranscriptStore for `root` (default fetcher, config.TRANSCRIPT_COMPRESS)."""
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = TranscriptStore(root, compress=config.TRANSCRIPT_COMPRESS)
+        return store
+
+
+def download_transcript(video_url: str, lang: str = "en", output_dir: str = "transcripts", fetcher=None) -> str | None:
+    """
+    Return the path to the subtitle file (vtt/srt) of a YouTube video, or None on failure.
+
+    Subtitles already in `output_dir` are returned straight from the
+    transcript store (see TranscriptStore); otherwise they are fetched with
+    `fetcher` (default: one yt-dlp run for manual and auto-generated subs).
+
+    Notes:
+    - The default fetcher requires yt-dlp installed and available on PATH.
+    """
+    return get_transcript_store(output_dir).get_vtt(video_url, lang, fetcher)
 
 def extract_transcript(video_url: str, file_path: str) -> str | None:
     """
@@ -0,0 +1,77 @@
+"""
+Pre-generate answers to a list of questions with chain.batch_query_chain.
+
+Answers are written as JSON lines as soon as each one completes, so a long
+run can be followed (or interrupted) without losing finished answers.
+
+Usage:
+    python src/faq.py --vtt src/transcripts/CglNRNrMFGM.en.vtt --questions questions.txt --output faq.jsonl
+    python src/faq.py --collection yt_corpus --video-id CglNRNrMFGM --questions questions.txt
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from chain import batch_query_chain
+from cleaner import iter_cues
+from cuestore import CueStore, cue_store_path
+from extractor import transcript_metadata
+from splitter import TokenTextSplitter
+from vectorstore import collection_name_for, init_vectorstore
+
+
+def read_questions(path):
+    """Non-empty, non-comment lines of `path`."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer many questions about a video in one batch.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--vtt", help="Index this <video_id>.*.vtt file first, then ask about it")
+    target.add_argument("--collection", help="Ask against this existing collection")
+    parser.add_argument("--video-id", help="Only retrieve from this video (default with --vtt: that video)")
+    parser.add_argument("--questions", required=True, help="File with one question per line")
+    parser.add_argument("--output", help="JSON lines output (default: stdout)")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--embedding", choices=["openai", "local"],
+                        help="Embedding backend (default: EMBEDDING_BACKEND from config)")
+    parser.add_argument("--max-workers", type=int, help="Concurrent LLM calls (default: BATCH_MAX_WORKERS)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the answer cache")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    video_id = args.video_id
+    if args.vtt:
+        video_id = video_id or os.path.basename(args.vtt).split(".")[0]
+        _, store = init_vectorstore(args.persist_directory, collection_name_for(video_id),
+                                    embedding_function=args.embedding)
+        splitter = TokenTextSplitter()
+        cues = list(iter_cues(args.vtt))
+        CueStore.build(cues, cue_store_path(args.persist_directory, video_id))
+        store.add_documents(list(splitter.split_cues(cues, video_id=video_id,
+                                                     metadata=transcript_metadata(args.vtt))),
+                            video_id=video_id, splitter_config=splitter.config)
+    else:
+        _, store = init_vectorstore(args.persist_directory, args.collection, embedding_function=args.embedding)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start, failed = time.perf_counter(), 0
+    try:
+        for result in batch_query_chain(questions, store, use_cache=not args.no_cache, max_workers=args.max_workers,
+                                         where={"video_id": video_id} if video_id else None):
+            failed += "error" in result
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Answered {len(questions) - failed}/{len(questions)} questions in {time.perf_counter() - start:.2f}s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Flat NumPy vector index: a lightweight alternative to Chroma for small collections.
+
+Each collection is a directory under <persist_directory>/flat/<name>/:
+
+    vectors.bin    row-major matrix of L2-normalised vectors (float32, float16 or int8)
+    scales.bin     float32 per-row scale (int8 only: row = int8 * scale)
+    records.jsonl  one {"id", "document", "metadata"} line per row
+    meta.json      dimension, dtype and collection metadata
+
+The matrix is memory-mapped and searched exhaustively (exact cosine top-k
+with argpartition), which beats an HNSW graph for the few hundred chunks a
+video has. float16 halves and int8 quarters the bytes per vector; int8 also
+scores faster than float16, whose conversion NumPy does not vectorise, at a
+small recall cost (see bench_vectorstore.py).
+
+FlatVectorStore keeps VectorStore's surface (create_collection, add_documents,
+query, hybrid_query, is_indexed, ...), so it can be swapped in with
+init_vectorstore(..., backend="flat") or VECTOR_BACKEND=flat.
+
+Usage:
+    store = FlatVectorStore(dtype="int8")
+    store.create_collection("abc_collection", embedding_function=HashingEmbeddingFunction())
+    store.add_documents(docs, video_id="abc", splitter_config=splitter.config)
+    store.query(["Who won?"], n_results=4)
+"""
+from datetime import datetime
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from vectorstore import VectorStore, default_embedding_function, video_ids_in
+
+DTYPES = ("float32", "float16", "int8")
+_BLOCK_ROWS = 1024  # rows converted to float32 at a time when scoring (small enough to stay in cache)
+
+
+_OPERATORS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+}
+
+
+def matches(metadata, where):
+    """True if `metadata` passes a Chroma-style `where` filter ($and/$or, $eq, $in, $gt, ...)."""
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_OPERATORS[op](value, target) for op, target in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class FlatCollection:
+    """
+    A single flat collection. Implements the subset of chromadb's Collection
+    API that VectorStore uses: name, metadata, count, upsert, get, query, delete, modify.
+    """
+
+    def __init__(self, path, name, embedding_function, dtype="float32", metadata=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}'. Use one of {DTYPES}.")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.name = name
+        self._embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, "meta.json")
+        self._vectors_path = os.path.join(path, "vectors.bin")
+        self._scales_path = os.path.join(path, "scales.bin")
+        self._records_path = os.path.join(path, "records.jsonl")
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = {"dimension": None, "dtype": dtype, "metadata": dict(metadata or {})}
+        self.dimension = meta["dimension"]
+        self.dtype = meta["dtype"]  # an existing collection keeps the dtype it was created with
+        self.metadata = meta["metadata"]
+        self._save_meta()
+
+        self._ids, self._documents, self._metadatas = [], [], []
+        if os.path.exists(self._records_path):
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._ids.append(record["id"])
+                    self._documents.append(record["document"])
+                    self._metadatas.append(record["metadata"])
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._map()
+
+    def _save_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "dtype": self.dtype, "metadata": self.metadata}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _map(self):
+        """(Re)map the vector files after they grew."""
+        self._matrix = self._scales = None
+        self._video_rows = None  # rows changed: rebuild the per-video lists on demand
+        if not self._ids or self.dimension is None:
+            return
+        shape = (len(self._ids), self.dimension)
+        self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=shape)
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r+", shape=(len(self._ids),))
+
+    def _embed(self, texts):
+        vectors = np.asarray(self._embedding_function(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _encode(self, vectors):
+        """Normalised float32 rows -> (stored rows, int8 scales or None)."""
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    def count(self):
+        return len(self._ids)
+
+    def modify(self, name=None, metadata=None):
+        with self._lock:
+            if metadata is not None:
+                self.metadata = dict(metadata)
+            self._save_meta()
+
+    def stored_metadata(self):
+        """The collection metadata as in meta.json now (re-read, and kept as .metadata)."""
+        with self._lock:
+            try:
+                with open(self._meta_path, "r", encoding="utf-8") as f:
+                    self.metadata = json.load(f)["metadata"]
+            except (OSError, ValueError, KeyError):
+                pass
+            return dict(self.metadata or {})
+
+    def upsert(self, documents, ids, metadatas=None, embeddings=None):
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                self._save_meta()
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Collection '{self.name}' holds {self.dimension}-d vectors, got {vectors.shape[1]}-d.")
+            rows, scales = self._encode(vectors)
+
+            new = []
+            for i, doc_id in enumerate(ids):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    new.append(i)
+                    continue
+                # existing id: overwrite in place (records.jsonl is rewritten below)
+                self._matrix[row] = rows[i]
+                if scales is not None:
+                    self._scales[row] = scales[i]
+                self._documents[row], self._metadatas[row] = documents[i], metadatas[i]
+
+            if new:
+                with open(self._vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(rows[new]).tobytes())
+                if scales is not None:
+                    with open(self._scales_path, "ab") as f:
+                        f.write(scales[new].tobytes())
+                for i in new:
+                    self._rows[ids[i]] = len(self._ids)
+                    self._ids.append(ids[i])
+                    self._documents.append(documents[i])
+                    self._metadatas.append(metadatas[i])
+
+            if len(new) < len(ids):
+                self._write_records()
+            elif new:
+                with open(self._records_path, "a", encoding="utf-8") as f:
+                    for i in new:
+                        f.write(json.dumps({"id": ids[i], "document": documents[i], "metadata": metadatas[i]}) + "\n")
+            self._map()
+
+    add = upsert
+
+    def delete(self, ids):
+        """Remove rows by id; the remaining rows are compacted into new files."""
+        with self._lock:
+            drop = {self._rows[i] for i in ids if i in self._rows}
+            if not drop:
+                return
+            keep = [row for row in range(len(self._ids)) if row not in drop]
+            matrix = np.array(self._matrix[keep]) if self._matrix is not None else None
+            scales = np.array(self._scales[keep]) if self._scales is not None else None
+            self._matrix = self._scales = None  # release the maps before replacing the files
+            for path, array in ((self._vectors_path, matrix), (self._scales_path, scales)):
+                if array is not None:
+                    with open(path + ".tmp", "wb") as f:
+                        f.write(array.tobytes())
+                    os.replace(path + ".tmp", path)
+            self._ids = [self._ids[row] for row in keep]
+            self._documents = [self._documents[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._write_records()
+            self._map()
+
+    def _write_records(self):
+        tmp_path = self._records_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, document, metadata in zip(self._ids, self._documents, self._metadatas):
+                f.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}) + "\n")
+        os.replace(tmp_path, self._records_path)
+
+    def _result(self, rows, include):
+        result = {"ids": [self._ids[r] for r in rows]}
+        if include is None or "documents" in include:
+            result["documents"] = [self._documents[r] for r in rows]
+        if include is None or "metadatas" in include:
+            result["metadatas"] = [self._metadatas[r] for r in rows]
+        if include is not None and "embeddings" in include:
+            result["embeddings"] = self.vectors(rows)
+        return result
+
+    def _rows_by_video(self):
+        if self._video_rows is None:
+            self._video_rows = {}
+            for row, metadata in enumerate(self._metadatas):
+                self._video_rows.setdefault((metadata or {}).get("video_id"), []).append(row)
+        return self._video_rows
+
+    def _select(self, ids=None, where=None):
+        videos = video_ids_in(where) if ids is None else None
+        if videos is not None:
+            # the usual filter is by video: start from those videos' rows instead of every row
+            by_video = self._rows_by_video()
+            rows = sorted(row for video_id in videos for row in by_video.get(video_id, []))
+            if set(where) == {"video_id"}:
+                return rows
+        else:
+            rows = range(len(self._ids)) if ids is None else [self._rows[i] for i in ids if i in self._rows]
+        if where:
+            rows = [r for r in rows if matches(self._metadatas[r], where)]
+        return list(rows)
+
+    def vectors(self, rows):
+        """Stored rows as float32 (int8 rows are scaled back)."""
+        if not len(rows):
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        vectors = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= np.asarray(self._scales[rows])[:, None]
+        return vectors
+
+    def get(self, ids=None, where=None, include=None):
+        with self._lock:
+            return self._result(self._select(ids, where), include)
+
+    def scores(self, query_vectors, rows=None):
+        """Cosine similarity of each query to each stored row (or only to `rows`): (queries, rows) float32."""
+        with self._lock:
+            matrix, scales = self._matrix, self._scales
+        if rows is not None:
+            matrix = matrix[rows]
+            scales = scales[rows] if scales is not None else None
+        out = np.empty((len(query_vectors), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), _BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + _BLOCK_ROWS], dtype=np.float32)
+            out[:, start:start + len(block)] = query_vectors @ block.T
+        if scales is not None:
+            out *= np.asarray(scales)[None, :]
+        return out
+
+    def query(self, query_texts=None, n_results=10, include=None, ids=None, where=None, query_embeddings=None):
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        queries = (np.asarray(query_embeddings, dtype=np.float32) if query_embeddings is not None
+                   else self._embed(query_texts))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if not self._ids:
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+
+        candidates = None if ids is None and not where else np.asarray(self._select(ids, where), dtype=np.int64)
+        if candidates is not None and not len(candidates):
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+        scores = self.scores(queries, candidates)
+        k = min(n_results, scores.shape[1])
+        for row_scores in scores:
+            # exact top-k: O(n) partition, then sort only the k winners
+            top = np.argpartition(-row_scores, k - 1)[:k] if k < len(row_scores) else np.arange(len(row_scores))
+            top = top[np.argsort(-row_scores[top], kind="stable")]
+            rows = candidates[top] if candidates is not None else top
+            part = self._result([int(r) for r in rows], include)
+            for key in ("ids", "documents", "metadatas"):
+                if key in part:
+                    result[key].append(part[key])
+            result["distances"].append([float(1 - s) for s in row_scores[top]])
+        return {key: value for key, value in result.items() if value or key == "ids"}
+
+    def bytes_per_vector(self):
+        """Bytes stored per vector (matrix row plus int8 scale)."""
+        if not self.dimension:
+            return 0
+        return self.dimension * np.dtype(self.dtype).itemsize + (4 if self.dtype == "int8" else 0)
+
+
+class FlatVectorStore(VectorStore):
+    """
+    VectorStore backed by FlatCollection instead of a Chroma client.
+
+    Args:
+        persist_directory (str): Same root as the Chroma store; collections go in <root>/flat/.
+        dtype (str): "float32", "float16" or "int8" storage for new collections.
+    """
+
+    def __init__(self, persist_directory="./chroma_db", dtype="float32"):
+        os.makedirs(persist_directory, exist_ok=True)
+        self.persist_directory = persist_directory
+        self.dtype = dtype
+        self.client = None
+        self.collection = None
+        self.lexical_index = None
+        self.embedding_function = None
+        self._write_lock = threading.RLock()
+
+    def _collection_path(self, name):
+        return os.path.join(self.persist_directory, "flat", name)
+
+    def _open_collection(self, name, embedding_function=None, description=""):
+        if embedding_function is None:
+            embedding_function = default_embedding_function(self.persist_directory)
+        self.collection = FlatCollection(self._collection_path(name), name, embedding_function, dtype=self.dtype,
+                                         metadata={"description": description, "created": str(datetime.now())})
+
+    def _stored_metadata(self):
+        # another store on the same directory may have marked videos since this one was opened
+        return self.collection.stored_metadata()
+
+    def _vector_query(self, query_texts, n_results, include, where=None, ids=None):
+        # flat queries are exact already, and filtered ones only score the matching rows
+        return self.collection.query(query_texts=query_texts, n_results=n_results, include=include, ids=ids,
+                                     where=where)
+
+    def list_collections(self):
+        root = os.path.join(self.persist_directory, "flat")
+        return sorted(name for name in os.listdir(root)
+                      if os.path.exists(os.path.join(root, name, "meta.json"))) if os.path.isdir(root) else []
+
+    def delete_collection(self, name):
+        """Remove a collection, its files and its BM25 index."""
+        if self.collection is not None and self.collection.name == name:
+            self.collection = None
+            self.lexical_index = None
+        shutil.rmtree(self._collection_path(name), ignore_errors=True)
+        from lexical import remove_index
+        remove_index(self._lexical_path(name))
@@ -0,0 +1,202 @@
+"""
+Bulk ingestion of many videos into the vector store.
+
+Downloads run in a thread pool, VTT parsing and splitting in a process pool,
+and chunks are embedded and written per video as soon as they are ready.
+Progress is recorded in a manifest so an interrupted run can be resumed.
+
+Usage:
+    python src/ingest.py --vtt-dir src/transcripts
+    python src/ingest.py --urls urls.txt --download-workers 8
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from cleaner import iter_cues, get_youtube_video_id
+from cuestore import CueStore, cue_store_path
+from extractor import download_transcript, transcript_metadata
+from splitter import Document, TokenTextSplitter
+from summary import build_summary_tree
+from vectorstore import collection_name_for, create_vector_store, default_embedding_function, get_embedding_function
+
+
+def parse_and_split(vtt_path, video_id, chunk_size, cue_store=None):
+    """
+    Process-pool worker: parse a VTT file and chunk it into (text, metadata) pairs.
+    If `cue_store` is a directory, the parsed cues are also written there (see cuestore).
+    """
+    splitter = TokenTextSplitter(chunk_size=chunk_size)
+    cues = list(iter_cues(vtt_path))
+    if cue_store:
+        CueStore.build(cues, cue_store)
+    docs = splitter.split_cues(cues, video_id=video_id, metadata=transcript_metadata(vtt_path))
+    return [(doc.page_content, doc.metadata) for doc in docs]
+
+
+class Manifest:
+    """JSON file of per-video ingestion status, rewritten atomically after each video."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_done(self, video_id, splitter_config):
+        entry = self.entries.get(video_id, {})
+        return entry.get("status") == "done" and entry.get("splitter_config") == splitter_config
+
+    def record(self, video_id, **entry):
+        self.entries[video_id] = entry
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def sources_from_urls(urls_file):
+    """(video_id, url, None) for each non-empty, non-comment line of `urls_file`."""
+    sources = []
+    with open(urls_file, "r", encoding="utf-8") as f:
+        for line in f:
+            url = line.strip()
+            if url and not url.startswith("#"):
+                sources.append((get_youtube_video_id(url), url, None))
+    return sources
+
+
+def sources_from_vtt_dir(vtt_dir):
+    """(video_id, None, path) for each .vtt file; the id is the file name up to the first dot."""
+    sources = []
+    for name in sorted(os.listdir(vtt_dir)):
+        if name.endswith(".vtt"):
+            sources.append((name.split(".")[0], None, os.path.join(vtt_dir, name)))
+    return sources
+
+
+def ingest(sources, collection_name=None, persist_directory="./chroma_db", manifest_path=None,
+           download_workers=8, parse_workers=None, chunk_size=256, embedding_function=None,
+           lang="en", output_dir="transcripts", summarize=False):
+    """
+    Ingest `sources` ((video_id, url, vtt_path) tuples) into the vector store.
+
+    Each video goes into collection_name_for(video_id) (the shared corpus, or
+    its own collection with PER_VIDEO_COLLECTIONS) unless `collection_name`
+    is given. Videos already marked done in the manifest with the same
+    splitter config are skipped. With `summarize`, each video's summary tree
+    (summary.py) is built right after its chunks are written.
+
+    Returns a stats dict with counts, elapsed seconds and videos/sec, chunks/sec.
+    """
+    splitter_config = TokenTextSplitter(chunk_size=chunk_size).config
+    manifest = Manifest(manifest_path or os.path.join(persist_directory, "ingest_manifest.json"))
+    pending = [s for s in sources if not manifest.is_done(s[0], splitter_config)]
+
+    store = create_vector_store(persist_directory)
+    if embedding_function is None:
+        embedding_function = default_embedding_function(persist_directory)
+    if collection_name:
+        store.create_collection(collection_name, embedding_function=embedding_function,
+                                description="YouTube transcripts")
+
+    stats = {"videos": 0, "chunks": 0, "written": 0, "failed": 0, "skipped": len(sources) - len(pending)}
+    start = time.perf_counter()
+
+    def _write(video_id, rows):
+        if not collection_name and getattr(store.collection, "name", None) != collection_name_for(video_id):
+            # all videos share the corpus collection: only (re)open it when the target changes
+            store.create_collection(collection_name_for(video_id), embedding_function=embedding_function,
+                                    description="YouTube transcripts")
+        docs = [Document(text, metadata) for text, metadata in rows]
+        written = store.add_documents(docs, video_id=video_id, splitter_config=splitter_config)
+        stats["videos"] += 1
+        stats["chunks"] += len(docs)
+        stats["written"] += written
+        if summarize and build_summary_tree(docs, video_id, persist_directory=persist_directory,
+                                            indexed=splitter_config) is not None:
+            stats["summarized"] = stats.get("summarized", 0) + 1
+        manifest.record(video_id, status="done", chunks=len(docs), splitter_config=splitter_config)
+
+    def _fail(video_id, error):
+        stats["failed"] += 1
+        manifest.record(video_id, status="failed", error=str(error))
+        print(f"[failed] {video_id}: {error}")
+
+    with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        futures = {}
+        for video_id, url, vtt_path in pending:
+            if vtt_path:
+                futures[parse_pool.submit(parse_and_split, vtt_path, video_id, chunk_size,
+                                          cue_store_path(persist_directory, video_id))] = ("parse", video_id)
+            else:
+                futures[download_pool.submit(download_transcript, url, lang, output_dir)] = ("download", video_id)
+
+        # embed/write on this thread while downloads and parsing continue in the pools
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, video_id = futures.pop(future)
+                try:
+                    result = future.result()
+                    if stage == "download":
+                        if not result:
+                            raise RuntimeError("no subtitles downloaded")
+                        futures[parse_pool.submit(parse_and_split, result, video_id, chunk_size,
+                                                  cue_store_path(persist_directory, video_id))] = ("parse", video_id)
+                    else:
+                        _write(video_id, result)
+                except Exception as e:
+                    _fail(video_id, e)
+
+    elapsed = time.perf_counter() - start
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["videos_per_s"] = round(stats["videos"] / elapsed, 3) if elapsed else 0.0
+    stats["chunks_per_s"] = round(stats["chunks"] / elapsed, 3) if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest YouTube transcripts into the vector store.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--urls", help="File with one YouTube URL per line")
+    source.add_argument("--vtt-dir", help="Directory of existing <video_id>.*.vtt files")
+    parser.add_argument("--collection",
+                        help="Write every video into this collection (default: collection_name_for each video)")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--manifest", help="Progress manifest path (default: <persist-directory>/ingest_manifest.json)")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Chunk size in tokens")
+    parser.add_argument("--embedding", choices=["openai", "local"],
+                        help="Embedding backend (default: EMBEDDING_BACKEND from config)")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--output-dir", default="transcripts", help="Where downloaded subtitles are stored")
+    parser.add_argument("--summaries", action="store_true",
+                        help="Also build each video's summary tree for whole-video questions (uses the chat model)")
+    parser.add_argument("--report", help="Also write the throughput report as JSON to this path")
+    args = parser.parse_args()
+
+    sources = sources_from_urls(args.urls) if args.urls else sources_from_vtt_dir(args.vtt_dir)
+    embedding_function = get_embedding_function(args.embedding, args.persist_directory) if args.embedding else None
+    stats = ingest(sources, collection_name=args.collection, persist_directory=args.persist_directory,
+                   manifest_path=args.manifest, download_workers=args.download_workers,
+                   parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                   embedding_function=embedding_function, lang=args.lang, output_dir=args.output_dir,
+                   summarize=args.summaries)
+
+    print(f"Ingested {stats['videos']} videos ({stats['chunks']} chunks, {stats['written']} new), "
+          f"skipped {stats['skipped']}, failed {stats['failed']} in {stats['elapsed_s']:.2f}s: "
+          f"{stats['videos_per_s']:.2f} videos/s, {stats['chunks_per_s']:.1f} chunks/s")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Background indexing jobs for the Streamlit app.
+
+Indexing a video (download, clean, split, embed and add, summarize) runs on a
+process-wide worker pool instead of inside a Streamlit script run, so the
+session stays responsive and other, already indexed videos can be queried
+meanwhile. Each job follows its own progress through the metrics spans of
+the stages it runs (see metrics.listen), so the UI only has to poll
+job.snapshot().
+
+Usage:
+    manager = JobManager(max_workers=2)
+    job = manager.submit("https://www.youtube.com/watch?v=<id>")
+    job.snapshot()   # {"status": "running", "progress": 55, "message": "...", ...}
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from cleaner import get_youtube_video_id, iter_cues
+from cuestore import CueStore, cue_store_path
+from extractor import download_transcript, transcript_metadata
+from metrics import listen, metrics
+from splitter import TokenTextSplitter
+from vectorstore import collection_name_for, init_vectorstore
+
+# progress range and status message of each indexing stage (driven by metrics spans)
+STAGES = {
+    "download": (0, 30, "Downloading subtitles..."),
+    "clean": (30, 40, "Cleaning transcript..."),
+    "split": (40, 50, "Splitting transcript into chunks..."),
+    "add_documents": (50, 90, "Embedding and adding chunks to the vector store..."),
+    "summarize": (90, 100, "Summarizing sections for whole-video questions..."),
+}
+
+
+class IndexJob:
+    """State of one video's indexing run; updated by the worker, read by the UI."""
+
+    def __init__(self, video_url, video_id, persist_directory="./chroma_db"):
+        self.id = uuid.uuid4().hex[:12]
+        self.video_url = video_url
+        self.video_id = video_id
+        self.collection_name = collection_name_for(video_id)
+        self.persist_directory = persist_directory
+        self.status = "queued"  # queued, running, done or failed
+        self.progress = 0
+        self.message = "Waiting for a free worker..."
+        self.error = None
+        self.chunks = 0
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def _update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def _on_stage(self, event, span, info):
+        if span.name not in STAGES:
+            return
+        low, high, message = STAGES[span.name]
+        if event == "start":
+            self._update(message=message, progress=max(self.progress, low))
+        elif event == "progress" and info["total"]:
+            self._update(message=f"{message} ({info['done']}/{info['total']})",
+                         progress=int(low + (high - low) * info["done"] / info["total"]))
+        elif event == "end":
+            self._update(progress=high)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "video_id": self.video_id,
+                "collection_name": self.collection_name,
+                "status": self.status,
+                "progress": int(self.progress),
+                "message": self.message,
+                "error": self.error,
+                "chunks": self.chunks,
+                "elapsed_s": round((self.finished or time.time()) - self.created, 1),
+            }
+
+
+def index_video(job, splitter=None):
+    """Run the indexing pipeline for `job` (on a worker thread), recording its progress."""
+    splitter = splitter or TokenTextSplitter(chunk_size=256)
+    job._update(status="running", message="Starting...")
+    try:
+        with listen(job._on_stage), metrics.span("index_video", video_id=job.video_id):
+            _, store = init_vectorstore(job.persist_directory, job.collection_name)
+            if store.is_indexed(job.video_id, splitter.config):
+                job._update(status="done", progress=100, message="Video already indexed.")
+                return
+            transcript_file = download_transcript(job.video_url)
+            if not transcript_file:
+                raise RuntimeError("Failed to download transcript.")
+            with metrics.span("clean", video_id=job.video_id) as span:
+                cues = list(iter_cues(transcript_file))
+                span.count("cues", len(cues))
+                # timestamps for citations and time-range questions
+                CueStore.build(cues, cue_store_path(store.persist_directory, job.video_id))
+            if not cues:
+                raise RuntimeError("Failed to clean transcript.")
+            with metrics.span("split", video_id=job.video_id) as span:
+                chunks = list(splitter.split_cues(cues, video_id=job.video_id,
+                                                  metadata=transcript_metadata(transcript_file)))
+                span.count("chunks", len(chunks))
+                span.count("tokens", sum(chunk.metadata["tokens"] for chunk in chunks))
+            store.add_documents(chunks, video_id=job.video_id, splitter_config=splitter.config)
+            job._update(chunks=len(chunks))
+            if config.SUMMARY_AT_INDEX:
+                from summary import build_summary_tree
+                build_summary_tree(chunks, job.video_id, persist_directory=store.persist_directory,
+                                   indexed=splitter.config)
+        job._update(status="done", progress=100, message="Indexing complete.")
+    except Exception as e:
+        job._update(status="failed", error=str(e), message=f"Error: {e}")
+    finally:
+        job._update(finished=time.time())
+
+
+class JobManager:
+    """
+    Process-wide queue of indexing jobs on `max_workers` threads (default
+    config.INDEX_WORKERS). Submitting a video that is already queued or
+    running returns the existing job instead of indexing it twice.
+    """
+
+    def __init__(self, max_workers=None, persist_directory="./chroma_db"):
+        self.persist_directory = persist_directory
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or config.INDEX_WORKERS,
+                                        thread_name_prefix="index")
+        self._jobs = {}  # job id -> IndexJob
+        self._active = {}  # video id -> unfinished IndexJob
+        self._lock = threading.Lock()
+
+    def submit(self, video_url):
+        video_id = get_youtube_video_id(video_url)
+        with self._lock:
+            job = self._active.get(video_id)
+            if job is not None and not job.done:
+                return job
+            job = IndexJob(video_url, video_id, self.persist_directory)
+            self._jobs[job.id] = job
+            self._active[video_id] = job
+        self._pool.submit(index_video, job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
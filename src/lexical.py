@@ -0,0 +1,348 @@
+"""
+Lexical (BM25) retrieval over transcript chunks.
+
+Dense retrieval misses exact names and rare terms (player names, products),
+so each collection also keeps a small inverted index built incrementally as
+chunks are added. Results are fused with the vector results using
+reciprocal-rank fusion.
+
+The index is stored as a snapshot (<name>.json) plus an append-only log of
+the chunks added or removed since (<name>.log, one JSON line each), so
+saving after an add writes only the new chunks, not the whole corpus. Once
+the log holds more than a quarter as many lines as there are chunks it is
+folded into a new snapshot, which keeps loading about as fast as one
+json.load while the cost per added chunk stays constant.
+
+Several processes may share an index (Streamlit answering while live.py or
+ingest.py add chunks). Writers hold a lock file (<name>.lock) while they
+append or compact, and first apply what the others appended since they last
+looked, so a compaction never drops another process's chunks. Readers call
+refresh() to pick up those chunks: it replays the new log lines, or reloads
+the index after another process compacted it.
+"""
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# logs shorter than this are never folded into the snapshot
+COMPACT_MIN_LINES = 1000
+
+# very common words carry no signal for BM25 and only make postings longer
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in is it its of on or she so that the "
+    "their them there they this to was we were what when which who will with you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class InvertedIndex:
+    """
+    Incremental BM25 index: term -> {chunk_id: term frequency}. Safe to use
+    from several threads (e.g. concurrent indexing jobs on one corpus).
+
+    Usage:
+        index = InvertedIndex.load("chroma_db/lexical/yt_corpus.json")
+        index.add("vid:abc123", "chunk text ...")
+        index.save()
+        index.search("Antonsen backhand", k=10)  # [(chunk_id, score), ...]
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+        # chunk_id -> its terms, so a remove touches only those postings; built on the first remove
+        self._doc_terms = None
+        self._lock = threading.RLock()
+        self._pending = []  # log records not saved yet
+        self._log_lines = 0  # records in the log file
+        self._log_offset = 0  # bytes of the log applied to this index
+        self._snapshot = None  # (inode, mtime, size) of the snapshot loaded or written
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_len
+
+    def add(self, doc_id, text):
+        """Index one chunk; re-adding a known id is a no-op."""
+        terms = tokenize(text)
+        with self._lock:
+            if doc_id in self.doc_len:
+                return
+            counts = Counter(terms)
+            self._add(doc_id, counts, len(terms))
+            self._pending.append({"id": doc_id, "tf": counts})
+
+    def _add(self, doc_id, counts, length):
+        # interned, so the term lists share their strings with the postings
+        terms = [sys.intern(term) for term in counts]
+        for term in terms:
+            self.postings.setdefault(term, {})[doc_id] = counts[term]
+        if self._doc_terms is not None:
+            self._doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = length
+        self.total_len += length
+
+    def remove(self, doc_id):
+        """Drop one chunk from the index (a no-op for unknown ids)."""
+        with self._lock:
+            if self._remove(doc_id):
+                self._pending.append({"id": doc_id, "removed": True})
+
+    def _remove(self, doc_id):
+        length = self.doc_len.pop(doc_id, None)
+        if length is None:
+            return False
+        self.total_len -= length
+        if self._doc_terms is None:
+            self._doc_terms = {}
+            for term, postings in self.postings.items():
+                for posting_id in postings:
+                    self._doc_terms.setdefault(posting_id, []).append(term)
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self.postings.get(term)
+            if postings is not None and postings.pop(doc_id, None) is not None and not postings:
+                del self.postings[term]
+        return True
+
+    def search(self, query, k=10, allow=None):
+        """
+        Return the top-k (chunk_id, bm25 score) pairs for `query`, best first.
+        `allow` (callable(chunk_id) -> bool) restricts the ranking to some chunks.
+        """
+        k1, b = self.k1, self.b
+        scores = {}
+        with self._lock:
+            n_docs = len(self.doc_len)
+            if not n_docs:
+                return []
+            avg_len = self.total_len / n_docs or 1.0
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = k1 * (1 - b + b * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        items = scores.items() if allow is None else ((i, v) for i, v in scores.items() if allow(i))
+        return heapq.nlargest(k, items, key=lambda item: item[1])
+
+    def save(self, path=None):
+        """
+        Append the chunks added or removed since the last save to the log.
+        Saving to another path than the index's own writes a full snapshot there.
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            if path != self.path:
+                self._write_snapshot(path)
+                return
+            if not self._pending:
+                return
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with _file_lock(path):
+                self._catch_up()
+                with open(log_path(path), "ab") as f:
+                    # a line left unfinished by a writer that crashed must not swallow the first record
+                    prefix = "\n" if f.tell() > self._log_offset else ""
+                    f.write((prefix + "".join(json.dumps(record, separators=(",", ":")) + "\n"
+                                              for record in self._pending)).encode("utf-8"))
+                    self._log_offset = f.tell()
+                self._log_lines += len(self._pending)
+                self._pending = []
+                if self._log_lines > max(COMPACT_MIN_LINES, len(self.doc_len) // 4):
+                    self._compact()
+
+    def compact(self):
+        """Write a new snapshot of the whole index and empty the log."""
+        with self._lock:
+            if not self.path:
+                return
+            with _file_lock(self.path):
+                self._catch_up()
+                self._compact()
+
+    def _compact(self):
+        # called with the lock file held and the other processes' log lines applied
+        self._write_snapshot(self.path)
+        self._snapshot = _stamp(self.path)
+        open(log_path(self.path), "w").close()
+        self._log_lines = 0
+        self._log_offset = 0
+        self._pending = []
+
+    def refresh(self):
+        """Apply what other processes saved to this index since it was loaded or last refreshed."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._changed():
+                return
+            with _file_lock(self.path):
+                self._catch_up()
+
+    def _changed(self):
+        # compacted (new snapshot, log emptied) or appended to since we last looked
+        log_size = _size(log_path(self.path))
+        return _stamp(self.path) != self._snapshot or log_size != self._log_offset
+
+    def _catch_up(self):
+        # called with the lock file held
+        if _stamp(self.path) != self._snapshot or _size(log_path(self.path)) < self._log_offset:
+            # another process compacted: reload, then put back what we have not saved yet
+            pending = self._pending
+            self._reload()
+            for record in pending:
+                self._apply(record)
+            self._pending = pending
+        else:
+            self._replay()
+
+    def _write_snapshot(self, path):
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # a temporary file of our own: concurrent saves must not swap in each other's half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"postings": self.postings, "doc_len": self.doc_len}, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _reload(self):
+        self.postings, self.doc_len, self.total_len, self._doc_terms = {}, {}, 0, None
+        self._log_lines = self._log_offset = 0
+        self._snapshot = _stamp(self.path)
+        if self._snapshot is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.postings = data.get("postings", {})
+            self.doc_len = data.get("doc_len", {})
+            self.total_len = sum(self.doc_len.values())
+        self._replay()
+
+    def _replay(self):
+        """Apply the log lines after _log_offset (written by this or another process)."""
+        try:
+            with open(log_path(self.path), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # a line still being written (or cut short by a crash) is not complete yet
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._log_lines += 1
+            self._apply(record)
+        self._log_offset += end
+
+    def _apply(self, record):
+        if record.get("removed"):
+            self._remove(record["id"])
+            return
+        # replace, so replaying a log over a snapshot that already has the chunk is harmless
+        if record["id"] in self.doc_len:
+            self._remove(record["id"])
+        self._add(record["id"], record["tf"], sum(record["tf"].values()))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load the index stored at `path` (snapshot, then log), or return an empty one bound to that path."""
+        index = cls(path=path, **kwargs)
+        if path:
+            index._reload()
+        return index
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def _file_lock(path):
+    """Hold the lock file of the index at `path` (across processes)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(os.path.splitext(path)[0] + ".lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after about 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def log_path(path):
+    """The append-only log next to the snapshot at `path`."""
+    return os.path.splitext(path)[0] + ".log"
+
+
+def remove_index(path):
+    """Delete the index stored at `path`: its snapshot, its log and its lock file."""
+    for file_path in (path, log_path(path), os.path.splitext(path)[0] + ".lock"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse several ranked id lists: score(id) = sum(1 / (k + rank)).
+    Returns ids ordered by fused score, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
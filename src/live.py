@@ -0,0 +1,338 @@
+"""
+Incremental ingestion of a transcript that is still growing (livestreams,
+long broadcasts).
+
+VttTail follows a VTT file and parses only the bytes appended since the last
+poll. LiveIngester splits the new cues onto the end of the previous, not yet
+full chunk (TokenTextSplitter.split_cues_incremental): full chunks are added
+to the collection once, and the growing last chunk is kept queryable under a
+fixed "<video_id>:live-tail" id that is replaced on every update. Each poll
+therefore embeds only the new chunks plus one tail chunk, however long the
+stream already is.
+
+Streamlit (or any other process) answering from the same collection picks
+the new chunks up as they are written: the vector store is shared on disk,
+and the BM25 index is refreshed from the log live.py appends to (see
+lexical.py).
+
+Usage:
+    python src/live.py --vtt transcripts/<id>.en.vtt --interval 2
+    python src/live.py --url https://www.youtube.com/watch?v=<id> --interval 30
+
+    # or from code, e.g. in a background thread
+    stop = threading.Event()
+    follow("transcripts/<id>.en.vtt", store, "<id>", stop=stop)
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from cleaner import CueParser, get_youtube_video_id
+from cuestore import CueStore, cue_store_path
+from extractor import default_fetcher, transcript_metadata
+from metrics import metrics
+from splitter import TokenTextSplitter
+from vectorstore import collection_name_for, init_vectorstore
+
+
+class VttTail:
+    """
+    Follow a VTT file that is being appended to. poll() returns the cues
+    completed since the previous poll; a trailing partial line or an
+    unterminated last cue waits for the next poll (or flush()).
+
+    If the file is replaced or shrinks (e.g. re-downloaded), it is parsed
+    again from the start and cues that were already returned are skipped.
+    """
+
+    def __init__(self, path, window=8):
+        self.path = path
+        self.window = window
+        self.last_start = None  # start of the last cue returned
+        self._reset()
+
+    def _reset(self):
+        self.parser = CueParser(self.window)
+        self.offset = 0
+        self._partial = b""
+        self._identity = None
+        self._resume_after = self.last_start
+
+    def _accept(self, cue):
+        if cue is None or (self._resume_after is not None and cue.start <= self._resume_after):
+            return False
+        self.last_start = cue.start
+        return True
+
+    def poll(self):
+        """Return the list of new cleaner.Cue records (empty if nothing new)."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        identity = (stat.st_dev, stat.st_ino)
+        if self._identity is not None and (identity != self._identity or stat.st_size < self.offset):
+            self._reset()
+        self._identity = identity
+        if stat.st_size == self.offset:
+            return []
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = self._partial + f.read()
+        self.offset += len(data) - len(self._partial)
+        # only parse complete lines: the writer may be mid-line (or mid UTF-8 character)
+        cut = data.rfind(b"\n") + 1
+        self._partial = data[cut:]
+
+        cues = []
+        for line in data[:cut].decode("utf-8").splitlines():
+            cue = self.parser.feed(line)
+            if self._accept(cue):
+                cues.append(cue)
+        return cues
+
+    def flush(self):
+        """Cues still held back at the end of the stream (the last, unterminated one)."""
+        cues = []
+        if self._partial:
+            cue = self.parser.feed(self._partial.decode("utf-8", errors="replace"))
+            self._partial = b""
+            if self._accept(cue):
+                cues.append(cue)
+        cue = self.parser.flush()
+        if self._accept(cue):
+            cues.append(cue)
+        return cues
+
+
+class ExtractorPoller:
+    """
+    Re-fetch a live video's subtitles (yt-dlp, or config.TRANSCRIPT_SOURCE_DIR)
+    on every call and bring `path` up to date. When the fetched file extends
+    the one on disk only the new bytes are appended, so a VttTail on `path`
+    parses just those.
+    """
+
+    def __init__(self, video_url, video_id, lang="en", output_dir="transcripts", fetcher=None):
+        self.video_url = video_url
+        self.video_id = video_id
+        self.lang = lang
+        self.fetcher = fetcher or default_fetcher()
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, f"{video_id}.{lang}.vtt")
+
+    def __call__(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fetched = self.fetcher(self.video_url, self.video_id, self.lang, tmp)
+            if not fetched:
+                return False
+            with open(fetched, "rb") as f:
+                data = f.read()
+            current = b""
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    current = f.read()
+            if data == current:
+                return False
+            if data.startswith(current):
+                with open(self.path, "ab") as f:
+                    f.write(data[len(current):])
+            else:
+                tmp_path = os.path.join(tmp, "replacement.vtt")
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+        return True
+
+
+class LiveIngester:
+    """
+    Add cues of a growing transcript to `store` as they arrive.
+
+    Args:
+        store (VectorStore): Store with the target collection open.
+        video_id (str): Video the cues belong to.
+        splitter (TokenTextSplitter): Defaults to TokenTextSplitter().
+        cue_store_interval (float): Seconds between appends of the new cues to
+            the video's cue store (time-range questions); None to write them
+            only at finish().
+        metadata (dict): Extra metadata for every chunk (e.g. language, title).
+
+    Usage:
+        ingester = LiveIngester(store, video_id)
+        ingester.update(tail.poll())   # repeatedly
+        ingester.finish(tail.flush())
+    """
+
+    def __init__(self, store, video_id, splitter=None, cue_store_interval=10.0, metadata=None):
+        self.store = store
+        self.video_id = video_id
+        self.metadata = metadata
+        self.splitter = splitter or TokenTextSplitter()
+        self.tail_id = f"{video_id}:live-tail"
+        self.cue_store_interval = cue_store_interval
+        self._new_cues = []     # cues not in the cue store yet
+        self._pending = []      # units of the provisional last chunk
+        self._next_index = 0    # chunk_index of the next full chunk
+        self._has_tail = False
+        self._cue_store_written = None
+        self.stats = {"updates": 0, "cues": 0, "chunks": 0, "written": 0}
+
+    def update(self, cues):
+        """Index newly arrived cues. Returns the number of full chunks written."""
+        if not cues:
+            return 0
+        with metrics.span("live_update", video_id=self.video_id) as span:
+            final, tail, self._pending = self.splitter.split_cues_incremental(
+                cues, self._pending, video_id=self.video_id, metadata=self.metadata, start_index=self._next_index)
+            written = self._write(final)
+            if tail is not None:
+                self.store.replace_document(self.tail_id, tail)
+                self._has_tail = True
+            elif self._has_tail:
+                self._drop_tail()
+            if not self.stats["updates"]:
+                # not complete yet, but lets time-range lookups find the video
+                self.store.mark_indexed(self.video_id, f"live:{self.splitter.config}")
+            self._new_cues.extend(cues)
+            self.stats["updates"] += 1
+            self.stats["cues"] += len(cues)
+            span.count("cues", len(cues))
+            span.count("chunks", len(final))
+
+            now = time.monotonic()
+            if self.cue_store_interval is not None and (
+                    self._cue_store_written is None or now - self._cue_store_written >= self.cue_store_interval):
+                self._write_cue_store()
+        return written
+
+    def _write(self, documents):
+        if not documents:
+            return 0
+        written = self.store.add_documents(documents, video_id=self.video_id)
+        self._next_index += len(documents)
+        self.stats["chunks"] += len(documents)
+        self.stats["written"] += written
+        return written
+
+    def _drop_tail(self):
+        self.store.delete_documents([self.tail_id])
+        self._has_tail = False
+
+    def _write_cue_store(self):
+        path = cue_store_path(self.store.persist_directory, self.video_id)
+        # the first write replaces a store left by an earlier run (the tail starts over from the first cue),
+        # later ones only append the cues that arrived since
+        if self._cue_store_written is None:
+            CueStore.build(self._new_cues, path)
+        else:
+            CueStore.append(self._new_cues, path)
+        self._new_cues = []
+        self._cue_store_written = time.monotonic()
+
+    def finish(self, cues=()):
+        """
+        End of stream: index the remaining cues, store the last chunk under its
+        regular id, and mark the video indexed like a normal ingest would.
+        """
+        self.update(list(cues))
+        if self._pending:
+            _, tail, _ = self.splitter.split_cues_incremental([], self._pending, video_id=self.video_id,
+                                                              metadata=self.metadata, start_index=self._next_index)
+            self._write([tail])
+            self._pending = []
+        if self._has_tail:
+            self._drop_tail()
+        self._write_cue_store()
+        self.store.mark_indexed(self.video_id, self.splitter.config)
+        return self.stats
+
+
+def follow(vtt_path, store, video_id, interval=2.0, idle_timeout=None, refresh=None, stop=None,
+           on_update=None, splitter=None, metadata=None):
+    """
+    Tail `vtt_path` into `store` until `stop` (a threading.Event) is set or
+    nothing new arrived for `idle_timeout` seconds, then finish the video.
+
+    Args:
+        refresh (callable): Called before each poll, e.g. an ExtractorPoller.
+        on_update (callable): Called with the LiveIngester after each update.
+        metadata (dict): Extra chunk metadata (default: transcript_metadata(vtt_path)).
+
+    Returns the ingestion stats dict.
+    """
+    tail = VttTail(vtt_path)
+    metadata = transcript_metadata(vtt_path) if metadata is None else metadata
+    ingester = LiveIngester(store, video_id, splitter=splitter, metadata=metadata)
+    last_change = time.monotonic()
+    try:
+        while True:
+            if refresh is not None:
+                refresh()
+            cues = tail.poll()
+            if cues:
+                ingester.update(cues)
+                last_change = time.monotonic()
+                if on_update is not None:
+                    on_update(ingester)
+            elif idle_timeout is not None and time.monotonic() - last_change >= idle_timeout:
+                break
+            if stop is not None:
+                if stop.wait(interval):
+                    break
+            else:
+                time.sleep(interval)
+    finally:
+        ingester.finish(tail.flush())
+    return ingester.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a growing (live) transcript as it is written.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--vtt", help="VTT file to follow (e.g. written by a live caption recorder)")
+    source.add_argument("--url", help="Live video to poll with the extractor")
+    parser.add_argument("--video-id", help="Default: from --url, or the --vtt file name")
+    parser.add_argument("--collection",
+                        help="Default: collection_name_for the video (the shared corpus, or its own collection "
+                             "with PER_VIDEO_COLLECTIONS)")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--embedding", choices=["openai", "local"],
+                        help="Embedding backend (default: EMBEDDING_BACKEND from config)")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls")
+    parser.add_argument("--idle-timeout", type=float, help="Stop after this many seconds without new cues")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--output-dir", default="transcripts", help="Where polled subtitles are stored")
+    args = parser.parse_args()
+
+    refresh = None
+    if args.url:
+        video_id = args.video_id or get_youtube_video_id(args.url)
+        refresh = ExtractorPoller(args.url, video_id, lang=args.lang, output_dir=args.output_dir)
+        vtt_path = refresh.path
+    else:
+        video_id = args.video_id or os.path.basename(args.vtt).split(".")[0]
+        vtt_path = args.vtt
+
+    _, store = init_vectorstore(args.persist_directory, args.collection or collection_name_for(video_id),
+                                embedding_function=args.embedding)
+
+    def _report(ingester):
+        stats = ingester.stats
+        print(f"update {stats['updates']}: {stats['cues']} cues, {stats['chunks']} chunks "
+              f"({stats['written']} new)", flush=True)
+
+    try:
+        stats = follow(vtt_path, store, video_id, interval=args.interval, idle_timeout=args.idle_timeout,
+                       refresh=refresh, on_update=_report)
+    except KeyboardInterrupt:
+        # follow() finished the video on the way out
+        return
+    print(f"Done: {stats['cues']} cues, {stats['chunks']} chunks ({stats['written']} new) "
+          f"in {stats['updates']} updates")
+
+
+if __name__ == "__main__":
+    main()
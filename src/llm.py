@@ -0,0 +1,177 @@
+"""
+Chat model access for chain.py.
+
+get_chat_model() returns the configured chat model: ChatOpenAI when
+OPENAI_API_KEY is set (or LLM_BACKEND=openai), the local StubChatModel when
+LLM_BACKEND=stub, and None when no model is available. The model is created
+once per process and shares one pooled HTTP client (sync and async), so
+concurrent sessions do not pay client construction or connection setup.
+OpenAI calls go through the process-wide "chat" rate limiter (ratelimit.py).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+import config
+
+
+class Message(NamedTuple):
+    """Minimal stand-in for langchain's AIMessage / AIMessageChunk."""
+    content: str
+
+
+class StubChatModel:
+    """
+    Local stand-in for ChatOpenAI with the same invoke/stream surface.
+
+    It "answers" by echoing the opening of the prompt's context, split into
+    word tokens, optionally sleeping to simulate time-to-first-token and
+    per-token latency. The chat prompts get replies of the right shape
+    instead: a follow-up is "rewritten" by putting the previous question in
+    front of it, and the conversation summary keeps the latest words of the
+    exchanges, without the prompt's labels. Useful for tests, benchmarks and
+    offline demos.
+    """
+
+    def __init__(self, reply=None, first_token_delay=0.0, token_delay=0.0, max_tokens=60):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.max_tokens = max_tokens
+
+    def _answer(self, prompt_text):
+        if self.reply is not None:
+            return self.reply
+        from prompt import CHAT_MEMORY_PROMPT_TEMPLATE, CONDENSE_PROMPT_TEMPLATE
+
+        match = re.search(r"Context:\s*(.*?)\s*Query:\s*(.*)", prompt_text, re.S)
+        context, query = (match.group(1), match.group(2).strip()) if match else (prompt_text, "")
+        if prompt_text.startswith(CONDENSE_PROMPT_TEMPLATE.split("\n", 1)[0]):
+            questions = re.findall(r"^User:\s*(.+)$", context, re.M)
+            return f"{questions[-1]} {query}" if questions else query
+        if prompt_text.startswith(CHAT_MEMORY_PROMPT_TEMPLATE.split("\n", 1)[0]):
+            max_words = re.search(r"at most (\d+) words", prompt_text)
+            text = re.sub(r"\b(?:Summary so far|New exchanges|User|Assistant):\s*", "", context)
+            words = text.split()[-int(max_words.group(1)) if max_words else -self.max_tokens:]
+            return " ".join(words)
+        words = context.split()[:self.max_tokens]
+        return " ".join(words) if words else "I don't know."
+
+    def _tokens(self, prompt_text):
+        # keep the separating space on each token, like real streamed deltas
+        return re.findall(r"\s*\S+", self._answer(prompt_text))
+
+    def invoke(self, prompt_text):
+        tokens = self._tokens(prompt_text)
+        time.sleep(self.first_token_delay + self.token_delay * len(tokens))
+        return Message("".join(tokens))
+
+    def stream(self, prompt_text):
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens(prompt_text)):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            yield Message(token)
+
+    async def ainvoke(self, prompt_text):
+        tokens = self._tokens(prompt_text)
+        await asyncio.sleep(self.first_token_delay + self.token_delay * len(tokens))
+        return Message("".join(tokens))
+
+    async def astream(self, prompt_text):
+        await asyncio.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens(prompt_text)):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield Message(token)
+
+
+class RateLimitedChatModel:
+    """
+    Wrap a chat model so every call goes through a ratelimit.RateLimiter:
+    it waits for the requests/min and tokens/min buckets, is retried with
+    backoff on 429s and transient errors, and identical prompts in flight at
+    the same time share one call (invoke/ainvoke only).
+
+    Other attributes (model_name, ...) are those of the wrapped model.
+    """
+
+    # tokens reserved for the answer on top of the prompt (OpenAI counts them against the TPM limit)
+    completion_tokens = 512
+
+    def __init__(self, model, limiter):
+        self.model = model
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def _tokens(self, prompt_text):
+        from splitter import count_tokens
+        return count_tokens(prompt_text) + self.completion_tokens
+
+    @staticmethod
+    def _key(prompt_text):
+        return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+
+    def invoke(self, prompt_text):
+        return self.limiter.call(self.model.invoke, prompt_text, tokens=self._tokens(prompt_text),
+                                 key=self._key(prompt_text))
+
+    def stream(self, prompt_text):
+        return self.limiter.stream(self.model.stream, prompt_text, tokens=self._tokens(prompt_text))
+
+    async def ainvoke(self, prompt_text):
+        return await self.limiter.acall(self.model.ainvoke, prompt_text, tokens=self._tokens(prompt_text),
+                                        key=self._key(prompt_text))
+
+    async def astream(self, prompt_text):
+        async for chunk in self.limiter.astream(self.model.astream, prompt_text, tokens=self._tokens(prompt_text)):
+            yield chunk
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _build_openai_model():
+    import httpx
+    from langchain_openai import ChatOpenAI
+    from ratelimit import get_limiter
+
+    limits = httpx.Limits(max_connections=config.LLM_MAX_CONNECTIONS,
+                          max_keepalive_connections=config.LLM_MAX_CONNECTIONS)
+    kwargs = {}
+    if config.OPENAI_BASE_URL:
+        kwargs["base_url"] = config.OPENAI_BASE_URL
+    model = ChatOpenAI(
+        model=config.LLM_MODEL,
+        temperature=config.LLM_TEMPERATURE,
+        http_client=httpx.Client(limits=limits),
+        # note: an httpx.AsyncClient's connections belong to the event loop that first uses them
+        http_async_client=httpx.AsyncClient(limits=limits),
+        # retries are the rate limiter's job: the client's own would bypass its buckets
+        max_retries=0,
+        **kwargs,
+    )
+    return RateLimitedChatModel(model, get_limiter("chat"))
+
+
+def get_chat_model():
+    """Return the process-wide chat model for the current config, or None if none is available."""
+    backend = config.LLM_BACKEND.lower()
+    if backend != "stub" and not os.environ.get("OPENAI_API_KEY"):
+        return None
+    key = (backend, config.LLM_MODEL, config.LLM_TEMPERATURE, config.OPENAI_BASE_URL)
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = StubChatModel() if backend == "stub" else _build_openai_model()
+                _models[key] = model
+    return model
@@ -0,0 +1,253 @@
+"""
+Lightweight tracing and metrics for the pipeline.
+
+Each stage (download, clean, split, add_documents, query, llm, ...) runs in a
+span: a context manager that times it, remembers its parent span and collects
+counts such as chunks and tokens. Spans feed process-wide duration histograms
+and counters, a ring buffer of recent spans (to see which stage made a slow
+answer slow), and any progress listeners registered with listen(). Gauges
+hold current values such as the rate limiter's queue depth (metrics.gauge).
+
+Usage:
+    from metrics import metrics
+
+    with metrics.span("split", video_id=video_id) as span:
+        docs = splitter.create_documents([text])
+        span.count("chunks", len(docs))
+
+    metrics.snapshot()       # JSON-able dict
+    metrics.to_prometheus()  # Prometheus text exposition format
+"""
+import contextvars
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# histogram bucket bounds for stage durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar("metrics_current_span", default=None)
+_listeners = contextvars.ContextVar("metrics_listeners", default=())
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """One timed stage. Created by Metrics.span(); use count() to attach counters."""
+
+    __slots__ = ("registry", "id", "name", "attrs", "parent", "started", "duration", "counts", "error")
+
+    def __init__(self, registry, name, attrs, parent):
+        self.registry = registry
+        self.id = next(_span_ids)
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.started = time.time()
+        self.duration = None
+        self.counts = {}
+        self.error = None
+
+    def count(self, name, value=1):
+        """Add `value` to this span's `name` count and to the `name` counter for this stage."""
+        self.counts[name] = self.counts.get(name, 0) + value
+        self.registry.incr(name, value, stage=self.name)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def progress(self, done, total):
+        """Report partial progress of this stage to the listeners (see listen())."""
+        self.registry._notify("progress", self, done=done, total=total)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "parent": self.parent.id if self.parent else None,
+            "started": round(self.started, 3),
+            "duration_s": round(self.duration, 6) if self.duration is not None else None,
+            "attrs": dict(self.attrs),
+            "counts": dict(self.counts),
+            "error": self.error,
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage duration histograms, counters and recent spans.
+
+    Args:
+        prefix (str): Prefix of the exported Prometheus metric names.
+        recent (int): Number of finished spans kept for snapshot().
+    """
+
+    def __init__(self, prefix="ytrag", recent=256):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}   # (name, labels) -> value
+        self._gauges = {}     # (name, labels) -> current value, e.g. queue depth
+        self._durations = {}  # stage -> [count, sum, max, bucket counts]
+        self._recent = deque(maxlen=recent)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time the enclosed block as stage `name`; nested spans record their parent."""
+        span = Span(self, name, attrs, _current_span.get())
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        self._notify("start", span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # closed from another context (e.g. an abandoned generator)
+                pass
+            self._finish(span)
+
+    def record(self, name, duration, counts=None, **attrs):
+        """Record a stage timed by the caller, e.g. across the yields of a generator."""
+        span = Span(self, name, attrs, _current_span.get())
+        span.duration = duration
+        for key, value in (counts or {}).items():
+            span.count(key, value)
+        self._finish(span)
+        return span
+
+    def current_span(self):
+        return _current_span.get()
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Set the current value of gauge `name` (e.g. a queue depth)."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def _finish(self, span):
+        with self._lock:
+            stats = self._durations.get(span.name)
+            if stats is None:
+                stats = self._durations[span.name] = [0, 0.0, 0.0, [0] * len(DURATION_BUCKETS)]
+            stats[0] += 1
+            stats[1] += span.duration
+            stats[2] = max(stats[2], span.duration)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    stats[3][i] += 1
+            if span.error:
+                key = ("errors", (("stage", span.name),))
+                self._counters[key] = self._counters.get(key, 0) + 1
+            self._recent.append(span)
+        self._notify("end", span)
+
+    def _notify(self, event, span, **info):
+        for listener in _listeners.get():
+            listener(event, span, info)
+
+    def recent(self, name=None, limit=None):
+        """Finished spans, oldest first, optionally only those called `name`."""
+        with self._lock:
+            spans = [s for s in self._recent if name is None or s.name == name]
+        return spans[-limit:] if limit else spans
+
+    def children(self, span):
+        """Finished spans whose parent is `span`, in finishing order."""
+        with self._lock:
+            return [s for s in self._recent if s.parent is span]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._durations.clear()
+            self._recent.clear()
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serialisable dict."""
+        with self._lock:
+            stages = {
+                name: {"count": count, "sum_s": round(total, 6), "mean_s": round(total / count, 6) if count else 0.0,
+                       "max_s": round(peak, 6)}
+                for name, (count, total, peak, _) in self._durations.items()
+            }
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in sorted(self._gauges.items())]
+            recent = [span.to_dict() for span in self._recent]
+        return {"stages": stages, "counters": counters, "gauges": gauges, "recent_spans": recent}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        """Render the histograms and counters in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            durations = {name: (count, total, list(buckets)) for name, (count, total, _, buckets)
+                         in self._durations.items()}
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        metric = f"{self.prefix}_stage_duration_seconds"
+        lines.append(f"# HELP {metric} Time spent in each pipeline stage.")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, (count, total, buckets) in sorted(durations.items()):
+            stage = _escape(name)
+            for bound, value in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {value}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+
+        for (name, labels), value in gauges:
+            metric = f"{self.prefix}_{name}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextmanager
+def listen(callback):
+    """
+    Call `callback(event, span, info)` for spans started, finished or reporting
+    progress in the current thread/task while the block runs. `event` is
+    "start", "end" or "progress" (then info has "done" and "total").
+    """
+    token = _listeners.set(_listeners.get() + (callback,))
+    try:
+        yield
+    finally:
+        _listeners.reset(token)
+
+
+metrics = Metrics()
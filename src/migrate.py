@@ -0,0 +1,130 @@
+"""
+Move per-video collections (<video_id>_collection) into the single corpus
+collection (config.CORPUS_COLLECTION).
+
+Chunks keep their text and metadata, and by default their stored embeddings
+too, so nothing is embedded again; pass --reembed when the corpus uses a
+different embedding model than the old collections. Old collections stored
+their chunks under ids "0", "1", ... and often without metadata, so every
+video's ids would collide in the corpus: chunks are re-keyed the way
+add_documents keys them (VectorStore.chunk_id) and get the video id of their
+collection in their metadata, so where={"video_id": ...} finds them. The BM25
+index and the "indexed:<video_id>" markers are carried over as well, so
+is_indexed, summary trees and cue stores keep working. Chunks already in the
+corpus are skipped, so the migration can be run again after an interruption.
+
+Usage:
+    python src/migrate.py                 # copy, keep the old collections
+    python src/migrate.py --delete        # and drop each one once copied
+    python src/migrate.py --backend flat --reembed
+"""
+import argparse
+import time
+
+import config
+from vectorstore import VectorStore, create_vector_store, default_embedding_function, get_embedding_function, \
+    legacy_video_id
+
+
+def legacy_collections(store, corpus_name=None):
+    """Names of the per-video collections in `store` (everything named *_collection but the corpus)."""
+    corpus_name = corpus_name or config.CORPUS_COLLECTION
+    return [name for name in store.list_collections() if name.endswith("_collection") and name != corpus_name]
+
+
+def migrate_collection(source, target, video_id=None, reembed=False, batch_size=512):
+    """
+    Copy every chunk of `source`'s collection into `target`'s (both VectorStores
+    with a collection open). `video_id` (default: taken from the collection
+    name) goes into each chunk's metadata and id. Returns the number of chunks
+    copied.
+    """
+    video_id = video_id or legacy_video_id(source.collection.name)
+    include = ["documents", "metadatas"] if reembed else ["documents", "metadatas", "embeddings"]
+    found = source.collection.get(include=include)
+    metadatas = found.get("metadatas") or [None] * len(found["ids"])
+    metadatas = [{**{k: v for k, v in (metadata or {}).items() if v is not None}, "video_id": video_id}
+                 for metadata in metadatas]
+    # ids namespaced by video, so "0", "1", ... of different videos do not collide
+    ids = [doc_id if doc_id.startswith(f"{video_id}:") else VectorStore.chunk_id(video_id, text)
+           for doc_id, text in zip(found["ids"], found["documents"])]
+    existing = set(target.collection.get(ids=list(set(ids)), include=[])["ids"]) if ids else set()
+    rows, seen = [], set(existing)
+    for i, doc_id in enumerate(ids):
+        if doc_id not in seen:
+            seen.add(doc_id)
+            rows.append(i)
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        kwargs = {
+            "ids": [ids[i] for i in batch],
+            "documents": [found["documents"][i] for i in batch],
+            "metadatas": [metadatas[i] for i in batch],
+        }
+        if not reembed:
+            kwargs["embeddings"] = [found["embeddings"][i] for i in batch]
+        target.collection.upsert(**kwargs)
+    if rows and target.lexical_index is not None:
+        for i in rows:
+            target.lexical_index.add(ids[i], found["documents"][i])
+        target.lexical_index.save()
+    if rows:
+        target.record_write()
+
+    for video_id in source.indexed_videos():
+        if target.indexed_config(video_id) is None:
+            target.mark_indexed(video_id, source.indexed_config(video_id))
+    return len(rows)
+
+
+def migrate(persist_directory="./chroma_db", backend=None, corpus_name=None, embedding_function=None,
+            reembed=False, delete=False):
+    """
+    Migrate every per-video collection under `persist_directory` into the corpus.
+
+    Returns {"collections", "chunks", "copied", "deleted", "elapsed_s"}.
+    """
+    corpus_name = corpus_name or config.CORPUS_COLLECTION
+    embedding_function = embedding_function or default_embedding_function(persist_directory)
+    target = create_vector_store(persist_directory, backend)
+    target.create_collection(corpus_name, embedding_function=embedding_function, description="YouTube transcripts")
+
+    stats = {"collections": 0, "chunks": 0, "copied": 0, "deleted": 0}
+    start = time.perf_counter()
+    for name in legacy_collections(target, corpus_name):
+        source = create_vector_store(persist_directory, backend)
+        source.create_collection(name, embedding_function=embedding_function)
+        copied = migrate_collection(source, target, video_id=legacy_video_id(name), reembed=reembed)
+        stats["collections"] += 1
+        stats["chunks"] += source.collection.count()
+        stats["copied"] += copied
+        print(f"{name}: {source.collection.count()} chunks ({copied} copied)", flush=True)
+        if delete:
+            source.delete_collection(name)
+            stats["deleted"] += 1
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge per-video collections into the single corpus collection.")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--backend", choices=["chroma", "flat"], help="Default: VECTOR_BACKEND from config")
+    parser.add_argument("--corpus", help="Target collection (default: CORPUS_COLLECTION from config)")
+    parser.add_argument("--embedding", choices=["openai", "local"],
+                        help="Embedding backend of the corpus (default: EMBEDDING_BACKEND from config)")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Embed the chunks again instead of copying the stored embeddings")
+    parser.add_argument("--delete", action="store_true", help="Drop each old collection once it is copied")
+    args = parser.parse_args()
+
+    embedding_function = get_embedding_function(args.embedding, args.persist_directory) if args.embedding else None
+    stats = migrate(args.persist_directory, backend=args.backend, corpus_name=args.corpus,
+                    embedding_function=embedding_function, reembed=args.reembed, delete=args.delete)
+    print(f"Migrated {stats['collections']} collections ({stats['chunks']} chunks, {stats['copied']} copied, "
+          f"{stats['deleted']} deleted) in {stats['elapsed_s']}s")
+
+
+if __name__ == "__main__":
+    main()
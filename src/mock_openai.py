@@ -0,0 +1,196 @@
+"""
+Local mock of the OpenAI HTTP API for load tests and offline runs.
+
+Serves /v1/chat/completions (plain and streamed) and /v1/embeddings with a
+configurable latency, so the real ChatOpenAI / OpenAI clients (and their
+connection pools) can be exercised without the network.
+
+To test rate limiting it can answer 429 (with a Retry-After header) like
+the real API: for more than `rpm` requests in a sliding minute, and at
+random for a fraction `error_rate` of the requests.
+
+Usage:
+    with MockOpenAIServer(latency=0.05) as server:
+        config.OPENAI_BASE_URL = server.base_url
+        ...
+
+    python src/mock_openai.py --port 8765 --latency 0.05
+    python src/mock_openai.py --rpm 120 --error-rate 0.1
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pools are reused
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _rate_limited(self):
+        """Seconds the client should wait if this request is over the limits, else None."""
+        server = self.server
+        now = time.monotonic()
+        with server.lock:
+            server.requests += 1
+            if server.rpm:
+                window = server.window
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) >= server.rpm:
+                    server.rate_limited += 1
+                    return 60 - (now - window[0])
+                window.append(now)
+            if server.error_rate and random.random() < server.error_rate:
+                server.rate_limited += 1
+                return server.retry_after
+        return None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        retry_after = self._rate_limited()
+        if retry_after is not None:
+            # rejected at once, like the real API
+            self._send_json({"error": {"message": "Rate limit reached (mock).", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                            status=429, headers={"Retry-After": f"{retry_after:.3f}"})
+            return
+        time.sleep(server.latency)
+
+        if self.path.endswith("/chat/completions"):
+            self._chat(request)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+    def _chat(self, request):
+        reply = self.server.reply
+        model = request.get("model", "mock")
+        if not request.get("stream"):
+            self._send_json({
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": reply}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(reply.split()), "total_tokens": 0},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            self._write_chunk({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": model,
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self._write_chunk({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "model": model,
+                           "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._write_raw(b"data: [DONE]\n\n")
+        self._write_raw(b"")
+
+    def _write_chunk(self, payload):
+        self._write_raw(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _write_raw(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = self.server.dimensions
+        data = []
+        for i, text in enumerate(inputs):
+            digest = hashlib.sha256(str(text).encode("utf-8")).digest()
+            vector = [(digest[j % len(digest)] - 128) / 128 for j in range(dims)]
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self._send_json({"object": "list", "data": data, "model": request.get("model", "mock"),
+                         "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+
+class MockOpenAIServer:
+    """Threaded mock OpenAI server running in a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, reply="This is a mock answer.", dimensions=64,
+                 rpm=None, error_rate=0.0, retry_after=0.2):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.reply = reply
+        self.httpd.dimensions = dimensions
+        self.httpd.rpm = rpm  # requests per sliding minute before answering 429; None for no limit
+        self.httpd.error_rate = error_rate  # fraction of requests answered 429 at random
+        self.httpd.retry_after = retry_after  # Retry-After of the random 429s, in seconds
+        self.httpd.window = deque()
+        self.httpd.requests = 0
+        self.httpd.rate_limited = 0
+        self.httpd.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def rate_limited(self):
+        """Requests answered with 429."""
+        return self.httpd.rate_limited
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI API server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds to wait before each response")
+    parser.add_argument("--rpm", type=int, help="Answer 429 above this many requests per minute")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 429 at random")
+    args = parser.parse_args()
+    server = MockOpenAIServer(port=args.port, latency=args.latency, rpm=args.rpm, error_rate=args.error_rate)
+    print(f"Mock OpenAI API at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
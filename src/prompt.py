@@ -5,6 +5,33 @@ If context is insufficient, just say that you don't know.
 Context: {context}
 Query: {query}"""
 
+SUMMARY_PROMPT_TEMPLATE = """You are summarizing a youtube video transcript, one part at a time.
+Write a concise summary of at most {max_words} words of the context below.
+Keep names, numbers and turning points; do not add anything that is not in the context.
+
+Context: {context}
+Query: {query}"""
+
+SECTION_SUMMARY_QUERY = "Summarize this section of the transcript."
+MERGE_SUMMARY_QUERY = "Combine these consecutive section summaries into one summary, in order."
+
+CONDENSE_PROMPT_TEMPLATE = """You are helping search a youtube video transcript during a conversation.
+Rewrite the follow-up question at the end as one standalone question that can be understood without the
+conversation: replace words like "he", "that" or "after that" by what they refer to. Do not answer it.
+Return only the rewritten question.
+
+Context: {context}
+Query: {query}"""
+
+CHAT_MEMORY_PROMPT_TEMPLATE = """You are keeping a running summary of a conversation about youtube videos.
+Update the summary with the new exchanges in at most {max_words} words.
+Keep the topics, names, events and times the user asked about and what was answered; drop small talk.
+
+Context: {context}
+Query: {query}"""
+
+CHAT_MEMORY_QUERY = "Write the updated summary of the conversation."
+
 class PromptTemplate:
     """
     Minimal PromptTemplate compatible with the notebook usage.
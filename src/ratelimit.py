@@ -0,0 +1,428 @@
+"""
+Rate-limit-aware scheduling of OpenAI embedding and chat requests.
+
+Every request goes through a RateLimiter: two token buckets, requests per
+minute and tokens per minute, that a caller waits on before sending. If the
+API still answers 429 (or with a transient 5xx or connection error), the
+request is retried with full-jitter exponential backoff. A Retry-After from
+the server is honoured, and it holds back every other caller of the same
+limiter too. Identical requests already in flight are merged: a second
+caller waits for the first one's result instead of sending again. Small
+embedding requests, such as one question each from concurrent sessions, are
+packed into larger batches by EmbeddingBatcher.
+
+Time spent waiting for the buckets is recorded as "ratelimit_wait" spans.
+Retries, 429s and merged requests are counters, and the number of requests
+waiting or running is the "ratelimit_queue_depth" gauge. All of them live in
+metrics, per limiter.
+
+Usage:
+    limiter = get_limiter("chat")
+    answer = limiter.call(llm.invoke, prompt_text, tokens=count_tokens(prompt_text) + 512, key=prompt_text)
+
+    batcher = EmbeddingBatcher(embed_fn, get_limiter("embeddings"))
+    vectors = batcher.embed(["first text", "second text"])
+"""
+import asyncio
+import itertools
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+from metrics import metrics
+
+# statuses worth retrying: rate limited, timeouts and server-side failures
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+# errors without a status that are worth retrying (openai / httpx / builtin names)
+RETRY_ERRORS = frozenset({"APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+                          "RemoteProtocolError", "ConnectionError", "TimeoutError"})
+
+
+class RetriesExhausted(RuntimeError):
+    """A request still failed with a retryable error after the limiter's last retry."""
+
+
+def _status(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms headers), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # an HTTP date: fall back to backoff
+        return None
+    return None
+
+
+def is_retryable(error):
+    status = _status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return type(error).__name__ in RETRY_ERRORS
+
+
+class TokenBucket:
+    """
+    `rate` units per minute, holding at most `capacity` (default: one minute's
+    worth). reserve() always takes the units, going into debt if needed, and
+    returns how long the caller must wait for the debt to be paid back, so
+    callers are served in arrival order without polling.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate / 60.0
+        self.capacity = capacity or rate
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount, now=None):
+        now = time.monotonic() if now is None else now
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # a request larger than the whole bucket still has to get through eventually
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+
+class RateLimiter:
+    """
+    Client-side limits and retries for one kind of request (e.g. "chat").
+
+    Args:
+        name (str): Label of this limiter's metrics.
+        rpm (int): Requests per minute; 0 for no limit.
+        tpm (int): Tokens per minute; 0 for no limit.
+        max_retries (int): Retries of a request that failed with a retryable error.
+        base_delay (float): First backoff ceiling in seconds; doubles per retry up to `max_delay`.
+    """
+
+    def __init__(self, name, rpm=0, tpm=0, max_retries=6, base_delay=0.5, max_delay=30.0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0  # set by a server Retry-After
+        self._queued = 0
+        self._inflight = {}  # key -> Future of the request being sent
+        self._ainflight = weakref.WeakKeyDictionary()  # event loop -> {key: asyncio.Future}
+
+    def _count(self, name, value=1):
+        metrics.incr(name, value, limiter=self.name)
+
+    def _queue(self, delta):
+        with self._lock:
+            self._queued += delta
+            depth = self._queued
+        metrics.gauge("ratelimit_queue_depth", depth, limiter=self.name)
+
+    def _reserve(self, tokens):
+        """Take a request (and `tokens`) from the buckets; returns the seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._blocked_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.reserve(tokens, now))
+        self._count("ratelimit_requests")
+        if delay > 0:
+            metrics.record("ratelimit_wait", delay, limiter=self.name)
+        return delay
+
+    def acquire(self, tokens=0):
+        """Block until a request of `tokens` tokens may be sent."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _backoff(self, error, attempt):
+        """Seconds to wait before retrying after `error`; raises if it should not be retried."""
+        if not is_retryable(error):
+            raise error
+        if _status(error) == 429:
+            self._count("ratelimit_429s")
+        if attempt >= self.max_retries:
+            self._count("ratelimit_failures")
+            raise RetriesExhausted(
+                f"OpenAI {self.name} request still failing after {self.max_retries} retries ({error}). "
+                f"Lower the request rate or try again later.") from error
+        self._count("ratelimit_retries")
+        # full jitter: spread retries out so waiting callers do not all come back at once
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        return delay
+
+    def call(self, fn, *args, tokens=0, key=None, **kwargs):
+        """
+        Return fn(*args, **kwargs), sent within the limits and retried on
+        retryable errors. Calls with the same `key` while one is in flight
+        share its result.
+        """
+        if key is None:
+            return self._call(fn, args, kwargs, tokens)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._count("ratelimit_coalesced")
+            return future.result()
+        try:
+            result = self._call(fn, args, kwargs, tokens)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _call(self, fn, args, kwargs, tokens):
+        self._queue(1)
+        try:
+            for attempt in itertools.count():
+                self.acquire(tokens)
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                time.sleep(delay)
+        finally:
+            self._queue(-1)
+
+    def stream(self, fn, *args, tokens=0, **kwargs):
+        """
+        Iterate over fn(*args, **kwargs) (e.g. a chat model's stream). Failures
+        before the first chunk are retried like call(); once chunks were
+        yielded an error is raised as is.
+        """
+        self._queue(1)
+        try:
+            for attempt in itertools.count():
+                self.acquire(tokens)
+                started = False
+                try:
+                    for chunk in fn(*args, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    delay = self._backoff(e, attempt)
+                time.sleep(delay)
+        finally:
+            self._queue(-1)
+
+    async def acall(self, fn, *args, tokens=0, key=None, **kwargs):
+        """Async call(): `fn` returns an awaitable; waits and backoffs do not block the event loop."""
+        if key is None:
+            return await self._acall(fn, args, kwargs, tokens)
+        # asyncio futures belong to one event loop, so merge requests per loop
+        inflight = self._ainflight.setdefault(asyncio.get_running_loop(), {})
+        future = inflight.get(key)
+        if future is not None:
+            self._count("ratelimit_coalesced")
+            return await asyncio.shield(future)
+        future = inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._acall(fn, args, kwargs, tokens)
+        except BaseException as e:
+            future.set_exception(e)
+            # nobody else may be waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            inflight.pop(key, None)
+
+    async def _acall(self, fn, args, kwargs, tokens):
+        self._queue(1)
+        try:
+            for attempt in itertools.count():
+                delay = self._reserve(tokens)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                await asyncio.sleep(delay)
+        finally:
+            self._queue(-1)
+
+    async def astream(self, fn, *args, tokens=0, **kwargs):
+        """Async stream(): `fn` returns an async iterator."""
+        self._queue(1)
+        try:
+            for attempt in itertools.count():
+                delay = self._reserve(tokens)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                started = False
+                try:
+                    async for chunk in fn(*args, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    delay = self._backoff(e, attempt)
+                await asyncio.sleep(delay)
+        finally:
+            self._queue(-1)
+
+
+class EmbeddingBatcher:
+    """
+    Pack concurrent embedding requests into larger API calls.
+
+    embed(texts) queues the texts and blocks until their vectors are back. A
+    background thread waits up to `window` seconds for more texts (unless a
+    batch is already full), then sends batches of at most `max_batch` texts
+    and `max_tokens` tokens, `max_workers` at a time, through `limiter`.
+    Texts already queued or in flight are not sent again.
+
+    Args:
+        embed_fn: callable(list[str]) -> list[vector], the raw API call.
+        limiter (RateLimiter): Limits and retries for embed_fn; None to call it directly.
+    """
+
+    def __init__(self, embed_fn, limiter=None, max_batch=256, max_tokens=100_000, window=0.005, max_workers=4):
+        self.embed_fn = embed_fn
+        self.limiter = limiter
+        self.max_batch = max_batch
+        self.max_tokens = max_tokens
+        self.window = window
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()  # text -> Future, not sent yet
+        self._inflight = {}  # text -> Future, sent
+        self._worker = None
+
+    def embed(self, texts):
+        """Return one vector per text, in order."""
+        futures, merged = [], 0
+        with self._cond:
+            for text in texts:
+                future = self._pending.get(text) or self._inflight.get(text)
+                if future is None:
+                    future = self._pending[text] = Future()
+                else:
+                    merged += 1
+                futures.append(future)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        if merged and self.limiter is not None:
+            self.limiter._count("ratelimit_coalesced", merged)
+        return [future.result() for future in futures]
+
+    def _take_batch(self):
+        from splitter import count_tokens
+
+        batch, futures, tokens = [], [], 0
+        while self._pending and len(batch) < self.max_batch:
+            text = next(iter(self._pending))
+            text_tokens = count_tokens(text)
+            if batch and tokens + text_tokens > self.max_tokens:
+                break
+            future = self._pending.pop(text)
+            self._inflight[text] = future
+            batch.append(text)
+            futures.append(future)
+            tokens += text_tokens
+        return batch, futures, tokens
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # give concurrent callers a moment to add their texts to this batch
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch and time.monotonic() < deadline:
+                    self._cond.wait(max(0.0, deadline - time.monotonic()))
+                batches = []
+                while self._pending:
+                    batches.append(self._take_batch())
+            for batch in batches:
+                self._pool.submit(self._send, *batch)
+
+    def _send(self, batch, futures, tokens):
+        try:
+            if self.limiter is not None:
+                vectors = self.limiter.call(self.embed_fn, batch, tokens=tokens)
+            else:
+                vectors = self.embed_fn(batch)
+            vectors = list(vectors)
+            # zip() would leave the callers of the missing vectors waiting forever
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding request returned {len(vectors)} vectors for {len(batch)} texts.")
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+        except BaseException as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(RuntimeError("Embedding request ended without a result."))
+            with self._cond:
+                for text in batch:
+                    self._inflight.pop(text, None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(kind):
+    """
+    Process-wide RateLimiter for "chat" or "embeddings" requests, configured
+    from config.OPENAI_<KIND>_RPM / _TPM and the OPENAI_RETRY_* settings.
+    """
+    if kind == "chat":
+        rpm, tpm = config.OPENAI_CHAT_RPM, config.OPENAI_CHAT_TPM
+    elif kind == "embeddings":
+        rpm, tpm = config.OPENAI_EMBEDDING_RPM, config.OPENAI_EMBEDDING_TPM
+    else:
+        raise ValueError(f"Unknown limiter '{kind}'. Use 'chat' or 'embeddings'.")
+    key = (kind, rpm, tpm, config.OPENAI_MAX_RETRIES, config.OPENAI_RETRY_BASE_DELAY, config.OPENAI_RETRY_MAX_DELAY)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(kind, rpm=rpm, tpm=tpm, max_retries=config.OPENAI_MAX_RETRIES,
+                                                   base_delay=config.OPENAI_RETRY_BASE_DELAY,
+                                                   max_delay=config.OPENAI_RETRY_MAX_DELAY)
+        return limiter
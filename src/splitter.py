@@ -1,4 +1,223 @@
+import itertools
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple
+
+from metrics import metrics
+
+# a sentence ends with . ! or ? (optionally followed by a closing quote/bracket)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])[\"')\]]?\s+")
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]?$")
+
+
+class Document:
+    """
+    Minimal stand-in for langchain's Document: chunk text plus metadata.
+    VectorStore.add_documents reads `.page_content` and `.metadata`.
+    """
+
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata=None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+
+    def __repr__(self):
+        return f"Document(page_content={self.page_content[:40]!r}..., metadata={self.metadata!r})"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    """Load a tiktoken encoding once; None if tiktoken or its BPE file is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        # tiktoken downloads the BPE ranks on first use, which fails offline
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """
+    Count tokens in `text` with tiktoken (cl100k_base matches text-embedding-3-*
+    and gpt-4o-mini closely enough for budgeting). Falls back to ~4 chars/token.
+    """
+    if not text:
+        return 0
+    enc = _get_encoding(encoding_name)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+class _Unit(NamedTuple):
+    text: str
+    start: float | None
+    end: float | None
+    tokens: int
+
+
+class TokenTextSplitter:
+    """
+    Split transcripts into chunks sized in tokens.
+
+    Chunks are cut on sentence boundaries where possible and otherwise on cue
+    boundaries (auto-captions often have no punctuation), so words are never
+    split. Sizes are budgeted from per-sentence token counts, so a chunk can
+    come out a few tokens over chunk_size where BPE merges differ at joins.
+    Each chunk carries the start/end timestamps of the cues it covers and the
+    video id as metadata.
+
+    Usage:
+        splitter = TokenTextSplitter(chunk_size=256)
+        docs = list(splitter.split_cues(iter_cues("transcripts/<id>.en.vtt"), video_id="<id>"))
+    """
+
+    def __init__(self, chunk_size=256, chunk_overlap=0, encoding_name="cl100k_base"):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+
+    @property
+    def config(self) -> str:
+        """Short string identifying the splitter settings (used to tag indexed videos)."""
+        return f"tokens:{self.chunk_size}:{self.chunk_overlap}:{self.encoding_name}"
+
+    def _units(self, text, start=None, end=None) -> Iterator[_Unit]:
+        """Break text into sentence units no larger than chunk_size tokens."""
+        for sentence in _SENTENCE_SPLIT_RE.split(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            tokens = count_tokens(" " + sentence, self.encoding_name)
+            if tokens <= self.chunk_size:
+                yield _Unit(sentence, start, end, tokens)
+                continue
+            # oversized sentence (e.g. a long unpunctuated paragraph): cut on words
+            words, part, part_tokens = sentence.split(), [], 0
+            for word in words:
+                word_tokens = count_tokens(" " + word, self.encoding_name)
+                if part and part_tokens + word_tokens > self.chunk_size:
+                    yield _Unit(" ".join(part), start, end, part_tokens)
+                    part, part_tokens = [], 0
+                part.append(word)
+                part_tokens += word_tokens
+            if part:
+                yield _Unit(" ".join(part), start, end, part_tokens)
+
+    def _cut_index(self, buf) -> int:
+        """Number of buffered units to emit: up to the last sentence end past half the budget."""
+        total, best = 0, None
+        for i, unit in enumerate(buf):
+            total += unit.tokens
+            if total >= self.chunk_size // 2 and _SENTENCE_END_RE.search(unit.text):
+                best = i + 1
+        return best or len(buf)
+
+    def _overlap_tail(self, emitted):
+        """Trailing units of the emitted chunk that fit in chunk_overlap tokens."""
+        tail, total = [], 0
+        for unit in reversed(emitted):
+            if total + unit.tokens > self.chunk_overlap:
+                break
+            tail.append(unit)
+            total += unit.tokens
+        return tail[::-1]
+
+    def _make_document(self, units, index, base_metadata) -> Document:
+        metadata = dict(base_metadata)
+        starts = [u.start for u in units if u.start is not None]
+        ends = [u.end for u in units if u.end is not None]
+        if starts:
+            metadata["start"] = min(starts)
+        if ends:
+            metadata["end"] = max(ends)
+        text = " ".join(u.text for u in units)
+        metadata["chunk_index"] = index
+        metadata["tokens"] = count_tokens(text, self.encoding_name)
+        return Document(text, metadata)
+
+    def _split_units(self, units: Iterable[_Unit], base_metadata, index=0, remainder=None) -> Iterator[Document]:
+        # with `remainder` (a list), the last, not yet full chunk is not emitted:
+        # its units are left in `remainder` so more text can be appended later
+        buf, buf_tokens = [], 0
+        for unit in units:
+            while buf and buf_tokens + unit.tokens > self.chunk_size:
+                cut = self._cut_index(buf)
+                emitted, buf = buf[:cut], buf[cut:]
+                yield self._make_document(emitted, index, base_metadata)
+                index += 1
+                buf_tokens = sum(u.tokens for u in buf)
+                if self.chunk_overlap and not buf:
+                    tail = self._overlap_tail(emitted)
+                    tail_tokens = sum(u.tokens for u in tail)
+                    if tail_tokens + unit.tokens <= self.chunk_size:
+                        buf, buf_tokens = tail, tail_tokens
+            buf.append(unit)
+            buf_tokens += unit.tokens
+        if remainder is not None:
+            remainder.extend(buf)
+        elif buf:
+            yield self._make_document(buf, index, base_metadata)
+
+    def split_cues(self, cues, video_id=None, metadata=None) -> Iterator[Document]:
+        """
+        Chunk an iterable of cleaner.Cue records (or (start, end, text) tuples).
+
+        Args:
+            cues: Iterable of cues, e.g. cleaner.iter_cues(vtt_file).
+            video_id (str): Stored as `video_id` in each chunk's metadata.
+            metadata (dict): Extra metadata copied onto every chunk.
+
+        Yields:
+            Document: chunk text with start/end/video_id/chunk_index/tokens metadata.
+        """
+        base = dict(metadata or {})
+        if video_id:
+            base["video_id"] = video_id
+        units = (unit for start, end, text in cues for unit in self._units(text, start, end))
+        return self._split_units(units, base)
+
+    def split_cues_incremental(self, cues, pending=(), video_id=None, metadata=None, start_index=0):
+        """
+        Chunk cues that arrive over time (e.g. a live transcript).
+
+        `pending` are the units returned by the previous call: the text of the
+        last chunk, which is not full yet. New cues are appended to it, so the
+        result is the same as splitting all cues at once.
+
+        Returns:
+            (final, tail, pending): chunks that will not change any more
+            (numbered from `start_index`), the provisional last chunk (a
+            Document, or None), and the units to pass as `pending` next time.
+        """
+        base = dict(metadata or {})
+        if video_id:
+            base["video_id"] = video_id
+        units = itertools.chain(pending, (unit for start, end, text in cues
+                                          for unit in self._units(text, start, end)))
+        remainder = []
+        final = list(self._split_units(units, base, index=start_index, remainder=remainder))
+        tail = self._make_document(remainder, start_index + len(final), base) if remainder else None
+        return final, tail, remainder
+
+    def create_documents(self, texts, metadatas=None) -> list:
+        """Chunk plain strings (no timestamps); mirrors the langchain splitter method."""
+        with metrics.span("split") as span:
+            documents = []
+            for i, text in enumerate(texts):
+                base = metadatas[i] if metadatas else {}
+                documents.extend(self._split_units(self._units(text), base))
+            span.count("chunks", len(documents))
+            span.count("tokens", sum(doc.metadata["tokens"] for doc in documents))
+        return documents
+
+
 class RecursiveCharacterTextSplitter:
+    """Legacy fixed-width character splitter, kept for callers that expect plain strings."""
+
     def __init__(self, chunk_size=1000, chunk_overlap=200):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
@@ -14,6 +233,7 @@ class RecursiveCharacterTextSplitter:
                 start += self.chunk_size - self.chunk_overlap
         return documents
 
-def split_transcript(transcript):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return splitter.create_documents([transcript])
\ No newline at end of file
+
+def split_transcript(transcript, video_id=None):
+    splitter = TokenTextSplitter(chunk_size=256)
+    return splitter.create_documents([transcript], metadatas=[{"video_id": video_id}] if video_id else None)
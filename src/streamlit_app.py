@@ -1,95 +1,146 @@
-import time
+import itertools
 import streamlit as st
-from extractor import download_transcript
-from cleaner import extract_clean_subtitles, get_youtube_video_id
-from splitter import RecursiveCharacterTextSplitter
-from embeddings import create_embeddings
-from vectorstore import init_vectorstore, add_documents_to_vector_store
-from chain import query_chain
+import config
+from cleaner import get_youtube_video_id
+from splitter import TokenTextSplitter
+from vectorstore import init_vectorstore, collection_name_for
+from conversation import get_chat_session
+from jobs import JobManager
+from metrics import metrics
+
+
+@st.cache_resource
+def get_job_manager():
+    # one indexing pool per process, shared by every session
+    return JobManager()
+
+
+@st.cache_resource
+def get_store(collection_name):
+    # one store (and Chroma client) per collection per process, shared by every session
+    _, store = init_vectorstore(collection_name=collection_name)
+    return store
+
 
 st.title("YouTube Chatbot")
 
 st.sidebar.header("User Input")
 video_url = st.sidebar.text_input("Enter YouTube Video URL:")
 
-# helper to ensure progress state exists
-if "progress" not in st.session_state:
-    st.session_state.progress = 0
+if "videos" not in st.session_state:
+    st.session_state.videos = []    # ids of this session's indexed videos, oldest first
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []   # this session's background indexing jobs
 
-def _set_progress(p):
-    st.session_state.progress = int(p)
-    prog_bar.progress(st.session_state.progress)
+def _add_video(video_id):
+    if video_id not in st.session_state.videos:
+        st.session_state.videos.append(video_id)
+    st.session_state.active_video = video_id
 
-prog_bar = st.sidebar.progress(st.session_state.progress)
 status_text = st.sidebar.empty()
 
 if st.sidebar.button("Download Transcript"):
-    # reset progress and status
-    _set_progress(0)
-    status_text.info("Starting process...")
-
     if not video_url:
         status_text.error("Please enter a valid YouTube video URL.")
-        _set_progress(0)
     else:
         try:
-            status_text.info("Downloading subtitles...")
-            _set_progress(10)
-            with st.spinner("Downloading subtitles..."):
-                transcript_file = download_transcript(video_url)
-            if not transcript_file:
-                status_text.error("Failed to download transcript.")
-                _set_progress(0)
+            video_id = get_youtube_video_id(video_url)
+            store = get_store(collection_name_for(video_id))
+            if store.is_indexed(video_id, TokenTextSplitter(chunk_size=256).config):
+                # already indexed with the same splitter settings: ready at once
+                _add_video(video_id)
+                status_text.success("Video already indexed.")
             else:
-                status_text.success("Transcript downloaded.")
-                _set_progress(30)
-
-                status_text.info("Cleaning transcript...")
-                with st.spinner("Cleaning subtitles..."):
-                    transcript = extract_clean_subtitles(transcript_file)
-                if not transcript:
-                    status_text.error("Failed to clean transcript.")
-                    _set_progress(0)
-                else:
-                    st.session_state.transcript = transcript
-                    _set_progress(50)
-                    status_text.info("Splitting transcript into chunks...")
-                    with st.spinner("Splitting text..."):
-                        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                        chunks = splitter.create_documents([transcript])
-                    st.session_state.chunks = chunks
-                    _set_progress(70)
-                    status_text.info(f"Initializing vector store and adding {len(chunks)} chunks...")
-                    with st.spinner("Initializing vector store..."):
-                        st.session_state.collection, st.session_state.vector_store = init_vectorstore(collection_name=f"{get_youtube_video_id(video_url)}_collection")
-                    _set_progress(80)
-                    with st.spinner("Adding documents to vector store..."):
-                        add_documents_to_vector_store(st.session_state.vector_store, st.session_state.chunks)
-                    _set_progress(100)
-                    status_text.success("Indexing complete.")
+                job = get_job_manager().submit(video_url)
+                if job.id not in st.session_state.job_ids:
+                    st.session_state.job_ids.append(job.id)
+                status_text.info("Indexing in the background. You can keep asking about other videos.")
         except Exception as e:
             status_text.error(f"Error: {e}")
-            _set_progress(0)
 
-if 'transcript' in st.session_state:
+jobs = [job for job in map(get_job_manager().get, st.session_state.job_ids) if job is not None]
+polling = any(not job.done for job in jobs)
 
-    user_query = st.text_input("Ask a question about the video:")
-    if st.button("Get Answer"):
-        if not user_query:
-            st.error("Please enter a question.")
+# poll the background jobs every second while any of them is still running
+@st.fragment(run_every=1.0 if polling else None)
+def _job_progress():
+    for job in jobs:
+        state = job.snapshot()
+        if state["status"] == "done":
+            if state["video_id"] not in st.session_state.videos:
+                _add_video(state["video_id"])
+                st.rerun()
+            st.success(f"{state['video_id']}: indexed ({state['chunks']} chunks, {state['elapsed_s']}s)")
+        elif state["status"] == "failed":
+            st.error(f"{state['video_id']}: {state['error']}")
         else:
-            # show progress for retrieval + answer generation
-            answer_slot = st.empty()
-            prog = st.empty()
+            st.progress(state["progress"], text=f"{state['video_id']}: {state['message']}")
+    if polling and all(job.done for job in jobs):
+        # the last job just finished: rerun the app once so this fragment stops polling
+        st.rerun()
+
+with st.sidebar:
+    _job_progress()
+
+if st.session_state.videos:
+
+    video_id = st.selectbox("Video", st.session_state.videos,
+                            index=st.session_state.videos.index(st.session_state.get("active_video",
+                                                                                     st.session_state.videos[-1])))
+    st.session_state.active_video = video_id
+    vector_store = get_store(collection_name_for(video_id))
+    # every video shares the corpus collection: scope retrieval with a metadata filter
+    where = {"video_id": video_id}
+    if len(st.session_state.videos) > 1 and not config.PER_VIDEO_COLLECTIONS:
+        if st.checkbox("Search all my videos"):
+            where = {"video_id": {"$in": st.session_state.videos}}
+
+    # one conversation per scope, kept in the session state across reruns
+    chat = get_chat_session(st.session_state, vector_store, where)
+    if chat.turns and st.button("New conversation"):
+        chat.clear()
+
+    def _show_sources(citations):
+        if citations:
+            st.markdown("**Sources**\n" + "\n".join(
+                f"- [{c['label']}]({c['url']}) {c.get('title') or ''} {c['quote']}" for c in citations))
+
+    for turn in chat.turns:
+        with st.chat_message("user"):
+            st.markdown(turn["question"])
+        with st.chat_message("assistant"):
+            st.markdown(turn["answer"])
+            _show_sources(turn["citations"])
+
+    user_query = st.chat_input("Ask a question about the video")
+    if user_query:
+        with st.chat_message("user"):
+            st.markdown(user_query)
+        with st.chat_message("assistant"):
+            # stream the answer token by token as the model produces it
+            timings = {}
             try:
-                with st.spinner("Retrieving context and generating answer..."):
-                    prog.info("Querying vector store...")
-                    time.sleep(0.2)
-                    prog.progress(25)
-                    response = query_chain(user_query, st.session_state.vector_store)
-                    prog.progress(100)
-                answer_slot.subheader("Response")
-                answer_slot.write(response)
+                with st.spinner("Retrieving context..."):
+                    # follow-ups are rewritten into a standalone question before retrieval
+                    tokens = chat.stream(user_query, timings=timings)
+                    first = next(tokens, "")
+                st.write_stream(itertools.chain([first], tokens))
+                if timings.get("query", user_query) != user_query:
+                    st.caption(f"Searched for: {timings['query']}")
+                if "total_s" in timings:
+                    source = "cache" if timings.get("cached") else f"{timings.get('tokens', 0)} tokens"
+                    st.caption(f"First token after {timings.get('rewrite_s', 0) + timings.get('ttft_s', 0):.2f}s, "
+                               f"done in {timings.get('rewrite_s', 0) + timings['total_s']:.2f}s ({source})")
+                _show_sources(timings.get("citations"))
             except Exception as e:
                 st.error(f"Failed to get answer: {e}")
-                prog.empty()
\ No newline at end of file
+
+with st.sidebar.expander("Pipeline metrics"):
+    snapshot = metrics.snapshot()
+    if snapshot["stages"]:
+        st.table({name: {"runs": stats["count"], "mean s": stats["mean_s"], "max s": stats["max_s"]}
+                  for name, stats in snapshot["stages"].items()})
+        st.download_button("Prometheus metrics", metrics.to_prometheus(), file_name="metrics.prom")
+        st.download_button("JSON snapshot", metrics.to_json(), file_name="metrics.json")
+    else:
+        st.caption("No pipeline stages recorded yet.")
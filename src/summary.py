@@ -0,0 +1,291 @@
+"""
+Map-reduce summary tree of a video, for whole-video questions.
+
+"Summarize this video" or "what were the main turning points" cannot be
+answered from the top few retrieved chunks. Instead, at index time the
+transcript is cut into consecutive sections of about SUMMARY_SECTION_TOKENS,
+each section is summarized (map), and every SUMMARY_FANOUT neighbouring
+summaries are merged into a parent summary (reduce) until one root is left.
+LLM calls run in parallel, at most SUMMARY_MAX_WORKERS at a time.
+
+The tree is saved to <persist_directory>/summaries/<video_id>.json and reused
+across sessions. Summaries are cached by the hash of their input, so after a
+video grows (e.g. a live stream) only the new sections and their ancestors
+are summarized again. At query time broad questions get the top levels of the
+tree as context: one small LLM call.
+
+Usage:
+    tree = build_summary_tree(chunks, video_id, persist_directory="./chroma_db")
+    tree = get_summary_tree(vector_store, video_id)   # load, or build from the collection
+    context, sources = summary_context([tree], token_budget=1000)
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import config
+from cuestore import format_timestamp
+from metrics import metrics
+from splitter import count_tokens
+
+# questions about the video as a whole rather than a detail in it
+_BROAD_RE = re.compile(
+    r"\b(summar\w*|overview|tl;?dr|recap|gist|outline"
+    r"|(?:main|key|major) (?:points?|topics?|ideas?|takeaways?|themes?|events?|moments?|arguments?)"
+    r"|turning points?"
+    r"|what (?:is|was) (?:this|the) (?:whole )?(?:video|talk|episode|stream|lecture|interview) about"
+    r"|(?:whole|entire) (?:video|talk|episode|stream))\b",
+    re.IGNORECASE,
+)
+
+
+def is_broad_question(query):
+    """True for whole-video questions ("summarize this video", "main turning points", ...)."""
+    return bool(_BROAD_RE.search(query or ""))
+
+
+def summary_path(persist_directory, video_id):
+    return os.path.join(persist_directory, "summaries", f"{video_id}.json")
+
+
+def split_sections(chunks, section_tokens):
+    """
+    Group consecutive chunks (Documents or (text, metadata) pairs, in order)
+    into sections of about `section_tokens` tokens.
+    Returns [{"text", "start", "end"}, ...].
+    """
+    sections, texts, starts, ends, used = [], [], [], [], 0
+
+    def _close():
+        sections.append({"text": " ".join(texts), "start": min(starts) if starts else None,
+                         "end": max(ends) if ends else None})
+
+    for chunk in chunks:
+        text, meta = (chunk.page_content, chunk.metadata) if hasattr(chunk, "page_content") else chunk
+        meta = meta or {}
+        tokens = meta.get("tokens") or count_tokens(text)
+        if texts and used + tokens > section_tokens:
+            _close()
+            texts, starts, ends, used = [], [], [], 0
+        texts.append(text)
+        if meta.get("start") is not None:
+            starts.append(meta["start"])
+        if meta.get("end") is not None:
+            ends.append(meta["end"])
+        used += tokens
+    if texts:
+        _close()
+    return sections
+
+
+def _model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+class SummaryTree:
+    """
+    Summary nodes of one video: {"summary", "start", "end", "level", "children"}.
+    Level 0 nodes summarize transcript sections; the root is the last level.
+    """
+
+    def __init__(self, video_id, root, indexed=None, cache=None):
+        self.video_id = video_id
+        self.root = root
+        self.indexed = indexed  # splitter config the video was indexed with when the tree was built
+        self.cache = cache or {}  # input hash -> summary
+
+    def levels(self):
+        """Nodes level by level, root first."""
+        levels, current = [], [self.root] if self.root else []
+        while current:
+            levels.append(current)
+            current = [child for node in current for child in node.get("children", [])]
+        return levels
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"video_id": self.video_id, "indexed": self.indexed, "root": self.root,
+                       "cache": self.cache}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["video_id"], data["root"], data.get("indexed"), data.get("cache"))
+
+
+def _summarize(llm, context, query):
+    from prompt import SUMMARY_PROMPT_TEMPLATE
+
+    prompt_text = SUMMARY_PROMPT_TEMPLATE.format(max_words=config.SUMMARY_MAX_WORDS, context=context, query=query)
+    with metrics.span("llm", summary=True) as span:
+        answer = llm.invoke(prompt_text).content
+        span.count("prompt_tokens", count_tokens(prompt_text))
+        span.count("completion_tokens", count_tokens(answer))
+    return answer.strip()
+
+
+def _label(node):
+    if node.get("start") is None:
+        return ""
+    return f"[{format_timestamp(node['start'])}-{format_timestamp(node['end'] or node['start'])}] "
+
+
+def build_summary_tree(chunks, video_id, llm=None, persist_directory=None, indexed=None, section_tokens=None,
+                       fanout=None, max_workers=None):
+    """
+    Build (or update) the summary tree of `video_id` from its chunks in order
+    and save it under `persist_directory`, when given.
+
+    Args:
+        chunks: Documents or (text, metadata) pairs of the video, in transcript order.
+        llm: Chat model (default llm.get_chat_model()).
+        indexed (str): Splitter config of the indexed video, stored to detect stale trees.
+
+    Returns the SummaryTree, or None when no chat model is available.
+    """
+    from prompt import MERGE_SUMMARY_QUERY, SECTION_SUMMARY_QUERY
+
+    if llm is None:
+        from llm import get_chat_model
+        llm = get_chat_model()
+    if llm is None:
+        return None
+    section_tokens = section_tokens or config.SUMMARY_SECTION_TOKENS
+    fanout = max(2, fanout or config.SUMMARY_FANOUT)
+    path = summary_path(persist_directory, video_id) if persist_directory else None
+
+    previous = SummaryTree.load(path) if path and os.path.exists(path) else None
+    old_cache = previous.cache if previous else {}
+    cache = {}
+    model = _model_name(llm)
+
+    def _key(query, context):
+        return hashlib.sha256(f"{model}\0{config.SUMMARY_MAX_WORDS}\0{query}\0{context}".encode("utf-8")).hexdigest()
+
+    with metrics.span("summarize", video_id=video_id) as span:
+        nodes = [dict(section, level=0, children=[]) for section in split_sections(chunks, section_tokens)]
+        if not nodes:
+            return None
+        # every level: the inputs of each node, then summarize those not cached yet
+        jobs = [(node, SECTION_SUMMARY_QUERY, node.pop("text")) for node in nodes]
+        # leaves plus about 1/(fanout-1) as many parents
+        total = len(nodes) + max(0, (len(nodes) - 1) // (fanout - 1))
+        done = 0
+        pool = ThreadPoolExecutor(max_workers=max(1, max_workers or config.SUMMARY_MAX_WORKERS))
+        try:
+            while True:
+                futures = {}
+                for node, query, context in jobs:
+                    key = _key(query, context)
+                    if key in old_cache or key in cache:
+                        node["summary"] = cache[key] = cache.get(key, old_cache.get(key))
+                        span.count("cached_summaries")
+                        done += 1
+                    else:
+                        futures[pool.submit(_summarize, llm, context, query)] = (node, key)
+                span.progress(done, total)
+                for future in as_completed(futures):
+                    node, key = futures[future]
+                    node["summary"] = cache[key] = future.result()
+                    span.count("summaries")
+                    done += 1
+                    span.progress(done, total)
+                if len(nodes) == 1:
+                    break
+                parents = []
+                for i in range(0, len(nodes), fanout):
+                    children = nodes[i:i + fanout]
+                    starts = [c["start"] for c in children if c["start"] is not None]
+                    ends = [c["end"] for c in children if c["end"] is not None]
+                    parents.append({"start": min(starts) if starts else None, "end": max(ends) if ends else None,
+                                    "level": children[0]["level"] + 1, "children": children})
+                jobs = [(parent, MERGE_SUMMARY_QUERY,
+                         "\n".join(_label(c) + c["summary"] for c in parent["children"])) for parent in parents]
+                nodes = parents
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        span.count("levels", nodes[0]["level"] + 1)
+
+    tree = SummaryTree(video_id, nodes[0], indexed=indexed, cache=cache)
+    if path:
+        tree.save(path)
+    with _trees_lock:
+        _trees[path] = tree
+    return tree
+
+
+_trees = {}  # summary path -> SummaryTree
+_trees_lock = threading.Lock()
+_build_locks = {}
+
+
+def _video_chunks(collection, video_id):
+    """All chunks of `video_id` in a collection, in transcript order."""
+    found = collection.get(where={"video_id": video_id}, include=["documents", "metadatas"])
+    rows = [(text, meta or {}) for text, meta in zip(found["documents"], found["metadatas"] or [])]
+    return sorted(rows, key=lambda row: (row[1].get("start") or 0, row[1].get("chunk_index") or 0))
+
+
+def get_summary_tree(vector_store, video_id, llm=None, build=True):
+    """
+    The summary tree of `video_id` in `vector_store`: loaded from disk (once per
+    process), or built from the collection's chunks when it is missing or the
+    video was re-indexed since (only if `build`). None if unavailable.
+    """
+    persist_directory = getattr(vector_store, "persist_directory", None)
+    if persist_directory is None:
+        return None
+    path = summary_path(persist_directory, video_id)
+    indexed = vector_store.indexed_config(video_id)
+    with _trees_lock:
+        tree = _trees.get(path)
+        if tree is None and os.path.exists(path):
+            tree = _trees[path] = SummaryTree.load(path)
+        build_lock = _build_locks.setdefault(path, threading.Lock())
+    if tree is not None and tree.indexed == indexed:
+        return tree
+    if not build:
+        return tree
+    with build_lock:
+        # another thread may have built it meanwhile
+        current = _trees.get(path)
+        if current is not None and current.indexed == indexed:
+            return current
+        return build_summary_tree(_video_chunks(vector_store.collection, video_id), video_id, llm=llm,
+                                  persist_directory=persist_directory, indexed=indexed) or tree
+
+
+def summary_context(trees, token_budget=1000, separator="\n\n"):
+    """
+    Context for a broad question: each tree's root summary, then the next
+    levels down (labelled with their time ranges) while they fit in `token_budget`.
+
+    Returns (context, sources) with sources shaped like pack_context's
+    (metadata plus "text"), so they can be cited.
+    """
+    parts, sources, used = [], [], 0
+    separator_tokens = count_tokens(separator)
+    levels = [tree.levels() for tree in trees]
+    for depth in range(max((len(tree_levels) for tree_levels in levels), default=0)):
+        level_parts, level_sources, level_tokens = [], [], 0
+        for tree, tree_levels in zip(trees, levels):
+            for node in tree_levels[depth] if depth < len(tree_levels) else []:
+                text = (_label(node) if depth else "") + node["summary"]
+                level_parts.append(text)
+                level_sources.append({"video_id": tree.video_id, "start": node.get("start"),
+                                      "end": node.get("end"), "text": node["summary"]})
+                level_tokens += count_tokens(text) + separator_tokens
+        # a level is used whole or not at all: half the sections would skew the overview
+        if parts and used + level_tokens > token_budget:
+            break
+        parts.extend(level_parts)
+        sources.extend(level_sources)
+        used += level_tokens
+    return separator.join(parts), sources
@@ -1,25 +1,40 @@
 from datetime import datetime
+import hashlib
+import logging
 import os
-from langchain_community.vectorstores import Chroma
+import threading
 # from dotenv import load_dotenv
-import chromadb
-import uuid
 import warnings
 
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class VectorStore:
     def __init__(self, persist_directory="./chroma_db"):
         # ensure persist dir exists for chroma client if needed
         os.makedirs(persist_directory, exist_ok=True)
-        self.client = chromadb.Client(chromadb.config.Settings(persist_directory=persist_directory))
+        self.persist_directory = persist_directory
+        self.client = get_client(persist_directory)
         self.collection = None
+        self.lexical_index = None
+        self.embedding_function = None
+        # one store is shared by concurrent indexing jobs: serializes metadata and lexical index updates
+        self._write_lock = threading.RLock()
 
     def create_collection(self, name, embedding_function=None, description=""):
+        self.embedding_function = embedding_function
+        self._open_collection(name, embedding_function=embedding_function, description=description)
+        self._attach_lexical_index(name)
+
+    def _open_collection(self, name, embedding_function=None, description=""):
+        # reopened collections must keep our embedding function, not Chroma's default
+        get_kwargs = {"embedding_function": embedding_function} if embedding_function is not None else {}
         # Try to reuse an existing collection if present to avoid duplicates
         try:
             # preferred: get_collection if available in this chromadb version
-            existing = self.client.get_collection(name)
+            existing = self.client.get_collection(name, **get_kwargs)
             self.collection = existing
             warnings.warn(f"Reusing existing collection '{name}'.")
             return
@@ -31,7 +46,7 @@ class VectorStore:
                     if c.get("name") == name:
                         # attempt to retrieve the collection object
                         try:
-                            self.collection = self.client.get_collection(name)
+                            self.collection = self.client.get_collection(name, **get_kwargs)
                         except Exception:
                             # some client implementations return the collection info only;
                             # create_collection will return the actual collection object if needed
@@ -54,59 +69,410 @@ class VectorStore:
             kwargs["embedding_function"] = embedding_function
         self.collection = self.client.create_collection(**kwargs)
 
-    def add_documents(self, documents):
+    def _attach_lexical_index(self, name):
+        """Load the collection's BM25 index, backfilling it if the collection predates it."""
+        from lexical import InvertedIndex
+
+        self.lexical_index = InvertedIndex.load(self._lexical_path(name))
+        if self.collection is not None and len(self.lexical_index) < self.collection.count():
+            existing = self.collection.get(include=["documents"])
+            for doc_id, text in zip(existing["ids"], existing["documents"]):
+                self.lexical_index.add(doc_id, text)
+            self.lexical_index.save()
+
+    def _lexical_path(self, name):
+        return os.path.join(self.persist_directory, "lexical", f"{name}.json")
+
+    def delete_collection(self, name):
+        """Drop a collection and its BM25 index."""
+        if self.collection is not None and self.collection.name == name:
+            self.collection = None
+            self.lexical_index = None
+        self.client.delete_collection(name)
+        from lexical import remove_index
+        remove_index(self._lexical_path(name))
+
+    def list_collections(self):
+        """Names of the collections in this store."""
+        names = []
+        for c in self.client.list_collections():
+            # chromadb returns Collection objects (older versions: names or dicts)
+            names.append(c if isinstance(c, str) else c.get("name") if isinstance(c, dict) else c.name)
+        return names
+
+    def indexed_config(self, video_id):
+        """
+        Return the splitter config `video_id` was indexed with, or None.
+        Reads the collection metadata as stored now (another process may have
+        indexed the video since the collection was opened), so it costs O(1).
+        """
+        if self.collection is None or not video_id:
+            return None
+        return self._stored_metadata().get(f"indexed:{video_id}")
+
+    def indexed_videos(self):
+        """Ids of the videos marked indexed in this collection (see mark_indexed)."""
+        if self.collection is None:
+            return []
+        return [key.split(":", 1)[1] for key in self._stored_metadata() if key.startswith("indexed:")]
+
+    def is_indexed(self, video_id, splitter_config=None):
+        """True if `video_id` is fully indexed (with `splitter_config`, when given)."""
+        config = self.indexed_config(video_id)
+        if config is None:
+            return False
+        return splitter_config is None or config == splitter_config
+
+    def mark_indexed(self, video_id, splitter_config):
+        """Record in the collection metadata that `video_id` is indexed with `splitter_config`."""
+        with self._write_lock:
+            metadata = self._stored_metadata()
+            metadata[f"indexed:{video_id}"] = str(splitter_config)
+            self.collection.modify(metadata=metadata)
+
+    def _stored_metadata(self):
+        """The collection metadata as stored now: other processes (e.g. live.py) may have changed it since."""
+        kwargs = {"embedding_function": self.embedding_function} if self.embedding_function is not None else {}
+        try:
+            return dict(self.client.get_collection(self.collection.name, **kwargs).metadata or {})
+        except Exception:
+            return dict(self.collection.metadata or {})
+
+    def record_write(self):
+        """
+        Bump the collection's write counter (see data_version). Called by every
+        method that changes chunks; call it after writing to .collection directly.
+        """
+        with self._write_lock:
+            metadata = self._stored_metadata()
+            # collections written before the counter existed start from their chunk count,
+            # the version they were cached under until then
+            metadata[WRITES_KEY] = metadata.get(WRITES_KEY, self.collection.count()) + 1
+            self.collection.modify(metadata=metadata)
+
+    def data_version(self):
+        """
+        Version of the collection's contents for the answer cache: changes on
+        every add, replace and delete. A chunk count would not (a live
+        transcript's growing last chunk is replaced in place).
+        """
+        if self.collection is None:
+            return None
+        return self._stored_metadata().get(WRITES_KEY, self.collection.count())
+
+    @staticmethod
+    def chunk_id(video_id, text):
+        """Stable id for a chunk: same video and text always map to the same id."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+        return f"{video_id}:{digest}" if video_id else digest
+
+    def add_documents(self, documents, video_id=None, splitter_config=None):
+        """
+        Idempotently add chunks to the collection.
+
+        Ids are derived from (video_id, chunk hash), so re-adding the same chunks
+        is a no-op: only ids missing from the collection are embedded and upserted.
+        When `video_id` and `splitter_config` are given the video is marked as
+        indexed once all its chunks are written (see is_indexed); if it was
+        indexed with another splitter config, its old chunks (which have other
+        ids) are deleted first, so the collection never holds both chunkings.
+
+        Returns the number of chunks actually written.
+        """
         if self.collection is None:
             raise ValueError("Collection not created. Call create_collection first.")
         
         if len(documents) == 0:
-            return
+            return 0
+
+        with metrics.span("add_documents", collection=self.collection.name, video_id=video_id) as span:
+            if video_id and splitter_config and self.indexed_config(video_id) not in (None, str(splitter_config)):
+                span.count("chunks_deleted", self.delete_video(video_id))
+            written = self._add_documents(documents, video_id, span)
+            if written:
+                self.record_write()
+            if video_id and splitter_config:
+                self.mark_indexed(video_id, splitter_config)
+        return written
 
+    def _add_documents(self, documents, video_id, span, batch_size=256):
         # support objects with .page_content or plain strings
         if hasattr(documents[0], "page_content"):
             docs = [doc.page_content for doc in documents]
         else:
             docs = [str(d) for d in documents]
+        # chroma rejects None values and empty metadata dicts (a None row is fine); every chunk of a
+        # known video keeps at least its video_id, so where={"video_id": ...} finds it
+        metadatas = []
+        for doc in documents:
+            metadata = {k: v for k, v in (getattr(doc, "metadata", None) or {}).items() if v is not None}
+            if video_id:
+                metadata.setdefault("video_id", video_id)
+            metadatas.append(metadata or None)
+        if not any(metadatas):
+            metadatas = None
 
-        # compute stable start index using existing ids if available
-        try:
-            existing = self.collection.get(include=["ids"])
-            start_idx = len(existing.get("ids", []))
-        except Exception:
-            start_idx = 0
+        ids = []
+        for i, text in enumerate(docs):
+            doc_video_id = ((metadatas[i] or {}).get("video_id") if metadatas else None) or video_id
+            ids.append(self.chunk_id(doc_video_id, text))
 
-        ids = [str(start_idx + i) for i in range(len(docs))]
+        # only look up the ids of this batch, never the whole collection
+        existing = set(self.collection.get(ids=list(set(ids)), include=[]).get("ids", []))
+        new_rows, seen = [], set(existing)
+        for i, chunk_id in enumerate(ids):
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                new_rows.append(i)
+        span.count("chunks", len(docs))
+        span.count("chunks_written", len(new_rows))
 
-        self.collection.add(
-            documents=docs,
-            ids=ids
-        )
+        # upsert (and so embed) in slices, reporting progress after each one
+        span.progress(0, len(new_rows))
+        for start in range(0, len(new_rows), batch_size):
+            rows = new_rows[start:start + batch_size]
+            self.collection.upsert(
+                documents=[docs[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows] if metadatas else None,
+                ids=[ids[i] for i in rows]
+            )
+            span.progress(start + len(rows), len(new_rows))
 
-    def query(self, query_texts, n_results=4):
+        # the upserts above (and their embedding) may run in parallel; the lexical writes may not
+        if new_rows and self.lexical_index is not None:
+            with self._write_lock:
+                for i in new_rows:
+                    self.lexical_index.add(ids[i], docs[i])
+                self.lexical_index.save()
+        return len(new_rows)
+
+    def replace_document(self, doc_id, document):
+        """
+        Write one chunk under a caller-chosen id, replacing whatever was stored
+        there (add_documents never overwrites). Used for a live transcript's
+        last chunk, which keeps growing until it is full.
+        """
+        if self.collection is None:
+            raise ValueError("Collection not created. Call create_collection first.")
+        metadata = {k: v for k, v in (getattr(document, "metadata", None) or {}).items() if v is not None}
+        with self._write_lock:
+            self.collection.upsert(documents=[document.page_content], metadatas=[metadata] if metadata else None,
+                                   ids=[doc_id])
+            if self.lexical_index is not None:
+                self.lexical_index.remove(doc_id)
+                self.lexical_index.add(doc_id, document.page_content)
+                self.lexical_index.save()
+            self.record_write()
+
+    def delete_documents(self, ids):
+        """Remove chunks by id from the collection and the lexical index."""
+        if self.collection is None:
+            raise ValueError("Collection not created. Call create_collection first.")
+        with self._write_lock:
+            self.collection.delete(ids=list(ids))
+            if self.lexical_index is not None:
+                for doc_id in ids:
+                    self.lexical_index.remove(doc_id)
+                self.lexical_index.save()
+            self.record_write()
+
+    def delete_video(self, video_id):
+        """
+        Remove every chunk of `video_id` from the collection and the lexical
+        index, and its indexed marker. Returns the number of chunks removed.
+        """
+        if self.collection is None:
+            raise ValueError("Collection not created. Call create_collection first.")
+        with self._write_lock:
+            ids = set(self.collection.get(where={"video_id": video_id}, include=[])["ids"])
+            if self.lexical_index is not None:
+                # chunks stored without metadata are still found by their id prefix
+                prefix = f"{video_id}:"
+                ids.update(doc_id for doc_id in list(self.lexical_index.doc_len) if doc_id.startswith(prefix))
+            metadata = self._stored_metadata()
+            marked = metadata.pop(f"indexed:{video_id}", None) is not None
+            if not ids and not marked:
+                return 0
+            if ids:
+                self.collection.delete(ids=sorted(ids))
+                if self.lexical_index is not None:
+                    for doc_id in ids:
+                        self.lexical_index.remove(doc_id)
+                    self.lexical_index.save()
+            # drop the marker and bump the write counter (see record_write) in one update
+            metadata[WRITES_KEY] = metadata.get(WRITES_KEY, self.collection.count()) + 1
+            self.collection.modify(metadata=metadata)
+        return len(ids)
+
+    def query(self, query_texts, n_results=4, where=None):
+        """Vector search; `where` is a Chroma metadata filter, e.g. {"video_id": "abc"}."""
         if self.collection is None:
             raise ValueError("Collection not created. Call create_collection first.")
         
-        return self.collection.query(
-            query_texts=query_texts,
-            n_results=n_results
-        )
+        with metrics.span("query", collection=self.collection.name):
+            kwargs = {"where": where} if where else {}
+            return self.collection.query(
+                query_texts=query_texts,
+                n_results=n_results,
+                **kwargs
+            )
+
+    def hybrid_query(self, query_text, n_results=4, candidates=20, prefilter=False, where=None):
+        """
+        Retrieve with BM25 and vector search and fuse the rankings (reciprocal-rank fusion).
+
+        Args:
+            query_text (str): The question.
+            n_results (int): Number of fused results to return.
+            candidates (int): Depth of each ranking before fusion.
+            prefilter (bool): Restrict the vector query to the BM25 candidates
+                (cheaper on large collections, but can miss purely semantic matches).
+            where (dict): Chroma metadata filter applied to both rankings, e.g.
+                {"video_id": "abc"} or {"language": "en"}; None searches every video.
+
+        Returns a dict shaped like a Chroma query result ({"ids": [[...]], "documents": [[...]], ...}).
+        """
+        if self.collection is None:
+            raise ValueError("Collection not created. Call create_collection first.")
+        with metrics.span("query", collection=self.collection.name, hybrid=True, filtered=bool(where)) as span:
+            result = self._hybrid_query([query_text], n_results, candidates, prefilter, where)
+            span.count("results", len(result["ids"][0]))
+        return result
+
+    def hybrid_query_batch(self, query_texts, n_results=4, candidates=20, where=None):
+        """
+        hybrid_query for many questions at once: one vector query (so one batched
+        embedding call) for all of them, and one fetch for the fused results the
+        vector rankings did not return. `where` applies to every question.
+
+        Returns a Chroma-shaped dict with one row per question, in order.
+        """
+        if self.collection is None:
+            raise ValueError("Collection not created. Call create_collection first.")
+        with metrics.span("query", collection=self.collection.name, hybrid=True, batch=len(query_texts),
+                          filtered=bool(where)) as span:
+            result = self._hybrid_query(list(query_texts), n_results, candidates, False, where)
+            span.count("results", sum(len(ids) for ids in result["ids"]))
+        return result
+
+    def _hybrid_query(self, query_texts, n_results, candidates, prefilter, where=None):
+        from lexical import reciprocal_rank_fusion
+
+        # the BM25 index has no metadata: chunk ids start with their video id, which
+        # covers the usual per-video filter; for other filters over-fetch, then keep
+        # the hits that pass `where`
+        videos = video_ids_in(where)
+        prefixes = tuple(f"{video_id}:" for video_id in videos) if videos is not None else None
+        allow = (lambda doc_id: doc_id.startswith(prefixes)) if prefixes is not None else None
+        depth = candidates * 3 if where else candidates
+        if self.lexical_index is not None:
+            # chunks other processes (live.py, ingest.py) added since
+            self.lexical_index.refresh()
+        lexical_ids = [[doc_id for doc_id, _ in self.lexical_index.search(text, k=depth, allow=allow)]
+                       if self.lexical_index is not None else [] for text in query_texts]
+        if where and set(where) != {"video_id"} and any(lexical_ids):
+            allowed = set(self.collection.get(ids=list({i for ids in lexical_ids for i in ids}), where=where,
+                                              include=[])["ids"])
+            lexical_ids = [[i for i in ids if i in allowed][:candidates] for ids in lexical_ids]
+
+        query_kwargs = {"query_texts": query_texts, "include": ["documents", "metadatas"]}
+        if where:
+            query_kwargs["where"] = where
+        count = self.collection.count()
+        if prefilter and len(query_texts) == 1 and len(lexical_ids[0]) >= n_results:
+            query_kwargs["ids"] = lexical_ids[0]
+        vector = self._vector_query(n_results=max(1, min(candidates, count)), **query_kwargs) if count else None
+        vector_ids = vector["ids"] if vector else [[] for _ in query_texts]
+
+        rows = {}
+        if vector:
+            for ids, texts, metas in zip(vector["ids"], vector["documents"], vector["metadatas"]):
+                for doc_id, text, meta in zip(ids, texts, metas):
+                    rows[doc_id] = (text, meta)
+        fused = [reciprocal_rank_fusion([lexical, vec])[:n_results] for lexical, vec in zip(lexical_ids, vector_ids)]
+        # questions often share hits: fetch each missing chunk once
+        missing = list(dict.fromkeys(doc_id for ids in fused for doc_id in ids if doc_id not in rows))
+        if missing:
+            fetched = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, meta in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                rows[doc_id] = (text, meta)
+
+        fused = [[doc_id for doc_id in ids if doc_id in rows] for ids in fused]
+        return {
+            "ids": fused,
+            "documents": [[rows[doc_id][0] for doc_id in ids] for ids in fused],
+            "metadatas": [[rows[doc_id][1] for doc_id in ids] for ids in fused],
+        }
+
+    def _vector_query(self, query_texts, n_results, include, where=None, ids=None):
+        """
+        collection.query, except that a `where` filter matching at most
+        _EXACT_FILTER_ROWS chunks (one video, a few videos) is answered exactly
+        from their stored embeddings: Chroma's filtered HNSW search over a large
+        corpus costs several times more than fetching those rows and ranking
+        them directly.
+        """
+        kwargs = {"where": where} if where else {}
+        if ids is not None:
+            kwargs["ids"] = ids
+        if where and ids is None and self.embedding_function is not None:
+            import numpy as np
+
+            found = self.collection.get(where=where, include=["embeddings", "documents", "metadatas"],
+                                        limit=_EXACT_FILTER_ROWS + 1)
+            if len(found["ids"]) <= _EXACT_FILTER_ROWS:
+                result = {key: [] for key in ("ids", "documents", "metadatas", "distances")}
+                vectors = np.asarray(found["embeddings"] if found["ids"] else [[0.0]], dtype=np.float32)
+                for query in np.asarray(self.embedding_function(list(query_texts)), dtype=np.float32):
+                    # squared L2, the distance Chroma reports for its default space
+                    distances = ((vectors - query) ** 2).sum(axis=1)
+                    top = np.argsort(distances, kind="stable")[:min(n_results, len(found["ids"]))]
+                    result["ids"].append([found["ids"][i] for i in top])
+                    result["documents"].append([found["documents"][i] for i in top])
+                    result["metadatas"].append([found["metadatas"][i] for i in top])
+                    result["distances"].append([float(distances[i]) for i in top])
+                return result
+        return self.collection.query(query_texts=query_texts, n_results=n_results, include=include, **kwargs)
+
 
+_EXACT_FILTER_ROWS = 2000  # filtered vector queries over at most this many chunks are ranked exactly
+WRITES_KEY = "writes"  # collection metadata key of the write counter (VectorStore.data_version)
 
-# --- convenience helpers and module-level collection for chain.py to import ---
+# --- convenience helpers and lazily created, process-wide singletons ---
 
-vector_store = VectorStore()
-collection = None  # will be set after initialization
+_lock = threading.RLock()
+_clients = {}            # persist_directory -> chromadb client
+_embedding_functions = {}  # (backend, persist_directory) -> embedding function
+_stores = {}             # (persist_directory, collection_name, backend, vector backend) -> VectorStore
 
+vector_store = None  # the last store returned by init_vectorstore(), for chain.py
+collection = None    # and its collection
 
-def _get_openai_embedding_function():
+
+def get_client(persist_directory="./chroma_db"):
     """
-    Try to create a chromadb OpenAIEmbeddingFunction using OPENAI_API_KEY env var.
-    Returns embedding function instance or raises RuntimeError if unavailable.
+    Return the process-wide persistent Chroma client for `persist_directory`,
+    creating it on first use. chromadb is only imported here, so importing this
+    module is cheap.
     """
-    try:
-        from chromadb.utils import embedding_functions
-    except Exception as e:
-        raise RuntimeError("chromadb.utils.embedding_functions is required for OpenAI embeddings") from e
+    client = _clients.get(persist_directory)
+    if client is None:
+        with _lock:
+            client = _clients.get(persist_directory)
+            if client is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=persist_directory)
+                _clients[persist_directory] = client
+    return client
+
 
+def _get_openai_embedding_function(cache_path=None):
+    """
+    Create the OpenAI embedding function (OPENAI_API_KEY env var): an
+    embeddings.BatchEmbedder for batching, concurrency and caching, whose
+    requests go through the process-wide rate limiter (see ratelimit.py).
+    Returns embedding function instance or raises RuntimeError if unavailable.
+    """
     # safer lookup (avoid KeyError) and avoid printing the secret
     api_key = os.environ.get("OPENAI_API_KEY", "")
     if not api_key:
@@ -116,54 +482,178 @@ def _get_openai_embedding_function():
             "Then restart the Streamlit server."
         )
 
-    ef = embedding_functions.OpenAIEmbeddingFunction(api_key=api_key, model_name="text-embedding-3-small")
-    return ef
+    from embeddings import BatchEmbedder, _openai_embed_fn
+    import config
+
+    return BatchEmbedder(embed_fn=_openai_embed_fn(config.EMBEDDING_MODEL), model=config.EMBEDDING_MODEL,
+                         cache=cache_path or config.EMBEDDING_CACHE_PATH)
+
+
+def get_embedding_function(backend=None, persist_directory="./chroma_db"):
+    """
+    Build an embedding function by backend name: "openai" (cached, batched OpenAI
+    embeddings) or "local" (offline NumPy feature hashing). Defaults to
+    config.EMBEDDING_BACKEND. Built once per backend and persist directory.
+    """
+    import config
+
+    backend = (backend or config.EMBEDDING_BACKEND).lower()
+    key = (backend, persist_directory)
+    with _lock:
+        if key not in _embedding_functions:
+            if backend == "local":
+                from embeddings import HashingEmbeddingFunction
+                _embedding_functions[key] = HashingEmbeddingFunction()
+            elif backend == "openai":
+                _embedding_functions[key] = _get_openai_embedding_function(
+                    cache_path=os.path.join(persist_directory, "embedding_cache.sqlite"))
+            else:
+                raise ValueError(f"Unknown embedding backend '{backend}'. Use 'openai' or 'local'.")
+        return _embedding_functions[key]
+
+
+def default_embedding_function(persist_directory="./chroma_db"):
+    """
+    Build the configured embedding function. If OpenAI is unavailable (e.g. no
+    OPENAI_API_KEY), warn and fall back to the local hashing embedder so the
+    collection always has a usable embedder.
+    """
+    try:
+        return get_embedding_function(persist_directory=persist_directory)
+    except Exception as e:
+        from embeddings import HashingEmbeddingFunction
+        warnings.warn(f"Could not create OpenAI embedding function: {e}. Falling back to local hashing embeddings.")
+        return HashingEmbeddingFunction()
+
+
+def video_ids_in(where):
+    """
+    The set of video ids a `where` filter restricts results to
+    ({"video_id": x}, {"video_id": {"$in": [...]}}, also inside "$and"),
+    or None if it does not restrict videos.
+    """
+    if not where:
+        return None
+    if "$and" in where:
+        found = None
+        for clause in where["$and"]:
+            videos = video_ids_in(clause)
+            if videos is not None:
+                found = videos if found is None else found & videos
+        return found
+    condition = where.get("video_id")
+    if condition is None:
+        return None
+    if not isinstance(condition, dict):
+        return {condition}
+    if "$eq" in condition:
+        return {condition["$eq"]}
+    if "$in" in condition:
+        return set(condition["$in"])
+    return None
+
+
+def collection_name_for(video_id):
+    """
+    Collection holding `video_id`'s chunks: the shared corpus
+    (config.CORPUS_COLLECTION), or with config.PER_VIDEO_COLLECTIONS the
+    video's own collection (see legacy_collection_name).
+    """
+    import config
+
+    if config.PER_VIDEO_COLLECTIONS:
+        return legacy_collection_name(video_id)
+    return config.CORPUS_COLLECTION
+
+
+def legacy_collection_name(video_id):
+    """Per-video collection name; Chroma names must start with a letter or digit."""
+    name = f"{video_id}_collection"
+    return name if name[0].isalnum() else f"yt{name}"
+
+
+def legacy_video_id(name):
+    """The video id of the per-video collection `name` (inverse of legacy_collection_name)."""
+    video_id = name[:-len("_collection")] if name.endswith("_collection") else name
+    if video_id.startswith("yt") and video_id[2:3] and not video_id[2].isalnum():
+        return video_id[2:]
+    return video_id
+
+
+def create_vector_store(persist_directory="./chroma_db", backend=None):
+    """
+    A new, collection-less store for `backend`: "chroma" (VectorStore) or
+    "flat" (flatstore.FlatVectorStore), default config.VECTOR_BACKEND.
+    """
+    import config
+
+    backend = (backend or config.VECTOR_BACKEND).lower()
+    if backend == "chroma":
+        return VectorStore(persist_directory=persist_directory)
+    if backend == "flat":
+        from flatstore import FlatVectorStore
+        return FlatVectorStore(persist_directory=persist_directory, dtype=config.FLAT_DTYPE)
+    raise ValueError(f"Unknown vector backend '{backend}'. Use 'chroma' or 'flat'.")
 
 
 def init_vectorstore(persist_directory="./chroma_db", collection_name="yt_collection",
-                     description="YouTube transcripts", embedding_function=None):
+                     description="YouTube transcripts", embedding_function=None, backend=None):
     """
-    Initialize the module-level vectorstore and collection.
-    If embedding_function is None, this attempts to build an OpenAI embedding function
-    from the OPENAI_API_KEY env var. If that fails, it still creates the collection
-    without an embedding function (you can add embeddings later).
-    Returns the created collection.
+    Open (or create) a collection and make it the module-level default.
+    embedding_function may be an embedding function instance, a backend name
+    ("openai" or "local"), or None to use config.EMBEDDING_BACKEND (falling back
+    to the local embedder if OpenAI is unavailable). backend picks the index:
+    "chroma" or "flat" (NumPy, see flatstore.py), default config.VECTOR_BACKEND.
+
+    Stores opened by backend name (or None) are created once per process and
+    reused, so calling this on every Streamlit rerun is cheap.
+    Returns (collection, vector_store).
     """
-    global vector_store, collection
-    vector_store = VectorStore(persist_directory=persist_directory)
+    import config
 
-    if embedding_function is None:
-        try:
-            embedding_function = _get_openai_embedding_function()
-        except Exception as e:
-            warnings.warn(f"Could not create OpenAI embedding function: {e}. Creating collection without embedding function.")
-            embedding_function = None
+    global vector_store, collection
+    backend = (backend or config.VECTOR_BACKEND).lower()
+    cache_key = None
+    if embedding_function is None or isinstance(embedding_function, str):
+        cache_key = (persist_directory, collection_name, embedding_function, backend)
 
-    print(f"Collection Name: {collection_name}")
+    with _lock:
+        store = _stores.get(cache_key) if cache_key else None
+        if store is None:
+            store = create_vector_store(persist_directory, backend)
+            if embedding_function is None:
+                embedding_function = default_embedding_function(persist_directory)
+            elif isinstance(embedding_function, str):
+                embedding_function = get_embedding_function(embedding_function, persist_directory)
 
-    vector_store.create_collection(name=collection_name, embedding_function=embedding_function, description=description)
-    collection = vector_store.collection
+            logger.info("Collection Name: %s", collection_name)
+            store.create_collection(name=collection_name, embedding_function=embedding_function,
+                                    description=description)
+            if cache_key:
+                _stores[cache_key] = store
+        vector_store, collection = store, store.collection
     return collection, vector_store
 
-def add_documents_to_vector_store(vector_store, documents):
+
+def get_vector_store():
+    """Return the module-level default store, initialising the default collection on first use."""
+    if vector_store is None:
+        init_vectorstore()
+    return vector_store
+
+def add_documents_to_vector_store(vector_store, documents, video_id=None, splitter_config=None):
     """
     Add documents to the provided vector_store (VectorStore instance).
+    Returns the number of chunks that were not already present.
     """
-    vector_store.add_documents(documents)
-
-# Try to auto-initialize only if OPENAI_API_KEY is set; otherwise don't fail import.
-try:
-    if os.environ.get("OPENAI_API_KEY") is not None and collection is None:
-        init_vectorstore()
-except Exception:
-    collection = None
+    return vector_store.add_documents(documents, video_id=video_id, splitter_config=splitter_config)
 
 
 if __name__ == "__main__":
     # quick CLI check
     print("OPENAI_API_KEY set:", bool(os.environ.get("OPENAI_API_KEY")))
     try:
-        col = init_vectorstore()
+        col, _ = init_vectorstore()
         print("Collection created:", col.name if hasattr(col, "name") else repr(col))
     except Exception as e:
         print("Failed to init vectorstore:", e)
\ No newline at end of file